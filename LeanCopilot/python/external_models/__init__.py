@@ -4,3 +4,4 @@ from .vllm_runner import VLLMTacticGenerator
 from .claude_runner import ClaudeRunner
 from .gemini_runner import GeminiRunner
 from .unified_api_runner import UnifiedAPIRunner
+from .routed_api_runner import RoutedAPIRunner
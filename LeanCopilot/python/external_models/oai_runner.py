@@ -1,6 +1,8 @@
 import numpy as np
 from typing import List, Tuple
 import os
+import random
+import time
 import numpy as np
 import openai
 from openai import OpenAI
@@ -25,35 +27,42 @@ class OpenAIRunner(Generator, Transformer):
             # "stop": args.stop,  # stop is only used for base models currently
         }
         self.name = self.client_kwargs["model"]
+        self.max_retries = args.get("max_retries", 5)
 
     def generate(self, input: str, target_prefix: str = "") -> List[Tuple[str, float]]:
         prompt = pre_process_input(self.name, input + target_prefix)
         prompt = [
             {"role": "user", "content": f"{prompt}"},
         ]
-        try:
-            response = OpenAIRunner.client.chat.completions.create(
-                messages=prompt,
-                logprobs=True,
-                **self.client_kwargs,
-            )
-        except (
-            openai.APIError,
-            openai.RateLimitError,
-            openai.InternalServerError,
-            openai.OpenAIError,
-            openai.APIStatusError,
-            openai.APITimeoutError,
-            openai.InternalServerError,
-            openai.APIConnectionError,
-        ) as e:
-            print("Exception: ", repr(e))
-            print("Consider reducing the number of parallel processes.")
-            return OpenAIRunner.generate(self, input, target_prefix)
-        except Exception as e:
-            print(f"Failed to run the model for {prompt}!")
-            print("Exception: ", repr(e))
-            raise e
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = OpenAIRunner.client.chat.completions.create(
+                    messages=prompt,
+                    logprobs=True,
+                    **self.client_kwargs,
+                )
+                break
+            except (
+                openai.APIError,
+                openai.RateLimitError,
+                openai.InternalServerError,
+                openai.OpenAIError,
+                openai.APIStatusError,
+                openai.APITimeoutError,
+                openai.InternalServerError,
+                openai.APIConnectionError,
+            ) as e:
+                print("Exception: ", repr(e))
+                if attempt == self.max_retries or isinstance(e, openai.BadRequestError):
+                    raise e
+                # exponential backoff with full jitter, instead of retrying immediately
+                delay = random.uniform(0, min(60, 2**attempt))
+                print(f"Retrying in {delay:.1f}s (attempt {attempt + 1}/{self.max_retries}).")
+                time.sleep(delay)
+            except Exception as e:
+                print(f"Failed to run the model for {prompt}!")
+                print("Exception: ", repr(e))
+                raise e
 
         results = [
             (
@@ -0,0 +1,32 @@
+from typing import List, Optional, Tuple
+from .external_parser import Generator, Transformer, pre_process_input
+from .unified_api_runner import UnifiedAPIRunner, require_benchmarking
+
+
+class RoutedAPIRunner(Generator, Transformer):
+    """One logical model hosted by several providers, routed to the fastest healthy one
+
+    Keeps an EWMA of latency and error rate per backend and fails over to the next one
+    when a backend errors out. With spread on, samples are split by speed instead.
+    """
+
+    def __init__(self, backends: List[UnifiedAPIRunner], num_samples: Optional[int] = None, spread: bool = False):
+        require_benchmarking()
+        from benchmarking.routing import Router # shared with the benchmarking clients
+
+        self.backends = backends
+        self.model = backends[0].model # prompt/output formats are per model family, same for all backends
+        self.num_samples = num_samples if num_samples is not None else backends[0].num_samples
+        self.router = Router([f"{b.provider}:{b.model}" for b in backends], spread=spread)
+
+    async def generate_async(self, input: str, target_prefix: str = "") -> List[Tuple[str, float]]:
+        """Generate tactics from proof state."""
+        prompt = pre_process_input(self.model, input + target_prefix)
+        choices = await self.router.route(self.num_samples, lambda i, k: self.backends[i].sample_async(prompt, k))
+        return self.backends[0].suggestions(choices)
+
+    def generate(self, input: str, target_prefix: str = "") -> List[Tuple[str, float]]:
+        """Sync wrapper, runs on the shared HTTP client's event loop"""
+        from benchmarking.http_client import HTTPClient
+
+        return HTTPClient.shared().run(self.generate_async(input, target_prefix))
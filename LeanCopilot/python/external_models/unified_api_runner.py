@@ -1,38 +1,72 @@
+import asyncio
+import math
+import re
 import numpy as np
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
 import os
-import requests
-from openai import OpenAI
-from .external_parser import Generator, Transformer, pre_process_input, post_process_output, choices_dedup
+from .external_parser import Generator, Transformer, pre_process_input, post_process_output
+
+
+def require_benchmarking():
+    """The API runners share the pooled HTTP client, rate limiter, hedging and routing of the
+    repo's benchmarking package, imported only when one is built so the other runners don't need it"""
+    try:
+        import benchmarking.http_client  # noqa: F401
+    except ImportError as e:
+        raise ImportError(
+            "UnifiedAPIRunner/RoutedAPIRunner need the LeanAssist benchmarking package and httpx: "
+            "pip install httpx and start the server with the repository root on PYTHONPATH"
+        ) from e
+
+
+class MultiSampleRejected(Exception):
+    """400 on a request with n > 1, body in args[0]"""
+
+
+def rejects_n(body: str) -> bool:
+    """Whether a 400 response blames the n or logprobs parameters"""
+    return re.search(r"\bn\b|logprobs", body) is not None
 
 
 class UnifiedAPIRunner(Generator, Transformer):
     """Unified runner for both OpenRouter and Fireworks API"""
 
     def __init__(self, provider: str, model: str, temperature: float = 1.0, num_samples: int = 10, 
-                 reasoning_enabled: bool = False, timeout: int = 45):
+                 reasoning_enabled: bool = False, timeout: int = 45, max_rate: float = 10.0,
+                 hedge_percentile: Optional[float] = None, stream: bool = False, max_tokens: Optional[int] = None,
+                 base_url: Optional[str] = None):
         self.provider = provider.lower()
         self.model = model
         self.temperature = temperature
         self.num_samples = num_samples
         self.reasoning_enabled = reasoning_enabled
         self.timeout = timeout
-
-        # Provider-specific clients
+        self.stream = stream # read each response only until its tactic is complete
+        self.max_tokens = max_tokens # output tokens per sample (None = provider default)
+        self.supports_n = True # cleared once the provider/model rejects n > 1
+        require_benchmarking()
+        from benchmarking.hedging import Hedger
+        from benchmarking.rate_limiter import RateLimiter
+
+        # Provider-specific endpoints, both OpenAI-compatible
         if self.provider == "openrouter":
             self.api_key = os.getenv("OPENROUTER_API_KEY")
-            if not self.api_key:
+            if not self.api_key and base_url is None:
                 raise ValueError("missing OPENROUTER_API_KEY")
+            self.url = "https://openrouter.ai/api/v1/chat/completions"
         elif self.provider == "fireworks":
             self.api_key = os.getenv("FIREWORKS_API_KEY")
-            if not self.api_key:
+            if not self.api_key and base_url is None:
                 raise ValueError("missing FIREWORKS_API_KEY")
-            self.client = OpenAI(
-                api_key=self.api_key,
-                base_url="https://api.fireworks.ai/inference/v1/"
-            )
+            self.url = "https://api.fireworks.ai/inference/v1/chat/completions"
         else:
             raise ValueError(f"Unknown provider: {provider}")
+        if base_url is not None: # another OpenAI-compatible endpoint, e.g. benchmarking/local_llm_server.py
+            self.url = base_url.rstrip("/") + "/chat/completions"
+        # same limiter state as benchmarking runs against this provider/model on the host
+        self.rate_limiter = RateLimiter(f"{self.provider}:{model}", max_rate=max_rate)
+        # duplicate requests slower than this latency percentile, first answer wins
+        self.hedger = Hedger(hedge_percentile) if hedge_percentile is not None else None
 
     def extract_tactic(self, response: str) -> str:
         """Extract tactic (copied over benchmarking code)"""
@@ -52,68 +86,133 @@ class UnifiedAPIRunner(Generator, Transformer):
         # raw
         return text
 
-    def call_openrouter(self, messages: list) -> str:
-        url = "https://openrouter.ai/api/v1/chat/completions"
-        payload = {
-            "model": self.model,
-            "temperature": self.temperature,
-            # "max_tokens": self.max_tokens,
-            "reasoning":{
-                "enabled": self.reasoning_enabled
-            },
-            "messages": messages
-        }
+    def payload(self, messages: list, n: int) -> dict:
+        if self.provider == "openrouter":
+            payload = {
+                "model": self.model,
+                "temperature": self.temperature,
+                "reasoning":{
+                    "enabled": self.reasoning_enabled
+                },
+                "messages": messages
+            }
+            if self.max_tokens is not None:
+                payload["max_tokens"] = self.max_tokens
+        else:
+            payload = {
+                "model": self.model,
+                "temperature": self.temperature,
+                "reasoning_effort": self.reasoning_enabled, # toggle reasoning
+                "messages": messages
+            }
+            if self.max_tokens is not None:
+                payload["max_completion_tokens"] = self.max_tokens
+        if n > 1:
+            payload["n"] = n
+            payload["logprobs"] = True
+        return payload
+
+    async def call(self, messages: list, n: int = 1) -> List[Tuple[str, Optional[float]]]:
+        """(content, mean token logprob) per choice; asks for n choices in one request"""
+        from benchmarking.rate_limiter import limited_post
+        from benchmarking.streaming import streamed_post
+
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
-
-        raw = requests.post(url, json=payload, headers=headers, timeout=self.timeout)
+        if self.stream:
+            post = lambda: streamed_post(self.rate_limiter, self.url, json=self.payload(messages, n), headers=headers,
+                                         timeout=self.timeout, max_tokens=self.max_tokens)
+        else:
+            post = lambda: limited_post(self.rate_limiter, self.url, json=self.payload(messages, n), headers=headers,
+                                        timeout=self.timeout)
+        raw = await (self.hedger.run(n, post) if self.hedger is not None else post())
+        if n > 1 and raw.status_code == 400:
+            raise MultiSampleRejected(raw.text) # caller falls back to single requests
         response = raw.json()
 
         if 'choices' not in response:
             raise ValueError(f"Unexpected API response: {response}")
 
-        return response['choices'][0]['message']['content']
+        choices = []
+        for choice in response['choices']:
+            content = (choice.get('logprobs') or {}).get('content') or []
+            logprob = float(np.mean([t['logprob'] for t in content])) if content else None
+            choices.append((choice['message']['content'] or "", logprob))
+        return choices
 
-    def call_fireworks(self, messages: list) -> str:
-        response = self.client.chat.completions.create(
-            model=self.model, 
-            temperature=self.temperature,
-            # max_completion_tokens=self.max_tokens,
-            reasoning_effort=self.reasoning_enabled, # toggle reasoning
-            messages=messages
-        )
-        
-        return response.choices[0].message.content
+    async def call_each(self, messages: list, n: int) -> List[Tuple[str, Optional[float]]]:
+        """Fallback: n single-choice requests, concurrently"""
+        async def call_one():
+            try:
+                return await self.call(messages)
+            except Exception as e:
+                print(f"API call failed: {e}")
+                return []
+        results = await asyncio.gather(*(call_one() for _ in range(n)))
+        return [choice for choices in results for choice in choices]
 
-    def generate(self, input: str, target_prefix: str = "") -> List[Tuple[str, float]]:
-        """Generate tactics from proof state."""
-        prompt = pre_process_input(self.model, input + target_prefix)
+    async def sample_async(self, prompt: str, n: int) -> List[Tuple[str, Optional[float]]]:
+        """n (content, mean token logprob) choices for prompt, [] if the provider failed"""
         messages = [{"role": "user", "content": prompt}]
 
-        suggestions = []
-        for i in range(self.num_samples):
+        # One request for all samples if the model takes n, concurrent single requests otherwise
+        choices = []
+        if self.supports_n and n > 1:
             try:
-                # Call appropriate API
-                if self.provider == "openrouter":
-                    response = self.call_openrouter(messages)
-                elif self.provider == "fireworks":
-                    response = self.call_fireworks(messages)
-
-                tactic = self.extract_tactic(response)
-                processed_tactic = post_process_output(self.model, tactic)
-                if processed_tactic:
-                    # Score based on generation order
-                    score = float(self.num_samples - i)
-                    suggestions.append((processed_tactic, score))
-
+                choices = await self.call(messages, n)
+                if len(choices) < n: # n silently ignored
+                    self.supports_n = False
+                    choices += await self.call_each(messages, n - len(choices))
+            except MultiSampleRejected as e:
+                if not rejects_n(str(e)):
+                    # the 400 may be about something else, one plain request tells
+                    try:
+                        choices = await self.call(messages)
+                    except Exception as e:
+                        print(f"API call failed: {e}")
+                        return []
+                print(f"Multi-sample request rejected, falling back to single requests: {str(e)[:200]}")
+                self.supports_n = False
+                if choices:
+                    choices += await self.call_each(messages, n - len(choices))
             except Exception as e:
                 print(f"API call failed: {e}")
-                continue
+                return []
+        if not choices:
+            choices = await self.call_each(messages, n)
+        return choices
+
+    def suggestions(self, choices: List[Tuple[str, Optional[float]]]) -> List[Tuple[str, float]]:
+        """Deduplicated (tactic, score) pairs from raw choices, best first
+
+        Scored by log of sample frequency, like benchmarking, so choices with and without
+        logprobs (n=1 fallback requests) share one scale; mean token logprob breaks ties.
+        """
+        counts: Dict[str, int] = {}
+        best_logprob: Dict[str, float] = {}
+        for response, logprob in choices:
+            tactic = post_process_output(self.model, self.extract_tactic(response))
+            if tactic:
+                counts[tactic] = counts.get(tactic, 0) + 1
+                if logprob is not None and logprob > best_logprob.get(tactic, -math.inf):
+                    best_logprob[tactic] = logprob
+
+        total = sum(counts.values())
+        ranked = sorted(counts, key=lambda t: (counts[t], best_logprob.get(t, -math.inf)), reverse=True)
+        return [(tactic, math.log(counts[tactic] / total)) for tactic in ranked]
+
+    async def generate_async(self, input: str, target_prefix: str = "") -> List[Tuple[str, float]]:
+        """Generate tactics from proof state."""
+        prompt = pre_process_input(self.model, input + target_prefix)
+        return self.suggestions(await self.sample_async(prompt, self.num_samples))
+
+    def generate(self, input: str, target_prefix: str = "") -> List[Tuple[str, float]]:
+        """Sync wrapper, runs on the shared HTTP client's event loop"""
+        from benchmarking.http_client import HTTPClient
 
-        # Use choices_dedup to handle duplicates and sort by score
-        return choices_dedup(suggestions)
+        return HTTPClient.shared().run(self.generate_async(input, target_prefix))
 
 
 if __name__ == "__main__":
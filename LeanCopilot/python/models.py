@@ -83,6 +83,43 @@ class DecoderOnlyTransformer(Generator, Transformer):
 
         return outputs
 
+    def generate_batch(
+        self, inputs: List[str], target_prefix: str = ""
+    ) -> List[List[Tuple[str, float]]]:
+        """generate() for many inputs in one model.generate call (left-padded)"""
+        prompts = [input + target_prefix for input in inputs]
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        self.tokenizer.padding_side = "left"
+        tokenized_input = self.tokenizer(prompts, return_tensors="pt", padding=True)
+        output = self.model.generate(
+            tokenized_input.input_ids.to(self.device),
+            attention_mask=tokenized_input.attention_mask.to(self.device),
+            max_length=self.max_length,
+            num_beams=self.num_return_sequences,
+            length_penalty=self.length_penalty,
+            do_sample=False,
+            num_return_sequences=self.num_return_sequences,
+            early_stopping=False,
+            return_dict_in_generate=True,
+            output_scores=True,
+            pad_token_id=self.tokenizer.pad_token_id,
+        )
+        raw_outputs = self.tokenizer.batch_decode(
+            output.sequences, skip_special_tokens=True
+        )
+        scores = output.sequences_scores.exp().tolist()
+        k = self.num_return_sequences
+
+        outputs = []
+        for i, (input, prompt) in enumerate(zip(inputs, prompts)):
+            group = []
+            for out, score in zip(raw_outputs[i * k : (i + 1) * k], scores[i * k : (i + 1) * k]):
+                assert out.startswith(prompt)
+                group.append((out[len(input) :], score))
+            outputs.append(group)
+        return outputs
+
 
 class PythiaTacticGenerator(DecoderOnlyTransformer):
     def __init__(
@@ -103,6 +140,13 @@ class PythiaTacticGenerator(DecoderOnlyTransformer):
     def generate(self, input: str, target_prefix: str = "") -> List[Tuple[str, float]]:
         return super().generate(f"[GOAL]{input}[PROOFSTEP]{target_prefix}")
 
+    def generate_batch(
+        self, inputs: List[str], target_prefix: str = ""
+    ) -> List[List[Tuple[str, float]]]:
+        return super().generate_batch(
+            [f"[GOAL]{input}[PROOFSTEP]{target_prefix}" for input in inputs]
+        )
+
 
 class EncoderDecoderTransformer(Generator, Transformer):
     def __init__(
@@ -145,6 +189,36 @@ class EncoderDecoderTransformer(Generator, Transformer):
         )
         return list(zip(raw_outputs, output.sequences_scores.exp().tolist()))
 
+    def generate_batch(
+        self, inputs: List[str], target_prefix: str = ""
+    ) -> List[List[Tuple[str, float]]]:
+        """generate() for many inputs in one model.generate call"""
+        assert (
+            target_prefix == ""
+        ), "target_prefix is not supported by encoder-decoder Transformer"
+        tokenized_input = self.tokenizer(inputs, return_tensors="pt", padding=True)
+        output = self.model.generate(
+            tokenized_input.input_ids.to(self.device),
+            attention_mask=tokenized_input.attention_mask.to(self.device),
+            max_length=self.max_length,
+            num_beams=self.num_return_sequences,
+            length_penalty=self.length_penalty,
+            do_sample=False,
+            num_return_sequences=self.num_return_sequences,
+            early_stopping=False,
+            return_dict_in_generate=True,
+            output_scores=True,
+        )
+        raw_outputs = self.tokenizer.batch_decode(
+            output.sequences, skip_special_tokens=True
+        )
+        scores = output.sequences_scores.exp().tolist()
+        k = self.num_return_sequences
+        return [
+            list(zip(raw_outputs[i * k : (i + 1) * k], scores[i * k : (i + 1) * k]))
+            for i in range(len(inputs))
+        ]
+
 
 class EncoderOnlyTransformer(Encoder, Transformer):
     def __init__(self, name: str, device: str = "cpu") -> None:
@@ -78,6 +78,22 @@ models = {
         num_samples=10,
         reasoning_enabled=False,
         timeout=60
+    ),
+    "R-deepseek-3.2": RoutedAPIRunner( # whichever host is faster right now
+        backends=[
+            UnifiedAPIRunner(
+                provider="fireworks",
+                model="accounts/fireworks/models/deepseek-v3p2",
+                num_samples=10,
+                timeout=60
+            ),
+            UnifiedAPIRunner(
+                provider="openrouter",
+                model="deepseek/deepseek-v3.2",
+                num_samples=10,
+                timeout=60
+            ),
+        ]
     )
 }
 
@@ -110,7 +126,10 @@ class EncoderResponse(BaseModel):
 async def generate(req: GeneratorRequest) -> GeneratorResponse:
     model = models[req.name]
     target_prefix = req.prefix if req.prefix is not None else ""
-    outputs = model.generate(req.input, target_prefix)
+    if hasattr(model, "generate_async"): # API runners: don't block the server's event loop
+        outputs = await model.generate_async(req.input, target_prefix)
+    else:
+        outputs = model.generate(req.input, target_prefix)
     return GeneratorResponse(
         outputs=[Generation(output=out[0], score=out[1]) for out in outputs]
     )
@@ -25,6 +25,7 @@ from .interaction.dojo import (
     ProofGivenUp,
     check_proof,
 )
+from .interaction.dojo_pool import DojoPool
 from .interaction.parse_goals import Declaration, Goal, parse_goals
 from .data_extraction.lean import get_latest_commit, LeanGitRepo, LeanFile, Theorem, Pos
 from .constants import __version__
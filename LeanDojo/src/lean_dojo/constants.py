@@ -70,6 +70,10 @@ TACTIC_MEMORY_LIMIT = os.getenv("TACTIC_MEMORY_LIMIT", "32g")
 
 assert re.fullmatch(r"\d+g", TACTIC_MEMORY_LIMIT)
 
+TRACED_FILE_CACHE_SIZE = int(os.getenv("TRACED_FILE_CACHE_SIZE", 2))
+"""Number of parsed :file:`*.ast.json` files each process keeps for later :class:`Dojo` objects on the same file.
+"""
+
 
 def check_git_version(min_version: Tuple[int, int, int]) -> None:
     """Check the version of Git installed on the system."""
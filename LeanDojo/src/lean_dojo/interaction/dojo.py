@@ -5,8 +5,10 @@ import time
 import psutil
 import pexpect
 import tempfile
+import threading
 from pathlib import Path
 from loguru import logger
+from collections import OrderedDict
 from dataclasses import dataclass, field
 from subprocess import CalledProcessError
 from typing import Union, Tuple, List, Dict, Any, Optional, TextIO
@@ -15,7 +17,7 @@ from .parse_goals import parse_goals, Goal
 from ..data_extraction.trace import get_traced_repo_path
 from ..utils import to_json_path, working_directory, execute
 from ..data_extraction.lean import Theorem, LeanGitRepo, Pos
-from ..constants import TACTIC_CPU_LIMIT, TACTIC_MEMORY_LIMIT
+from ..constants import TACTIC_CPU_LIMIT, TACTIC_MEMORY_LIMIT, TRACED_FILE_CACHE_SIZE
 from ..data_extraction.traced_data import TracedFile, get_code_without_comments
 
 
@@ -100,6 +102,32 @@ def _kill_descendants(proc: psutil.Process) -> None:
         pass
 
 
+_traced_files: "OrderedDict[Tuple[Path, Path], TracedFile]" = OrderedDict()
+_traced_files_lock = threading.Lock()
+
+
+def load_traced_file(
+    traced_repo_path: Path, file_path: Path, repo: LeanGitRepo
+) -> TracedFile:
+    """Parse the :file:`*.ast.json` file of ``file_path``, reusing the most recently parsed ones.
+
+    Dojo only reads the :class:`TracedFile`, so theorems from the same file can share it.
+    Up to ``TRACED_FILE_CACHE_SIZE`` files are kept per process.
+    """
+    json_path = to_json_path(traced_repo_path, file_path, repo)
+    key = (traced_repo_path, json_path)
+    with _traced_files_lock:
+        if key in _traced_files:
+            _traced_files.move_to_end(key)
+            return _traced_files[key]
+        traced_file = TracedFile.from_traced_file(traced_repo_path, json_path, repo)
+        if TRACED_FILE_CACHE_SIZE > 0:
+            _traced_files[key] = traced_file
+            while len(_traced_files) > TRACED_FILE_CACHE_SIZE:
+                _traced_files.popitem(last=False)
+        return traced_file
+
+
 _SORRY_WARNING_REGEX = re.compile(
     r"(?P<line>\d+)\:\d+\:\s+warning\:\s+declaration uses \'sorry\'"
 )
@@ -119,8 +147,7 @@ def check_proof(thm: Theorem, proof: str) -> bool:
         repl_path.exists()
     ), "Unable to find Lean4Repl.lean in the traced repo. The traced repo was likely produced by an outdated version of LeanDojo. See https://github.com/lean-dojo/LeanDojo/releases/tag/v2.0.0."
     try:
-        json_path = to_json_path(traced_repo_path, thm.file_path, thm.repo)
-        traced_file = TracedFile.from_traced_file(traced_repo_path, json_path, thm.repo)
+        traced_file = load_traced_file(traced_repo_path, thm.file_path, thm.repo)
     except FileNotFoundError:
         raise DojoInitError(
             f"Cannot find the *.ast.json file for {thm} in {traced_repo_path}."
@@ -240,6 +267,11 @@ class Dojo:
 
     def __enter__(self) -> Tuple["Dojo", State]:
         """Initialize Dojo."""
+        traced_file = self._launch()
+        return self, self._read_initial_state(traced_file)
+
+    def _launch(self) -> TracedFile:
+        """Write the modified file and start the REPL process on it, without waiting for it."""
         logger.debug(f"Initializing Dojo for {self.entry}")
 
         # Replace the human-written proof with a `repl` tactic.
@@ -258,16 +290,23 @@ class Dojo:
 
         self._modify_file(traced_file)
 
-        # Run the modified file.
-        with working_directory(traced_repo_path):
-            memory_limit = 1024 * int(TACTIC_MEMORY_LIMIT[:-1])
-            modified_path = Path(self.modified_file.name).relative_to(traced_repo_path)
-            cmd = f"lake env lean --threads={TACTIC_CPU_LIMIT} --memory={memory_limit} {modified_path}"
-            self.proc = pexpect.spawn(
-                cmd, timeout=self.timeout, maxread=1, encoding="utf-8", echo=False
-            )
+        # Run the modified file. The process gets its own cwd instead of chdir-ing this
+        # one, so Dojos can be launched from several threads (e.g. by DojoPool).
+        memory_limit = 1024 * int(TACTIC_MEMORY_LIMIT[:-1])
+        modified_path = Path(self.modified_file.name).relative_to(traced_repo_path)
+        cmd = f"lake env lean --threads={TACTIC_CPU_LIMIT} --memory={memory_limit} {modified_path}"
+        self.proc = pexpect.spawn(
+            cmd,
+            cwd=str(traced_repo_path),
+            timeout=self.timeout,
+            maxread=1,
+            encoding="utf-8",
+            echo=False,
+        )
+        return traced_file
 
-        # Get the initial tactic state.
+    def _read_initial_state(self, traced_file: TracedFile) -> State:
+        """Wait for the launched REPL to elaborate the file and report the initial state."""
         try:
             res = json.loads(self._read_next_line()[0])
         except Exception as ex:
@@ -295,11 +334,10 @@ class Dojo:
             init_state = CommandState(int(res["sid"]))
 
         self.start_time = time.monotonic()
-        return self, init_state
+        return init_state
 
     def _locate_traced_file(self, traced_repo_path: Path) -> TracedFile:
-        json_path = to_json_path(traced_repo_path, self.file_path, self.repo)
-        return TracedFile.from_traced_file(traced_repo_path, json_path, self.repo)
+        return load_traced_file(traced_repo_path, self.file_path, self.repo)
 
     def __exit__(self, exc_type: None, exc_val: None, exc_tb: None) -> None:
         """Exit Dojo.
@@ -0,0 +1,234 @@
+"""A pool of :class:`Dojo` processes for running tactics on one theorem in parallel."""
+
+import threading
+from loguru import logger
+from concurrent.futures import ThreadPoolExecutor
+from typing import Union, Tuple, List, Dict, Optional
+
+from .dojo import (
+    Dojo,
+    TacticState,
+    TacticResult,
+    ProofFinished,
+    DojoInitError,
+)
+from ..data_extraction.lean import Theorem
+
+TacticPath = Tuple[str, ...]
+"""A sequence of tactics from the initial state."""
+
+
+class DojoPool:
+    """Multiple REPL processes for the same theorem behind one state space.
+
+    Each Lean process runs single-threaded (see ``TACTIC_CPU_LIMIT``), so tactics on
+    the same state can be checked in parallel by spreading them across processes.
+    State ids are per process, so the pool hands out its own ids and remembers the
+    tactic path that produced each state. A process that has not seen a state
+    reaches it by replaying the path from the deepest state it already knows.
+    Every process holds its own copy of the environment, so memory scales with ``num_procs``.
+    """
+
+    entry: Theorem
+    num_procs: int
+    is_successful: Optional[bool] = None
+
+    def __init__(
+        self,
+        entry: Theorem,
+        num_procs: int = 2,
+        timeout: int = 600,
+        additional_imports: List[str] = [],
+        build_deps: bool = True,
+    ):
+        """Initialize DojoPool.
+
+        Args:
+            entry (Theorem): The theorem to interact with (only tactic mode is supported).
+            num_procs (int): The number of REPL processes to launch.
+            timeout (int): The maximum number of seconds for a single interaction (e.g., tactic).
+        """
+        assert isinstance(entry, Theorem), "DojoPool only supports theorems"
+        assert num_procs >= 1
+        self.entry = entry
+        self.num_procs = num_procs
+        self.timeout = timeout
+        self.additional_imports = additional_imports
+        self.build_deps = build_deps
+        self.dojos: List[Dojo] = []
+
+    def __enter__(self) -> Tuple["DojoPool", TacticState]:
+        """Launch all REPL processes."""
+        logger.debug(f"Initializing DojoPool of {self.num_procs} for {self.entry}")
+        self.dojos = [
+            Dojo(self.entry, self.timeout, self.additional_imports, self.build_deps)
+            for _ in range(self.num_procs)
+        ]
+
+        # Launch the processes one by one (the traced repo may still need tracing, which
+        # changes the cwd), then wait for them to elaborate the file prefix concurrently.
+        outcomes: List[Union[TacticState, BaseException]] = []
+        with ThreadPoolExecutor(max_workers=self.num_procs) as executor:
+            futures = []
+            for dojo in self.dojos:
+                try:
+                    traced_file = dojo._launch()
+                except BaseException as ex:
+                    futures.append(ex)
+                    continue
+                futures.append(executor.submit(dojo._read_initial_state, traced_file))
+            for future in futures:
+                try:
+                    outcomes.append(
+                        future if isinstance(future, BaseException) else future.result()
+                    )
+                except BaseException as ex:
+                    outcomes.append(ex)
+
+        errors = [ex for ex in outcomes if isinstance(ex, BaseException)]
+        if errors:
+            for dojo in self.dojos:
+                if hasattr(dojo, "proc"):
+                    dojo.__exit__(None, None, None)
+            raise errors[0]
+
+        init_states: List[TacticState] = outcomes  # type: ignore
+        if len({s.pp for s in init_states}) != 1:
+            self.__exit__(None, None, None)
+            raise DojoInitError("REPL processes disagree on the initial state.")
+
+        self.is_successful = False
+        self._lock = threading.Lock()
+        self._worker_locks = [threading.Lock() for _ in self.dojos]
+        self._next_worker = 0
+        # pool id -> tactic path, and tactic path -> pretty-printed state
+        self._paths: Dict[int, TacticPath] = {0: ()}
+        self._pps: Dict[TacticPath, str] = {(): init_states[0].pp}
+        # per process: tactic path -> process-local state id
+        self._sids: List[Dict[TacticPath, int]] = [{(): s.id} for s in init_states]
+        self._executor = ThreadPoolExecutor(max_workers=self.num_procs)
+
+        return self, TacticState(init_states[0].pp, 0)
+
+    def __exit__(self, exc_type: None, exc_val: None, exc_tb: None) -> None:
+        """Shut down all REPL processes."""
+        logger.debug("Cleaning up DojoPool.")
+        if hasattr(self, "_executor"):
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        for dojo in self.dojos:
+            if hasattr(dojo, "proc"):
+                dojo.__exit__(exc_type, exc_val, exc_tb)
+
+    def _register(self, path: TacticPath) -> int:
+        """Assign a pool id to a new tactic path."""
+        with self._lock:
+            pool_id = len(self._paths)
+            self._paths[pool_id] = path
+            return pool_id
+
+    def _reach(self, worker: int, path: TacticPath) -> int:
+        """Return the state id of `path` in process `worker`, replaying tactics if needed."""
+        sids = self._sids[worker]
+        if path in sids:
+            return sids[path]
+        known = max(i for i in range(len(path) + 1) if path[:i] in sids)
+        dojo = self.dojos[worker]
+        for i in range(known, len(path)):
+            prefix = path[:i]
+            state = TacticState(self._pps[prefix], sids[prefix])
+            res = dojo.run_tac(state, path[i])
+            if not isinstance(res, TacticState):
+                raise RuntimeError(
+                    f"Replaying {path[: i + 1]} did not reproduce a tactic state: {res}"
+                )
+            sids[path[: i + 1]] = res.id
+        return sids[path]
+
+    def _run_on(
+        self, worker: int, path: TacticPath, tactics: List[str]
+    ) -> List[Union[TacticResult, Exception]]:
+        """Run `tactics` on the state at `path` in process `worker`."""
+        results: List[Union[TacticResult, Exception]] = []
+        with self._worker_locks[worker]:
+            try:
+                sid = self._reach(worker, path)
+            except Exception as ex:
+                return [ex for _ in tactics]
+            state = TacticState(self._pps[path], sid)
+            for tactic in tactics:
+                try:
+                    res = self.dojos[worker].run_tac(state, tactic)
+                except Exception as ex:
+                    results.append(ex)
+                    continue
+
+                child = path + (tactic,)
+                if isinstance(res, TacticState):
+                    self._sids[worker][child] = res.id
+                    self._pps.setdefault(child, res.pp)
+                    res = TacticState(res.pp, self._register(child), res.message)
+                elif isinstance(res, ProofFinished):
+                    self.is_successful = True
+                    res = ProofFinished(self._register(child), res.message)
+                results.append(res)
+        return results
+
+    def _path_of(self, state: TacticState) -> TacticPath:
+        if not isinstance(state, TacticState) or state.id not in self._paths:
+            raise RuntimeError(
+                f"Attempting to run a tactic on an invalid state {state}."
+            )
+        return self._paths[state.id]
+
+    def run_tac(self, state: TacticState, tactic: str) -> TacticResult:
+        """Run a single tactic on whichever process already holds `state`, if any."""
+        assert isinstance(tactic, str), f"Invalid tactic {tactic}"
+        path = self._path_of(state)
+        holders = [w for w in range(self.num_procs) if path in self._sids[w]]
+        if holders:
+            worker = holders[0]
+        else:
+            with self._lock:
+                worker = self._next_worker
+                self._next_worker = (self._next_worker + 1) % self.num_procs
+        res = self._run_on(worker, path, [tactic])[0]
+        if isinstance(res, Exception):
+            raise res
+        return res
+
+    def run_tacs(
+        self, state: TacticState, tactics: List[str], return_exceptions: bool = False
+    ) -> List[Union[TacticResult, Exception]]:
+        """Run several tactics on the same state, spread across all processes.
+
+        Args:
+            state (TacticState): A state returned by this pool.
+            tactics (List[str]): The tactics to try, each on `state` independently.
+            return_exceptions (bool): Return a failed tactic's exception in its slot
+                instead of raising the first one.
+
+        Returns:
+            List[Union[TacticResult, Exception]]: One result per tactic, in order.
+        """
+        for tactic in tactics:
+            assert isinstance(tactic, str), f"Invalid tactic {tactic}"
+        path = self._path_of(state)
+
+        # Tactic i goes to process i mod n, so the whole batch takes about as long
+        # as the slowest process's share (plus any replay it needs).
+        futures = {
+            worker: self._executor.submit(
+                self._run_on, worker, path, tactics[worker :: self.num_procs]
+            )
+            for worker in range(min(self.num_procs, len(tactics)))
+        }
+        shares = {worker: future.result() for worker, future in futures.items()}
+        results = [
+            shares[i % self.num_procs][i // self.num_procs] for i in range(len(tactics))
+        ]
+
+        if not return_exceptions:
+            for res in results:
+                if isinstance(res, Exception):
+                    raise res
+        return results
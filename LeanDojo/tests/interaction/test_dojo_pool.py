@@ -0,0 +1,46 @@
+import os
+
+from lean_dojo import *
+
+
+def test_pool_hello_world(lean4_example_repo: LeanGitRepo) -> None:
+    thm = Theorem(
+        lean4_example_repo,
+        "Lean4Example.lean",
+        "hello_world",
+    )
+    with DojoPool(thm, num_procs=2) as (pool, s0):
+        assert s0.pp == "a b c : Nat\n⊢ a + b + c = a + c + b"
+        s1, s2 = pool.run_tacs(s0, ["rw [add_assoc]", "sorry"])
+        assert s1.pp == "a b c : Nat\n⊢ a + (b + c) = a + c + b"
+        assert s2 == ProofGivenUp()
+        # s1 only exists in one process, the other has to replay its path
+        results = pool.run_tacs(s1, ["rw [add_comm b, ←add_assoc]", "simp"])
+        assert isinstance(results[0], ProofFinished)
+        assert pool.is_successful
+
+
+def test_pool_errors(lean4_example_repo: LeanGitRepo) -> None:
+    thm = Theorem(
+        lean4_example_repo,
+        "Lean4Example.lean",
+        "hello_world",
+    )
+    with DojoPool(thm, num_procs=3) as (pool, s0):
+        results = pool.run_tacs(s0, ["rw [add_assoc]", "exact foo", "rfl", "omega"])
+        assert len(results) == 4
+        assert isinstance(results[1], LeanError)
+        assert isinstance(pool.run_tac(s0, "exact foo"), LeanError)
+
+
+def test_pool_keeps_cwd(lean4_example_repo: LeanGitRepo) -> None:
+    thm = Theorem(
+        lean4_example_repo,
+        "Lean4Example.lean",
+        "hello_world",
+    )
+    cwd = os.getcwd()
+    with DojoPool(thm, num_procs=4) as (pool, s0):
+        assert os.getcwd() == cwd
+        assert all(dojo.proc.isalive() for dojo in pool.dojos)
+    assert os.getcwd() == cwd
@@ -0,0 +1,251 @@
+import heapq
+import itertools
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Set, Tuple, Union
+from lean_dojo import Dojo, DojoPool, Goal, Theorem, TacticState, ProofFinished
+
+from benchmarking.api_clients import APIClient
+from benchmarking.proof_search import ProofSearch, ProofSearchResult, SearchNode, SearchTree
+from benchmarking.scheduler import TheoremBudget
+from benchmarking.tactic_cache import TacticCache, cache_scope
+
+
+_MVAR_REGEX = re.compile(r"\?[^\s()\[\]{},:]+")
+
+Solution = Tuple[List[str], Optional[TacticState]] # tactics, state left behind (None if proof finished)
+
+
+def goal_key(goal: Goal) -> str:
+    """Exact text of a goal without its case tag (cached tactics refer to hypothesis names)"""
+    hyps = "\n".join(f"{decl.ident} : {decl.lean_type}" for decl in goal.assumptions)
+    return f"{hyps}\n⊢ {goal.conclusion}"
+
+
+def goal_texts(state: TacticState) -> List[str]:
+    """Pretty-printed goals of a state, one per goal"""
+    return [g for g in state.pp.split("\n\n") if "⊢" in g]
+
+
+def independent(goal_pps: List[str]) -> bool:
+    """Whether no metavariable is shared between goals, so they can be solved separately"""
+    seen: Set[str] = set()
+    for pp in goal_pps:
+        mvars = set(_MVAR_REGEX.findall(pp))
+        if mvars & seen:
+            return False
+        seen |= mvars
+    return True
+
+
+@dataclass
+class _AndOrContext:
+    """Per-theorem search bookkeeping"""
+    dojo: Union[Dojo, DojoPool]
+    scope: str # tactic cache scope
+    budget: TheoremBudget
+    executor: ThreadPoolExecutor
+    tree: SearchTree = field(default_factory=SearchTree) # each subproblem search adds its own root
+    num_expansions: int = 0
+    solved: Dict[str, List[str]] = field(default_factory=dict) # goal key -> tactics closing it
+    failed: Set[str] = field(default_factory=set) # goal keys whose subproblem budget ran out
+    cache_hits: int = 0
+
+    def out_of_time(self) -> bool:
+        """Out of time/tokens; having solved a subgoal counts as promising for a top-up"""
+        return self.budget.exceeded() is not None and not (bool(self.solved) and self.budget.extend())
+
+
+class AndOrProofSearch(ProofSearch):
+    """Proof search that splits independent goals into subproblems, each solved once and cached
+
+    A subproblem is "close the goals in front of `rest` without touching `rest`". When a
+    tactic leaves several goals that share no metavariables, each goal becomes its own
+    subproblem (AND), solved in order by the usual queue discipline (OR) with its own
+    expansion cap. Solved goals are cached by their text and replayed when the same goal
+    shows up again, e.g. under a different ordering of its siblings. Every subproof leaves
+    the remaining goals untouched, so the concatenated tactics are a valid linear proof.
+    """
+
+    def __init__(self, api_client: APIClient, strategy: str = "bfs",
+                 priority_fn: Optional[Callable[[SearchNode], float]] = None, subgoal_expansions: int = 100,
+                 tactic_cache: Optional[TacticCache] = None, budget: Optional[TheoremBudget] = None):
+        super().__init__(api_client, strategy=strategy, priority_fn=priority_fn, tactic_cache=tactic_cache,
+                         budget=budget)
+        self.subgoal_expansions = subgoal_expansions # expansion cap per split-off goal
+
+    def search(self, theorem: Theorem, dojo: Union[Dojo, DojoPool], initial_state: TacticState) -> ProofSearchResult:
+        """Do the search"""
+        start_time = time.time()
+        theorem_name = theorem.full_name
+        print(f"{theorem_name}: starting AND/OR search")
+
+        self._reset_stats()
+        budget = self._budget = self.budget if self.budget is not None else TheoremBudget(self.timeout)
+        budget.start(self._client.usage_totals)
+        executor = ThreadPoolExecutor(max_workers=1)
+        ctx = _AndOrContext(dojo=dojo, scope=cache_scope(theorem), budget=budget, executor=executor)
+        try:
+            with budget.watch(dojo):
+                solution = self._solve(ctx, initial_state, [], 0, self.max_expansions)
+        finally:
+            self._cancel.cancel()
+            executor.shutdown(wait=False, cancel_futures=True)
+            budget.release()
+            self.api_client.join(self._client)
+
+        if solution is not None and solution[1] is None:
+            print(f"{theorem_name}: PROVED ({ctx.cache_hits} cached subgoals)")
+            return self._make_result(theorem_name, start_time, ctx.num_expansions, budget, proof_steps=solution[0])
+
+        stop = budget.exceeded()
+        print(f"{theorem_name}: {f'proof search stopped ({stop})' if stop else 'search exhausted'}")
+        return self._make_result(theorem_name, start_time, ctx.num_expansions, budget, error=stop)
+
+    def _solve(self, ctx: _AndOrContext, state: TacticState, rest: List[str], depth: int,
+               budget: int) -> Optional[Solution]:
+        """Close the goals of state that sit in front of rest"""
+        keys = [goal_key(g) for g in state.goals]
+        own = keys[:len(keys) - len(rest)]
+        if not own:
+            return [], state
+
+        # AND: independent goals get solved one after another
+        if len(own) > 1 and independent(goal_texts(state)[:len(own)]):
+            return self._solve_each(ctx, state, own, rest, depth)
+        if len(own) > 1:
+            return self._search_or(ctx, state, rest, depth, budget)
+
+        # Single goal: reuse a previous proof of it if we have one
+        key = own[0]
+        if key in ctx.solved:
+            replayed = self._replay(ctx, state, ctx.solved[key], rest)
+            if replayed is not None:
+                ctx.cache_hits += 1
+                return replayed
+            del ctx.solved[key] # names or context differ, search again
+        if key in ctx.failed:
+            return None
+
+        solution = self._search_or(ctx, state, rest, depth, budget)
+        if solution is not None:
+            ctx.solved[key] = solution[0]
+        elif not ctx.out_of_time() and ctx.num_expansions < self.max_expansions:
+            ctx.failed.add(key)
+        return solution
+
+    def _solve_each(self, ctx: _AndOrContext, state: TacticState, own: List[str], rest: List[str],
+                    depth: int) -> Optional[Solution]:
+        """Solve independent goals in order; fails as soon as one of them does"""
+        steps: List[str] = []
+        for i in range(len(own)):
+            remaining = self.max_expansions - ctx.num_expansions
+            solution = self._solve(ctx, state, own[i+1:] + rest, depth, min(self.subgoal_expansions, remaining))
+            if solution is None:
+                return None
+            tactics, state = solution
+            steps += tactics
+            if state is None: # last goal closed the proof
+                break
+        return steps, state
+
+    def _replay(self, ctx: _AndOrContext, state: TacticState, tactics: List[str],
+                rest: List[str]) -> Optional[Solution]:
+        """Rerun cached tactics, checking they leave exactly rest"""
+        current: Optional[TacticState] = state
+        for tactic in tactics:
+            start = time.time()
+            try:
+                result = ctx.dojo.run_tac(current, tactic)
+            except Exception:
+                return None
+            finally:
+                self.lean_time += time.time() - start
+            if isinstance(result, ProofFinished):
+                current = None
+            elif isinstance(result, TacticState):
+                current = result
+            else:
+                return None
+        if current is None:
+            return (tactics, None) if not rest else None
+        if [goal_key(g) for g in current.goals] != rest:
+            return None
+        return tactics, current
+
+    def _search_or(self, ctx: _AndOrContext, state: TacticState, rest: List[str], depth: int,
+                   budget: int) -> Optional[Solution]:
+        """Queue-based search until the goals in front of rest are closed"""
+        queue: List[Tuple[float, int, SearchNode]] = []
+        counter = itertools.count()
+        visited: Set[str] = set()
+        expansions = 0
+        root = SearchNode(index=ctx.tree.add(-1, None), depth=depth, state=state)
+        heapq.heappush(queue, (self.priority_fn(root), next(counter), root))
+
+        while queue and expansions < budget and ctx.num_expansions < self.max_expansions:
+            if ctx.out_of_time():
+                return None
+
+            _, _, node = heapq.heappop(queue)
+            if node.pp in visited:
+                continue
+            visited.add(node.pp)
+            if node.depth >= self.max_depth:
+                continue
+
+            expansions += 1
+            ctx.num_expansions += 1
+
+            # Prompt with the goals being worked on only, so the model isn't distracted by rest
+            state = node.state
+            own_pps = goal_texts(state)[:state.num_goals - len(rest)]
+            try:
+                future = ctx.executor.submit(self._generate, "\n\n".join(own_pps))
+                suggestions = self._wait(future, ctx.budget, lambda: bool(ctx.solved))
+            except Exception as e:
+                print(f"generation failed: {e}")
+                continue
+            if suggestions is None:
+                return None
+
+            tactics = [suggestion for suggestion, _ in suggestions]
+            results = self._run_tactics(ctx.dojo, state, tactics, ctx.scope)
+            path = ctx.tree.path(node.index)
+            for (suggestion, score), result in zip(suggestions, results):
+                steps = path + [suggestion]
+                if isinstance(result, ProofFinished):
+                    if not rest:
+                        return steps, None
+                    continue
+                if not isinstance(result, TacticState):
+                    continue
+
+                keys = [goal_key(g) for g in result.goals]
+                num_own = len(keys) - len(rest)
+                if num_own == 0 and keys == rest:
+                    return steps, result
+                if num_own <= 0 or keys[num_own:] != rest: # tactic disturbed the other goals
+                    continue
+                if result.pp in visited:
+                    continue
+
+                if num_own > 1 and independent(goal_texts(result)[:num_own]):
+                    # AND node: each new goal becomes its own cached subproblem
+                    solution = self._solve_each(ctx, result, keys[:num_own], rest, node.depth + 1)
+                    if solution is not None:
+                        return steps + solution[0], solution[1]
+                    visited.add(result.pp)
+                    continue
+
+                child = SearchNode(
+                    index = ctx.tree.add(node.index, suggestion),
+                    depth = node.depth+1,
+                    state = result,
+                    score = node.score + score
+                )
+                heapq.heappush(queue, (self.priority_fn(child), next(counter), child))
+
+        return None
@@ -1,18 +1,194 @@
+import asyncio
+import copy
+import math
+import threading
+import time
 from abc import ABC, abstractmethod
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
 import re
-import requests
-from openai import OpenAI
+import httpx
+
+from benchmarking.hedging import Hedger
+from benchmarking.http_client import HTTPClient
+from benchmarking.instrumentation import CallRecord
+from benchmarking.rate_limiter import RateLimiter, limited_post
+from benchmarking.response_cache import ResponseCache
+from benchmarking.routing import Router
+from benchmarking.streaming import streamed_post
+
+
+Sample = Tuple[str, Optional[float]] # tactic, mean token logprob if the provider returned logprobs
+
+
+@dataclass
+class SamplingPolicy:
+    """When to stop drawing samples for a state, based on how many new tactics recent samples gave
+
+    Below num_samples, sampling stops once the unique yield of the last `window` samples
+    drops under min_yield (easy state, the model keeps repeating itself). At num_samples it
+    only continues while that yield is at least raise_yield (hard state, samples still
+    disagree), up to max_samples.
+    """
+    min_samples: int = 3
+    window: int = 3
+    min_yield: float = 0.34 # i.e. stop after `window` samples with at most one new tactic
+    raise_yield: float = 0.67
+    max_samples: Optional[int] = None # defaults to 2x num_samples
+
+    def keep_sampling(self, new: List[bool], num_samples: int) -> bool:
+        """new[i]: whether sample i was a tactic not seen before"""
+        drawn = len(new)
+        if drawn < self.min_samples:
+            return True
+        recent = new[-self.window:]
+        unique_yield = sum(recent) / len(recent)
+        if drawn < num_samples:
+            return unique_yield >= self.min_yield
+        max_samples = self.max_samples if self.max_samples is not None else 2 * num_samples
+        return drawn < max_samples and unique_yield >= self.raise_yield
+
+
+def rejects_n(body: str) -> bool:
+    """Whether a 400 response blames the n or logprobs parameters"""
+    return re.search(r"\bn\b|logprobs", body) is not None
 
 
 class APIClient(ABC):
     """Base class for LLM provider clients"""
 
+    _usage_lock = threading.Lock() # class-level so clients stay picklable
+    prompt_tokens = 0
+    completion_tokens = 0
+    provider = "" # with model and temperature, identifies samples in the response cache
+    model = ""
+    temperature = 1.0
+
+    def __init__(self, num_samples: int = 10, sampling: Optional[SamplingPolicy] = None,
+                 response_cache: Optional[ResponseCache] = None):
+        self.num_samples = num_samples # samples per state (a target if sampling is adaptive)
+        self.sampling = sampling # None = always num_samples
+        self.response_cache = response_cache # sampled tactics by prompt and sample index
+        self.supports_n = True # cleared once the provider/model rejects multi-sample requests
+        # (requests, samples, unique tactics) per generate_tactics
+        self.sample_log: List[Tuple[int, int, int]] = []
+        self.call_log: List[CallRecord] = [] # per API request
+
     @abstractmethod
-    def generate_tactics(self, state: str) -> List[str]:
-        """Generate tactics from proof state"""
+    def sample(self, prompt: str) -> Optional[str]:
+        """One sampled tactic for prompt, None if the call failed"""
         pass
 
+    def sample_many(self, prompt: str, n: int) -> Tuple[List[Sample], int]:
+        """n samples for prompt and the number of requests it took
+
+        Fans out n single-sample requests in parallel. Providers that accept `n` override
+        this with one request and fall back here if it gets rejected.
+        """
+        if n == 1:
+            tactics = [self.sample(prompt)]
+        else:
+            with ThreadPoolExecutor(max_workers=n) as executor:
+                tactics = list(executor.map(lambda _: self.sample(prompt), range(n)))
+        return [(tactic, None) for tactic in tactics if tactic], n
+
+    def generate_tactics(self, state: str) -> List[Tuple[str, float]]:
+        """Generate (tactic, score) pairs from proof state, best first"""
+        prompt = self.create_prompt(state)
+        suggestions: List[str] = []
+        logprobs: List[Optional[float]] = []
+        new: List[bool] = [] # per successful sample, whether it was unseen
+        requests_made = drawn = 0
+
+        # All samples in one go, or in small batches when sampling adaptively
+        batch = self.num_samples if self.sampling is None else min(self.sampling.min_samples, self.num_samples)
+        max_samples = self.num_samples
+        if self.sampling is not None:
+            max_samples = max(self.num_samples, self.sampling.max_samples or 2 * self.num_samples)
+        while batch > 0:
+            samples, made = self.draw(prompt, drawn, batch)
+            requests_made += made
+            drawn += batch
+            for tactic, logprob in samples:
+                new.append(tactic not in suggestions)
+                suggestions.append(tactic)
+                logprobs.append(logprob)
+            if self.sampling is None or not self.sampling.keep_sampling(new, self.num_samples):
+                break
+            batch = min(self.sampling.window, max_samples - drawn)
+
+        unique = self.deduplicate(suggestions, logprobs)
+        self.record_samples(requests_made, drawn, len(unique))
+        return unique
+
+    def draw(self, prompt: str, start: int, n: int) -> Tuple[List[Sample], int]:
+        """Samples start..start+n-1 for prompt, answered from the response cache where possible
+
+        Indices are slots, not requests: sample_many only returns the samples that came back,
+        so those fill the missing slots in order and each failure leaves one of the last slots
+        empty (None, not recorded) for a later run to fill. Samples of one prompt are
+        interchangeable draws, so this keeps a slot's response fixed once recorded, whatever
+        failed around it.
+        """
+        cache = self.response_cache
+        if cache is None:
+            return self.sample_many(prompt, n)
+        keys = [cache.key(self.provider, self.model, self.temperature, prompt, i) for i in range(start, start + n)]
+        cached = [None if cache.mode == "record" else cache.get(key) for key in keys]
+        misses = [key for key, hit in zip(keys, cached) if hit is None]
+        fresh: List[Optional[Sample]] = []
+        made = 0
+        if misses and cache.mode != "replay":
+            fresh, made = self.sample_many(prompt, len(misses))
+        fresh += [None] * (len(misses) - len(fresh)) # one entry per missing slot
+        for key, sample in zip(misses, fresh):
+            if sample is not None:
+                cache.put(key, sample)
+
+        # Same slot order as when they were first drawn, so replays dedupe/score identically
+        filled = iter(fresh)
+        slots = [hit if hit is not None else next(filled) for hit in cached]
+        return [sample for sample in slots if sample is not None], made
+
+    def record_samples(self, requests_made: int, samples: int, unique: int):
+        with self._usage_lock:
+            self.sample_log.append((requests_made, samples, unique))
+
+    def record_call(self, record: CallRecord):
+        with self._usage_lock:
+            self.call_log.append(record)
+
+    def record_usage(self, prompt_tokens: int, completion_tokens: int):
+        """Add one call's token counts to this client's running totals"""
+        with self._usage_lock:
+            self.prompt_tokens += prompt_tokens or 0
+            self.completion_tokens += completion_tokens or 0
+
+    def usage_totals(self) -> Tuple[int, int]:
+        """(prompt, completion) tokens used so far by this client"""
+        return self.prompt_tokens, self.completion_tokens
+
+    def hedge_stats(self) -> Tuple[int, int, int, float]:
+        """(requests, hedges, hedge wins, estimated seconds saved) so far"""
+        return 0, 0, 0, 0.0
+
+    def fork(self) -> "APIClient":
+        """Shallow copy sharing connections, limiters and caches, but with its own logs and token counts
+
+        Lets one client serve several searches at once (see llm_gateway, ProofSearch) with each one's usage
+        still counted separately.
+        """
+        view = object.__new__(type(self)) # not copy.copy, which would go through any pickling hooks
+        view.__dict__.update(self.__dict__)
+        view.sample_log, view.call_log = [], []
+        view.prompt_tokens = view.completion_tokens = 0
+        return view
+
+    def join(self, view: "APIClient"):
+        """Keep what a fork learned about the provider"""
+        self.supports_n = self.supports_n and view.supports_n
+
     def create_prompt(self, state: str) -> str:
         """Tactic suggestion prompt template"""
         return (
@@ -38,128 +214,285 @@ class APIClient(ABC):
         # raw
         return text
 
-    def deduplicate(self, suggestions: List[str]) -> List[str]:
-        """Keep list of only unique tactics"""
-        seen = set()
-        unique = []
-        for suggestion in suggestions:
-            if suggestion not in seen:
-                seen.add(suggestion)
-                unique.append(suggestion)
-        return unique
+    def deduplicate(self, suggestions: List[str],
+                    logprobs: Optional[List[Optional[float]]] = None) -> List[Tuple[str, float]]:
+        """Keep only unique tactics, scored by log of their sample frequency
 
+        Ties are broken by the best per-sample mean token logprob, when there are any.
+        """
+        counts = {}
+        best_logprob: Dict[str, float] = {}
+        for i, suggestion in enumerate(suggestions):
+            counts[suggestion] = counts.get(suggestion, 0) + 1
+            logprob = logprobs[i] if logprobs is not None else None
+            if logprob is not None and logprob > best_logprob.get(suggestion, -math.inf):
+                best_logprob[suggestion] = logprob
+        total = len(suggestions)
+        scored = [(tactic, math.log(count / total)) for tactic, count in counts.items()]
+        # stable sort keeps first-sampled order among remaining ties
+        return sorted(scored, key=lambda x: (x[1], best_logprob.get(x[0], -math.inf)), reverse=True)
 
-class OpenRouterClient(APIClient):
-    """OpenRouter client (for benchmarking only)"""
+    def mean_logprob(self, token_logprobs: Optional[List[float]]) -> Optional[float]:
+        """Length-normalized logprob of one choice"""
+        if not token_logprobs:
+            return None
+        return sum(token_logprobs) / len(token_logprobs)
+
+
+class ChatCompletionsClient(APIClient):
+    """OpenAI-compatible chat completions API, on the process-wide pooled HTTP client
+
+    Requests are async; sample() and sample_many() are sync wrappers for the search threads.
+    With stream on, each response is read only until its tactics are complete.
+    """
+
+    url: str
+    max_tokens_field = "max_tokens" # name of the output cap in the request body
 
-    def __init__(self, model: str, api_key: str, num_samples: int = 10):
+    def __init__(self, model: str, api_key: str, num_samples: int = 10, timeout: int = 60,
+                 sampling: Optional[SamplingPolicy] = None, response_cache: Optional[ResponseCache] = None,
+                 rate_limiter: Optional[RateLimiter] = None, max_retries: int = 4, hedger: Optional[Hedger] = None,
+                 hedge_client: Optional["ChatCompletionsClient"] = None, stream: bool = False,
+                 max_tokens: Optional[int] = None, base_url: Optional[str] = None):
+        super().__init__(num_samples, sampling, response_cache)
+        if base_url is not None: # another OpenAI-compatible endpoint, e.g. benchmarking/local_llm_server.py
+            self.url = base_url.rstrip("/") + "/chat/completions"
         self.model = model
         self.api_key = api_key
         self.temperature = 1.0
-        # self.max_tokens = 1024
-        self.num_samples = num_samples # choices per request
+        self.stream = stream # stop reading (and paying for) output once the tactic is complete
+        self.max_tokens = max_tokens # output tokens per sample (None = provider default)
+        self.timeout = timeout # seconds per HTTP request
+        # shared with other processes using this provider/model
+        self.rate_limiter = rate_limiter or RateLimiter(f"{self.provider}:{model}")
+        self.max_retries = max_retries # for 429/5xx/connection errors, with backoff
+        self.hedger = hedger # duplicate slow requests (None = off)
+        self.hedge_client = hedge_client # where duplicates go, e.g. the same model on another provider (None = here)
 
-    def generate_tactics(self, state: str) -> List[str]:
-        """Generate tactics based on current proof state"""
-        prompt = self.create_prompt(state)
+    def payload(self, messages: List[Dict[str, str]]) -> Dict:
+        """Provider-specific request body for one sample"""
+        return {"model": self.model, "temperature": self.temperature, "messages": messages}
+
+    async def arequest(self, prompt: str, n: int = 1) -> Tuple[httpx.Response, CallRecord]:
+        """POST a chat completion, asking for n choices (with logprobs) when n > 1, hedged if enabled
+
+        The call goes into call_log; parse() fills in its tokens.
+        """
+        record = CallRecord(self.provider, self.model)
+        start = time.monotonic()
+        try:
+            if self.hedger is None:
+                response = await self.post(prompt, n, record)
+            else:
+                hedge = (lambda: self.hedge_client.post(prompt, n, record)) if self.hedge_client is not None else None
+                response = await self.hedger.run(n, lambda: self.post(prompt, n, record), hedge)
+        except BaseException as e: # cancelled too, when the search ended first
+            record.error = type(e).__name__
+            raise
+        finally:
+            record.latency = time.monotonic() - start
+            self.record_call(record)
+        if response.status_code != 200:
+            record.error = f"HTTP {response.status_code}"
+        return response, record
+
+    async def post(self, prompt: str, n: int = 1, record: Optional[CallRecord] = None) -> httpx.Response:
+        """One chat completion request to this provider"""
         # print(prompt)
         messages = [
             # {"role": "system", "content": "Help the user with the next step of their proof in Lean 4. Never output anything other than Lean 4 code."},
             {"role": "user", "content": prompt}
         ]
-        suggestions = []
-
-        for sample in range(self.num_samples):
-            try:
-                url = "https://openrouter.ai/api/v1/chat/completions"
-                payload = {
-                    "model": self.model,
-                    "temperature": self.temperature,
-                    # "max_tokens": self.max_tokens,
-                    "reasoning":{
-                        "enabled": True
-                    },
-                    "messages": messages
-                }
-                headers = {
-                    "Authorization": f"Bearer {self.api_key}",
-                    "Content-Type": "application/json"
-                }
-
-                raw = requests.post(url, json=payload, headers=headers)
-                response = raw.json()
-
-                # Debug
-                if 'choices' not in response:
-                    print(f"Unexpected API response: {response}")
-
-                # print(response['choices'][0]['message']['content'])
-                tactic = self.extract_tactic(response['choices'][0]['message']['content'])
-                if tactic:
-                    suggestions.append(tactic)
-                    # print(tactic)
-
-                # print(f"Input tokens: response['usage']['prompt_tokens']")
-                # print(f"Output tokens: response['usage']['completion_tokens']")
-
-            except Exception as e:
-                print(f"API call failed: {e}")
-
-        to_return = self.deduplicate(suggestions)
-        # print(f"Generated {len(to_return)}/{self.num_samples} unique tactic suggestions")
-        return to_return
-
-
-class FireworksClient(APIClient):
+        payload = self.payload(messages)
+        if n > 1:
+            payload["n"] = n
+            payload["logprobs"] = True
+        if self.max_tokens is not None:
+            payload[self.max_tokens_field] = self.max_tokens
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        if self.stream:
+            response = await streamed_post(self.rate_limiter, self.url, json=payload, headers=headers,
+                                           timeout=self.timeout, max_retries=self.max_retries,
+                                           max_tokens=self.max_tokens, record=record)
+        else:
+            response = await limited_post(self.rate_limiter, self.url, json=payload, headers=headers,
+                                          timeout=self.timeout, max_retries=self.max_retries, record=record)
+        if record is not None:
+            record.provider = self.provider # a hedge may have answered from another provider
+            record.model = self.model
+        return response
+
+    def parse(self, response: dict, record: Optional[CallRecord] = None) -> List[Sample]:
+        """Tactics from a response's choices, recording its token usage (also on the call's record)"""
+        # Debug
+        if 'choices' not in response:
+            print(f"Unexpected API response: {response}")
+
+        usage = response.get('usage') or {}
+        self.record_usage(usage.get('prompt_tokens'), usage.get('completion_tokens'))
+        if record is not None:
+            record.prompt_tokens = usage.get('prompt_tokens') or 0
+            record.completion_tokens = usage.get('completion_tokens') or 0
+
+        samples = []
+        for choice in response['choices']:
+            # print(choice['message']['content'])
+            tactic = self.extract_tactic(choice['message']['content'] or "")
+            token_logprobs = [t['logprob'] for t in ((choice.get('logprobs') or {}).get('content') or [])]
+            if tactic:
+                samples.append((tactic, self.mean_logprob(token_logprobs)))
+        return samples
+
+    async def asample(self, prompt: str) -> Optional[str]:
+        """Sample one tactic"""
+        try:
+            raw, record = await self.arequest(prompt)
+            samples = self.parse(raw.json(), record)
+            return samples[0][0] if samples else None
+
+        except Exception as e:
+            print(f"API call failed: {e}")
+            return None
+
+    async def asample_many(self, prompt: str, n: int) -> Tuple[List[Sample], int]:
+        """All n samples in one request if the provider/model supports `n`, else n concurrent requests"""
+        if n == 1 or not self.supports_n:
+            return await self._fan_out(prompt, n), n
+        try:
+            raw, record = await self.arequest(prompt, n)
+            if raw.status_code == 400: # n or logprobs may not be accepted for this model
+                first = []
+                if not rejects_n(raw.text):
+                    # the 400 may be about something else, one plain request tells
+                    tactic = await self.asample(prompt)
+                    if tactic is None:
+                        return [], 2
+                    first = [(tactic, None)]
+                print(f"Multi-sample request rejected, falling back to {n} requests: {raw.text[:200]}")
+                self.supports_n = False
+                return first + await self._fan_out(prompt, n - len(first)), 1 + n
+            response = raw.json()
+            samples = self.parse(response, record)
+        except Exception as e:
+            print(f"API call failed: {e}")
+            return [], 1
+
+        missing = n - len(response['choices'])
+        if missing > 0: # n silently ignored, top up with single requests
+            self.supports_n = False
+            return samples + await self._fan_out(prompt, missing), 1 + missing
+        return samples, 1
+
+    async def _fan_out(self, prompt: str, n: int) -> List[Sample]:
+        tactics = await asyncio.gather(*(self.asample(prompt) for _ in range(n)))
+        return [(tactic, None) for tactic in tactics if tactic]
+
+    def hedge_stats(self) -> Tuple[int, int, int, float]:
+        return self.hedger.stats() if self.hedger is not None else super().hedge_stats()
+
+    def fork(self) -> "ChatCompletionsClient":
+        view = super().fork()
+        if self.hedger is not None: # same latency trackers, own counts
+            view.hedger = copy.copy(self.hedger)
+            view.hedger.requests = view.hedger.hedges = view.hedger.hedge_wins = 0
+            view.hedger.seconds_saved = 0.0
+        return view
+
+    def sample(self, prompt: str) -> Optional[str]:
+        return HTTPClient.shared().run(self.asample(prompt))
+
+    def sample_many(self, prompt: str, n: int) -> Tuple[List[Sample], int]:
+        return HTTPClient.shared().run(self.asample_many(prompt, n))
+
+
+class OpenRouterClient(ChatCompletionsClient):
+    """OpenRouter client (for benchmarking only)"""
+
+    provider = "openrouter"
+    url = "https://openrouter.ai/api/v1/chat/completions"
+
+    def payload(self, messages: List[Dict[str, str]]) -> Dict:
+        return {
+            "model": self.model,
+            "temperature": self.temperature,
+            "reasoning":{
+                "enabled": True
+            },
+            "messages": messages
+        }
+
+
+class FireworksClient(ChatCompletionsClient):
     """Fireworks client (benchmark custom or fine-tuned models)"""
 
-    def __init__(self, model: str, api_key: str, num_samples: int = 10):
-        self.model = model
-        self.api_key = api_key
-        self.temperature = 1.0
-        # self.max_tokens = 1024
-        self.num_samples = num_samples # choices per request
+    provider = "fireworks"
+    url = "https://api.fireworks.ai/inference/v1/chat/completions"
+    max_tokens_field = "max_completion_tokens"
 
-    def generate_tactics(self, state: str) -> List[str]:
-        """Generate tactics based on current proof state"""
-        prompt = self.create_prompt(state)
-        # print(prompt)
-        messages = [
-            # {"role": "system", "content": "Help the user with the next step of their proof in Lean 4. Never output anything other than Lean 4 code."},
-            {"role": "user", "content": prompt}
-        ]
-        suggestions = []
+    def payload(self, messages: List[Dict[str, str]]) -> Dict:
+        return {
+            "model": self.model,
+            "temperature": self.temperature,
+            "reasoning_effort": False, # toggle reasoning
+            "messages": messages
+        }
 
-        client = OpenAI(
-            api_key=self.api_key,
-            base_url="https://api.fireworks.ai/inference/v1/"
-        )
 
-        for sample in range(self.num_samples):
-            try:
-                response = client.chat.completions.create(
-                    model=self.model, 
-                    temperature=self.temperature,
-                    # max_completion_tokens=self.max_tokens,
-                    reasoning_effort=False, # toggle reasoning
-                    messages=messages
-                )
-
-                response = response.choices[0].message.content
-                # print(response)
-
-                # print(response['choices'][0]['message']['content'])
-                tactic = self.extract_tactic(response)
-                if tactic:
-                    suggestions.append(tactic)
-                    # print(tactic)
-
-                # print(f"Input tokens: response['usage']['prompt_tokens']")
-                # print(f"Output tokens: response['usage']['completion_tokens']")
-
-            except Exception as e:
-                print(f"API call failed: {e}")
-
-        to_return = self.deduplicate(suggestions)
-        # print(f"Generated {len(to_return)}/{self.num_samples} unique tactic suggestions")
-        return to_return
\ No newline at end of file
+class RoutedClient(APIClient):
+    """One logical model served by several providers, each request routed by live latency and errors
+
+    Backends keep their own rate limiters and usage; the call log is shared so searches see
+    every backend's calls.
+    """
+
+    provider = "routed"
+
+    def __init__(self, backends: List[ChatCompletionsClient], num_samples: int = 10, spread: bool = False,
+                 sampling: Optional[SamplingPolicy] = None, response_cache: Optional[ResponseCache] = None):
+        super().__init__(num_samples, sampling, response_cache)
+        self.backends = backends
+        self.model = backends[0].model # cache key; all backends serve the same model
+        self.temperature = backends[0].temperature
+        self.router = Router([f"{b.provider}:{b.model}" for b in backends], spread=spread)
+        for backend in backends:
+            backend.call_log = self.call_log
+
+    async def asample_many(self, prompt: str, n: int) -> Tuple[List[Sample], int]:
+        requests_made = 0
+
+        async def sample(i: int, k: int) -> List[Sample]:
+            nonlocal requests_made
+            samples, made = await self.backends[i].asample_many(prompt, k)
+            requests_made += made
+            return samples
+
+        return await self.router.route(n, sample), requests_made
+
+    def sample(self, prompt: str) -> Optional[str]:
+        samples, _ = self.sample_many(prompt, 1)
+        return samples[0][0] if samples else None
+
+    def sample_many(self, prompt: str, n: int) -> Tuple[List[Sample], int]:
+        return HTTPClient.shared().run(self.asample_many(prompt, n))
+
+    def usage_totals(self) -> Tuple[int, int]:
+        totals = [backend.usage_totals() for backend in self.backends]
+        return sum(p for p, _ in totals), sum(c for _, c in totals)
+
+    def hedge_stats(self) -> Tuple[int, int, int, float]:
+        stats = [backend.hedge_stats() for backend in self.backends]
+        return tuple(sum(column) for column in zip(*stats))
+
+    def fork(self) -> "RoutedClient":
+        view = super().fork() # same router, so every fork sees the live backend health
+        view.backends = [backend.fork() for backend in self.backends]
+        for backend in view.backends:
+            backend.call_log = view.call_log
+        return view
+
+    def join(self, view: "RoutedClient"):
+        for backend, forked in zip(self.backends, view.backends):
+            backend.join(forked)
@@ -1,12 +1,37 @@
+import functools
 import json
-from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
+import queue
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
 from dataclasses import dataclass, asdict
 from pathlib import Path
-from typing import List, Dict, Optional
-from lean_dojo import Dojo, Theorem, LeanGitRepo, DojoInitError, DojoCrashError
+from typing import List, Dict, Optional, Tuple, Union
+from lean_dojo import Dojo, DojoPool, Theorem, LeanGitRepo, DojoInitError, DojoCrashError
 
-from benchmarking.api_clients import OpenRouterClient, FireworksClient
+from benchmarking.api_clients import (ChatCompletionsClient, OpenRouterClient, FireworksClient, RoutedClient,
+                                      SamplingPolicy)
 from benchmarking.proof_search import ProofSearch, ProofSearchResult
+from benchmarking.and_or_search import AndOrProofSearch
+from benchmarking.hedging import Hedger
+from benchmarking.instrumentation import merge_counts, percentiles
+from benchmarking.llm_gateway import GatewayClient, start_gateway
+from benchmarking.local_models import LocalModelClient, load_generator
+from benchmarking.rate_limiter import RateLimiter
+from benchmarking.mcts_search import MCTSProofSearch
+from benchmarking.scheduler import BudgetPool, FileScheduler, MemoryGovernor, TheoremBudget, oom_killed
+from benchmarking.response_cache import ResponseCache
+from benchmarking.results import ResultLog, merge_results
+from benchmarking.tactic_cache import TacticCache
+from benchmarking.work_queue import WorkQueue
+
+
+@functools.lru_cache(maxsize=None)
+def lean_git_repo(url: str, commit: str) -> LeanGitRepo:
+    """One repo handle per (url, commit) per worker process"""
+    return LeanGitRepo(url, commit)
 
 
 @dataclass
@@ -14,10 +39,52 @@ class EvaluationConfig:
     provider: str # openrouter, fireworks
     api_key: str
     model: str
-    num_samples: int
+    num_samples: int # samples per state (the target when adaptive_sampling is on)
     dataset_path: str
     output_path: str
     num_workers: int = 4
+    group_by_file: bool = True # keep each worker on one source file while it can, stealing from others once idle
+    llm_gateway: bool = False # workers send LLM requests to one shared async process instead of each calling the API
+    llm_concurrency: int = 64 # LLM requests in flight across all workers, when llm_gateway is on
+    adaptive_sampling: bool = False # stop sampling early once samples repeat, draw more on hard states
+    max_requests_per_second: float = 10.0 # provider/model limit shared by all workers, adapts down on 429s
+    hedge_percentile: Optional[float] = None # e.g. 0.95: duplicate requests slower than this latency percentile
+    hedge_provider: Optional[str] = None # send duplicates to another provider (default: same one)
+    hedge_model: Optional[str] = None # model id on hedge_provider (default: model)
+    hedge_api_key: Optional[str] = None
+    stream: bool = False # stream responses and hang up once the tactic is complete
+    routes: Optional[List[Tuple[str, str, str]]] = None # other (provider, model id, api key) hosting the same model
+    route_split: bool = False # split samples across routes by speed instead of all to the fastest
+    base_url: Optional[str] = None # e.g. http://127.0.0.1:8000/v1 to run against benchmarking/local_llm_server.py
+    local_model: Optional[str] = None # in-process LeanCopilot generator instead of an API, e.g. a ByT5 tacgen
+    local_model_type: str = "encoder_decoder" # encoder_decoder, decoder_only, pythia
+    local_batch_size: int = 16 # states per generate call
+    local_device: str = "cpu" # cpu, cuda, auto
+    resume: bool = False # only run theorems without a result in output_path's results.jsonl yet
+    work_queue: Optional[str] = None # sqlite lease table on a shared filesystem; every node pointed at it shares the work
+    node_name: Optional[str] = None # this node's name in the work queue and results shard (default: hostname-pid)
+    lease_seconds: float = 120.0 # a node silent this long loses its theorems to the others
+    max_tokens: Optional[int] = None # output tokens per sample (None = provider default)
+    search_strategy: str = "bfs" # bfs, best_first, mcts
+    lookahead: int = 0 # frontier nodes to generate tactics for ahead of time (0 = off)
+    dojo_procs: int = 1 # REPL processes per theorem, >1 checks suggestions in parallel via DojoPool
+    memory_budget_gb: Optional[float] = None # RAM all REPLs may use together; theorems wait for room (None = no limit)
+    repl_memory_gb: float = 8.0 # first guess at one REPL's peak RSS, raised to the largest measured
+    max_oom_retries: int = 2 # OOM-killed theorems are requeued this often, with fewer running at once
+    prune_subsumed: bool = False # skip states whose goals include all goals of a failed state
+    and_or: bool = False # split independent goals into separately solved, cached subproblems
+    value_fn: str = "goal_count" # mcts state value estimate: goal_count, goal_length
+    mcts_batch_size: int = 4 # mcts leaves generated for concurrently per iteration
+    tactic_cache: Optional[str] = None # sqlite file of known tactic results shared across theorems/runs
+    response_cache: Optional[str] = None # sqlite file of sampled tactics by (provider, model, temperature, prompt, index)
+    response_cache_mode: str = "read_through" # read_through, record, replay (offline, no API calls)
+    timeout: float = 300 # hard wall clock seconds per theorem, Dojo setup excluded
+    max_tokens_per_theorem: Optional[int] = None
+    max_dollars_per_theorem: Optional[float] = None
+    max_tokens_per_run: Optional[int] = None # stops starting new theorems once spent
+    max_dollars_per_run: Optional[float] = None
+    prices: Tuple[float, float] = (0.0, 0.0) # $ per 1M (prompt, completion) tokens
+    redistribute_budget: bool = True # let promising searches use time/tokens left over by finished ones
 
 
 class Evaluator:
@@ -25,20 +92,64 @@ class Evaluator:
 
     def __init__(self, config: EvaluationConfig):
         self.config = config
+        self.budget_pool: Optional[BudgetPool] = None # set up in evaluate(), shared with workers
+        self.memory_governor: Optional[MemoryGovernor] = None # likewise
 
         # Set up API
-        if config.provider == "openrouter":
-            self.api_client = OpenRouterClient(config.model, config.api_key, config.num_samples)
-        elif config.provider == "fireworks":
-            self.api_client = FireworksClient(config.model, config.api_key, config.num_samples)
+        sampling = SamplingPolicy() if config.adaptive_sampling else None
+        response_cache = None
+        if config.response_cache:
+            response_cache = ResponseCache(config.response_cache, config.response_cache_mode)
+        hedger = Hedger(config.hedge_percentile) if config.hedge_percentile is not None else None
+        if config.local_model:
+            factory = functools.partial(load_generator, config.local_model, config.local_model_type,
+                                        config.num_samples, device=config.local_device)
+            self.api_client = LocalModelClient(factory, config.local_model, config.num_samples,
+                                               max_batch=config.local_batch_size)
+        elif config.routes:
+            # each provider hedges against itself, the router already picks between them
+            backends = [
+                self.make_client(provider, model, api_key,
+                                 hedger=Hedger(config.hedge_percentile) if hedger is not None else None)
+                for provider, model, api_key in [(config.provider, config.model, config.api_key)] + config.routes
+            ]
+            self.api_client = RoutedClient(backends, config.num_samples, spread=config.route_split,
+                                           sampling=sampling, response_cache=response_cache)
         else:
-            print("UNKNOWN API PROVIDER")
+            hedge_client = None
+            if hedger is not None and config.hedge_provider:
+                hedge_client = self.make_client(config.hedge_provider, config.hedge_model or config.model,
+                                                config.hedge_api_key)
+            self.api_client = self.make_client(config.provider, config.model, config.api_key, sampling=sampling,
+                                               response_cache=response_cache, hedger=hedger,
+                                               hedge_client=hedge_client)
         
         # Set up output stuff
         self.output_path = Path(config.output_path)
         self.output_path.mkdir(parents=True, exist_ok=True)
         self.results_file = self.output_path / "results.jsonl"
         self.summary_file = self.output_path / "summary.json"
+        self.work_queue: Optional[WorkQueue] = None
+        if config.work_queue:
+            # each node appends to its own shard (output_path shared), the summary merges them all
+            self.work_queue = WorkQueue(config.work_queue, config.node_name, config.lease_seconds)
+            self.results_file = self.output_path / f"results.{self.work_queue.node}.jsonl"
+        # a result is only marked done in the work queue once it is on disk
+        self.result_log = ResultLog(self.results_file, fsync_every=1 if self.work_queue is not None else 20)
+
+    def make_client(self, provider: str, model: str, api_key: str, **kwargs) -> Optional[ChatCompletionsClient]:
+        """API client for provider/model, rate limited per provider/model across workers"""
+        rate_limiter = RateLimiter(f"{provider}:{model}", max_rate=self.config.max_requests_per_second)
+        if provider == "openrouter":
+            return OpenRouterClient(model, api_key, self.config.num_samples, rate_limiter=rate_limiter,
+                                    stream=self.config.stream, max_tokens=self.config.max_tokens,
+                                    base_url=self.config.base_url, **kwargs)
+        elif provider == "fireworks":
+            return FireworksClient(model, api_key, self.config.num_samples, rate_limiter=rate_limiter,
+                                   stream=self.config.stream, max_tokens=self.config.max_tokens,
+                                   base_url=self.config.base_url, **kwargs)
+        print("UNKNOWN API PROVIDER")
+        return None
 
     def load_dataset(self, limit: Optional[int] = None) -> List[Dict[str, str]]:
         """Load theorems from JSON dataset"""
@@ -61,17 +172,59 @@ class Evaluator:
 
     def save_result(self, result: ProofSearchResult):
         """Save a single result to JSONL file"""
-        with open(self.results_file, 'a') as f:
-            f.write(json.dumps(asdict(result)) + "\n")
+        self.result_log.append(asdict(result))
 
     def prove_theorem(self, example: Dict[str, str]) -> ProofSearchResult:
         """Prove a single theorem"""
 
-        searcher = ProofSearch(api_client=self.api_client)
+        if self.budget_pool is not None:
+            exhausted = self.budget_pool.exhausted()
+            if exhausted:
+                print(f"{example['full_name']}: skipped ({exhausted})")
+                return ProofSearchResult(
+                    success = False,
+                    theorem_name = example['full_name'],
+                    error = exhausted,
+                )
+        budget = TheoremBudget(
+            self.config.timeout,
+            max_tokens = self.config.max_tokens_per_theorem,
+            max_dollars = self.config.max_dollars_per_theorem,
+            prices = self.config.prices,
+            pool = self.budget_pool,
+            max_extensions = 2 if self.config.redistribute_budget else 0,
+        )
+
+        tactic_cache = TacticCache.shared(self.config.tactic_cache) if self.config.tactic_cache else None
+        if self.config.and_or:
+            searcher = AndOrProofSearch(
+                api_client=self.api_client,
+                strategy=self.config.search_strategy,
+                tactic_cache=tactic_cache,
+                budget=budget,
+            )
+        elif self.config.search_strategy == "mcts":
+            searcher = MCTSProofSearch(
+                api_client=self.api_client,
+                value=self.config.value_fn,
+                batch_size=self.config.mcts_batch_size,
+                prune_subsumed=self.config.prune_subsumed,
+                tactic_cache=tactic_cache,
+                budget=budget,
+            )
+        else:
+            searcher = ProofSearch(
+                api_client=self.api_client,
+                strategy=self.config.search_strategy,
+                lookahead=self.config.lookahead,
+                prune_subsumed=self.config.prune_subsumed,
+                tactic_cache=tactic_cache,
+                budget=budget,
+            )
 
         # Setup
         try:
-            repo = LeanGitRepo(example['url'], example['commit'])
+            repo = lean_git_repo(example['url'], example['commit'])
             theorem = Theorem(repo, example['file_path'], example['full_name'])
         except Exception as e:
             print(f"{example['full_name']}: failed to setup theorem: {e}")
@@ -80,21 +233,40 @@ class Evaluator:
                 theorem_name = example['full_name'],
             )
 
-        # Run proof search
+        # Run proof search, once its REPLs fit in memory
+        if self.config.dojo_procs > 1:
+            env = DojoPool(theorem, num_procs=self.config.dojo_procs)
+        else:
+            env = Dojo(theorem)
+        governor = self.memory_governor
+        if governor is not None:
+            waited = governor.admit(self.config.dojo_procs)
+            if waited > 1.0:
+                print(f"{example['full_name']}: waited {waited:.0f}s for memory")
         try:
-            with Dojo(theorem) as (dojo, initial_state):
-                return searcher.search(theorem, dojo, initial_state)
+            with env as (dojo, initial_state):
+                with governor.watch(dojo) if governor is not None else nullcontext({"peak": 0}) as usage:
+                    result = searcher.search(theorem, dojo, initial_state)
+                result.repl_memory = usage["peak"] / 2**30
+                return result
         except DojoInitError as e:
-            print(f"{example['full_name']}: DojoInitError")
+            error = "OOM" if oom_killed(env, budget) else "DojoInitError" # killed while importing
+            print(f"{example['full_name']}: {error}")
             return ProofSearchResult(
                 success=False,
                 theorem_name=example['full_name'],
+                error=error,
             )
         except DojoCrashError as e:
-            print(f"{example['full_name']}: DojoCrashError")
+            if budget.killed: # LeanDojo reads the watchdog's kill as OOM too
+                error = "timeout"
+            else:
+                error = "OOM" if e.is_out_of_memory else "DojoCrashError"
+            print(f"{example['full_name']}: {error}")
             return ProofSearchResult(
                 success=False,
                 theorem_name=example['full_name'],
+                error=error,
             )
         except Exception as e:
             print(f"{example['full_name']}: unknown error: {e}")
@@ -102,19 +274,48 @@ class Evaluator:
                 success=False,
                 theorem_name=example['full_name'],
             )
+        finally:
+            if governor is not None:
+                governor.release()
+
+    def work(self, worker: int, scheduler: FileScheduler, results: "queue.Queue") -> int:
+        """Worker loop: prove theorems from the scheduler until it runs dry, reporting each result"""
+        count = 0
+        while (example := scheduler.next(worker)) is not None:
+            try:
+                result = self.prove_theorem(example)
+            except Exception as e:
+                print(f"Failed to process {example['full_name']}: {e}")
+                result = ProofSearchResult(success=False, theorem_name=example['full_name'])
+            retries = example.get('oom_retries', 0)
+            if result.error == "OOM" and retries < self.config.max_oom_retries:
+                cap = self.memory_governor.oom() if self.memory_governor is not None else None
+                scheduler.requeue(dict(example, oom_retries=retries + 1))
+                print(f"{example['full_name']}: OOM killed, requeued (at most {cap} theorems at once now)")
+                continue
+            results.put(result)
+            count += 1
+        return count
 
     def compute_summary(self) -> Dict:
-        """Compute summary stats from results"""
-        results = []
-        with open(self.results_file) as f:
-            for line in f:
-                results.append(json.loads(line))
+        """Compute summary stats from results (one per theorem, the latest if it was run twice)"""
+        if self.work_queue is not None:
+            results = list(merge_results(self.output_path.glob("results.*.jsonl")).values())
+        else:
+            results = list(self.result_log.load().values())
 
         total = len(results)
         successful = sum(1 for r in results if r["success"])
         failed = total - successful
         proof_lengths = [r["proof_length"] for r in results if r["success"]]
         search_times = [r["search_time"] for r in results if r["success"]]
+        unique_yields = [y for r in results for y in (r.get("unique_yields") or [])]
+        api_calls = sum(r.get("api_calls", 0) for r in results)
+        hedged_requests = sum(r.get("hedged_requests", 0) for r in results)
+        latencies = [x for r in results for x in (r.get("api_latencies") or [])]
+        llm_wait_time = sum(r.get("llm_wait_time", 0.0) for r in results)
+        lean_time = sum(r.get("lean_time", 0.0) for r in results)
+        repl_memory = [r["repl_memory"] for r in results if r.get("repl_memory")]
 
         summary = {
             "model": self.config.model,
@@ -124,6 +325,27 @@ class Evaluator:
             "accuracy": successful / total if total > 0 else 0.0,
             "avg_proof_length": sum(proof_lengths) / len(proof_lengths) if proof_lengths else 0.0,
             "avg_search_time": sum(search_times) / len(search_times) if search_times else 0.0,
+            "api_calls": api_calls,
+            "api_calls_saved": sum(r.get("api_calls_saved", 0) for r in results),
+            "avg_unique_yield": sum(unique_yields) / len(unique_yields) if unique_yields else 0.0,
+            "hedged_requests": hedged_requests,
+            "hedge_rate": hedged_requests / api_calls if api_calls else 0.0,
+            "hedge_wins": sum(r.get("hedge_wins", 0) for r in results),
+            "hedge_seconds_saved": sum(r.get("hedge_seconds_saved", 0.0) for r in results),
+            "prompt_tokens": sum(r.get("prompt_tokens", 0) for r in results),
+            "completion_tokens": sum(r.get("completion_tokens", 0) for r in results),
+            "tokens_per_proved": sum(r.get("api_tokens", 0) for r in results) / successful if successful else None,
+            "dollars_per_proved": sum(r.get("api_cost", 0.0) for r in results) / successful if successful else None,
+            "api_latency": percentiles(latencies),
+            "api_retries": sum(r.get("api_retries", 0) for r in results),
+            "api_errors": merge_counts(r.get("api_errors") for r in results),
+            "calls_by_provider": merge_counts(r.get("calls_by_provider") for r in results),
+            "search_time_percentiles": percentiles(r["search_time"] for r in results),
+            "llm_wait_time": llm_wait_time,
+            "lean_time": lean_time,
+            "llm_time_share": llm_wait_time / (llm_wait_time + lean_time) if llm_wait_time + lean_time else 0.0,
+            "repl_memory_gb": percentiles(repl_memory),
+            "oom_failures": sum(1 for r in results if r.get("error") == "OOM"),
         }
 
         print(f"Accuracy: {summary['accuracy']:.2%}")
@@ -132,44 +354,97 @@ class Evaluator:
     def evaluate(self, example_limit: Optional[int] = None):
         """Run full evaluation"""
         examples = self.load_dataset(limit=example_limit)
+        manager = multiprocessing.Manager()
+        self.budget_pool = BudgetPool(manager, self.config.max_tokens_per_run, self.config.max_dollars_per_run)
+        memory_budget = self.config.memory_budget_gb * 2**30 if self.config.memory_budget_gb is not None else None
+        self.memory_governor = MemoryGovernor(manager, memory_budget, self.config.repl_memory_gb * 2**30,
+                                              self.config.num_workers)
+
+        # Resume: skip theorems with a result, except ones skipped for the run budget (never attempted)
+        if self.config.resume and self.work_queue is None: # the work queue already knows what is done
+            done = {
+                name: r for name, r in self.result_log.load().items()
+                if r.get("error") not in ("run_token_budget", "run_dollar_budget")
+            }
+            examples = [ex for ex in examples if ex['full_name'] not in done]
+            # what was already spent still counts toward the run budget
+            self.budget_pool.charge(sum(r.get("api_tokens", 0) for r in done.values()),
+                                    sum(r.get("api_cost", 0.0) for r in done.values()))
+            print(f"Resuming: {len(done)} theorems already done")
         print(f"Starting evaluation of {len(examples)} theorems")
 
-        # Run evaluation with parallelization
-        submitted = set()
+        # Run evaluation with parallelization: one long-lived loop per worker, fed by file groups
+        examples = list({ex['full_name']: ex for ex in examples}.values()) # avoid dupes
+        heartbeat = None
+        if self.work_queue is not None: # distributed: lease theorems from the table all nodes share
+            self.work_queue.populate(examples)
+            heartbeat = self.work_queue.start_heartbeat()
+            scheduler: Union[FileScheduler, WorkQueue] = self.work_queue
+            total = self.work_queue.remaining()
+            print(f"Node {self.work_queue.node}: {total} theorems left across all nodes")
+        else:
+            scheduler = FileScheduler(manager, examples, by_file=self.config.group_by_file)
+            total = len(examples)
+            if self.config.group_by_file:
+                print(f"{total} theorems in {scheduler.num_groups} files")
+        results = manager.Queue()
         completed_count = 0
-        total = len(examples)
+        # Gateway: Lean workers (num_workers) and LLM requests (llm_concurrency) are sized separately
+        client, gateway, gateway_dir = self.api_client, None, None
+        if self.config.llm_gateway:
+            gateway_dir = tempfile.mkdtemp(prefix="llm-gateway-") # unix socket paths must be short
+            socket_path = Path(gateway_dir) / "gateway.sock"
+            gateway = start_gateway(client, socket_path, self.config.llm_concurrency)
+            self.api_client = GatewayClient(socket_path, client)
+            print(f"LLM gateway up, {self.config.llm_concurrency} concurrent requests for {self.config.num_workers} workers")
         executor = ProcessPoolExecutor(max_workers=self.config.num_workers)
+        self.result_log.open()
 
         try:
-            # Submit all + avoid dupes
-            submission_to_example = {}
-            for ex in examples:
-                example_id = ex['full_name']
-                if example_id not in submitted:
-                    submission_to_example[executor.submit(self.prove_theorem, ex)] = ex
-                    submitted.add(example_id)
-                
+            workers = [executor.submit(self.work, i, scheduler, results) for i in range(self.config.num_workers)]
+
             # Process results as they complete
-            for submission in as_completed(submission_to_example):
+            while completed_count < total:
                 try:
-                    result = submission.result()
-                    self.save_result(result)
-                    completed_count += 1
-                    print(f"{completed_count}/{total} theorems completed")
-                except Exception as e:
-                    example = submission_to_example[submission]
-                    print(f"Failed to process {example['full_name']}: {e}")
-                    completed_count += 1
-        
+                    result = results.get(timeout=1.0)
+                except queue.Empty:
+                    if all(w.done() for w in workers): # workers died, or every theorem is done
+                        break
+                    continue
+                self.save_result(result)
+                if self.work_queue is not None:
+                    self.work_queue.complete(result.theorem_name)
+                completed_count += 1
+                print(f"{completed_count}/{total} theorems completed")
+            for w in workers:
+                if w.done() and w.exception() is not None:
+                    print(f"Worker failed: {w.exception()}")
+            if self.work_queue is not None:
+                print(f"Leases taken over from silent nodes: {scheduler.steals()}")
+            elif self.config.group_by_file:
+                print(f"Work steals across files: {scheduler.steals()}")
+            ooms, cap, repl_bytes = self.memory_governor.stats()
+            print(f"OOM kills: {ooms}, theorems at once: {cap}, REPL peak estimate: {repl_bytes / 2**30:.1f} GB")
+
         except KeyboardInterrupt:
-            for submission in submission_to_example:
-                submission.cancel()
+            scheduler.stop()
             executor.shutdown(wait=False, cancel_futures=True)
             print("Shutdown complete")
             raise
 
         finally:
             executor.shutdown(wait=True)
+            if heartbeat is not None:
+                heartbeat.set()
+            if gateway is not None:
+                gateway.terminate()
+                gateway.join()
+                shutil.rmtree(gateway_dir, ignore_errors=True)
+                self.api_client = client
+            self.result_log.close()
+            self.budget_pool = None
+            self.memory_governor = None
+            manager.shutdown()
             print("Shutdown complete")
 
         # Summarize
@@ -0,0 +1,92 @@
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Hashable, Optional, Tuple, TypeVar
+
+
+T = TypeVar("T")
+
+
+class LatencyTracker:
+    """Recent request latencies, for percentiles"""
+
+    def __init__(self, window: int = 500):
+        self.latencies: Deque[float] = deque(maxlen=window)
+
+    def add(self, seconds: float):
+        self.latencies.append(seconds)
+
+    def percentile(self, q: float) -> float:
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def tail_mean(self, above: float) -> Optional[float]:
+        """Mean latency of the requests slower than `above`"""
+        tail = [x for x in self.latencies if x > above]
+        return sum(tail) / len(tail) if tail else None
+
+
+class Hedger:
+    """Sends a duplicate request once the first is slower than a latency percentile; first response wins
+
+    Latencies are tracked per kind of request (e.g. per number of choices) and hedging only
+    starts after min_observations of that kind. The loser is cancelled. seconds_saved is an
+    estimate: for each hedge win, how long slow requests usually take minus when the hedge
+    actually answered.
+    """
+
+    def __init__(self, percentile: float = 0.95, min_observations: int = 20, window: int = 500):
+        self.percentile = percentile
+        self.min_observations = min_observations
+        self.window = window
+        self.trackers: Dict[Hashable, LatencyTracker] = {}
+        self.requests = 0
+        self.hedges = 0 # duplicates sent
+        self.hedge_wins = 0 # duplicates that answered first
+        self.seconds_saved = 0.0
+
+    def stats(self) -> Tuple[int, int, int, float]:
+        """(requests, hedges, hedge wins, estimated seconds saved)"""
+        return self.requests, self.hedges, self.hedge_wins, self.seconds_saved
+
+    async def run(self, kind: Hashable, primary: Callable[[], Awaitable[T]],
+                  hedge: Optional[Callable[[], Awaitable[T]]] = None) -> T:
+        """Await primary(), racing it against hedge() (default: primary again) if it gets slow"""
+        tracker = self.trackers.setdefault(kind, LatencyTracker(self.window))
+        self.requests += 1
+        start = time.monotonic()
+        first = asyncio.ensure_future(primary())
+        if len(tracker.latencies) < self.min_observations:
+            result = await first
+            tracker.add(time.monotonic() - start)
+            return result
+
+        delay = tracker.percentile(self.percentile)
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            tracker.add(time.monotonic() - start)
+            return first.result()
+
+        self.hedges += 1
+        hedge_start = time.monotonic()
+        second = asyncio.ensure_future((hedge or primary)())
+        pending = {first, second}
+        try:
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = done.pop()
+                if winner.exception() is not None and pending: # a failure doesn't win, wait for the other
+                    continue
+                now = time.monotonic()
+                if winner is second:
+                    self.hedge_wins += 1
+                    tracker.add(now - hedge_start) # the hedge's own latency, the cancelled one is unknown
+                    expected = tracker.tail_mean(delay)
+                    if expected is not None:
+                        self.seconds_saved += max(0.0, expected - (now - start))
+                else:
+                    tracker.add(now - start)
+                return winner.result()
+        finally:
+            for task in pending:
+                task.cancel()
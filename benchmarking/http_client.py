@@ -0,0 +1,156 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import importlib.util
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional, Set, TypeVar
+import httpx
+
+
+T = TypeVar("T")
+
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None # httpx needs the h2 package for HTTP/2
+
+
+class CancelGroup:
+    """Requests a search has in flight, so they can be stopped when it ends instead of running on
+
+    Threads enter the group with active(); HTTPClient.run() ties every coroutine it starts
+    there to the group. cancel() cancels those coroutines on the client loop (freeing their
+    rate limiter slots), and anything the group starts afterwards is cancelled right away.
+    """
+
+    _current: "contextvars.ContextVar[Optional[CancelGroup]]" = contextvars.ContextVar("cancel_group", default=None)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._futures: Set[concurrent.futures.Future] = set()
+        self.cancelled = False
+
+    @classmethod
+    def current(cls) -> Optional["CancelGroup"]:
+        return cls._current.get()
+
+    @contextmanager
+    def active(self) -> Iterator["CancelGroup"]:
+        token = self._current.set(self)
+        try:
+            yield self
+        finally:
+            self._current.reset(token)
+
+    def add(self, future: concurrent.futures.Future):
+        with self._lock:
+            if not self.cancelled:
+                self._futures.add(future)
+                return
+        future.cancel()
+
+    def discard(self, future: concurrent.futures.Future):
+        with self._lock:
+            self._futures.discard(future)
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            futures, self._futures = self._futures, set()
+        for future in futures:
+            future.cancel()
+
+
+class HTTPClient:
+    """Pooled keep-alive HTTP client shared by every generator in a process
+
+    Wraps one httpx.AsyncClient living on a background event loop, so async callers and
+    plain threads (search executors, fan-out) reuse the same connections instead of doing
+    a TCP/TLS handshake per request. Use shared(): one instance per process, made again
+    after a fork since sockets and loops don't survive it.
+    """
+
+    _shared: Optional["HTTPClient"] = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, max_connections: int = 64, keepalive_expiry: float = 30.0, http2: bool = True):
+        self.max_connections = max_connections
+        self.keepalive_expiry = keepalive_expiry # seconds an idle connection stays open
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self._pid = os.getpid()
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run_loop, name="http-client", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        self._client: httpx.AsyncClient = self.run(self._make_client())
+
+    @classmethod
+    def shared(cls) -> "HTTPClient":
+        with cls._shared_lock:
+            if cls._shared is None or cls._shared._pid != os.getpid():
+                cls._shared = cls()
+            return cls._shared
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.call_soon(self._ready.set)
+        self._loop.run_forever()
+
+    async def _make_client(self) -> httpx.AsyncClient:
+        limits = httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+        return httpx.AsyncClient(limits=limits, http2=self.http2)
+
+    async def post(self, url: str, json: Dict[str, Any], headers: Optional[Dict[str, str]] = None,
+                   timeout: Optional[float] = None) -> httpx.Response:
+        """POST json on the shared pool, awaitable from any event loop"""
+        return await self._on_loop(self._client.post(url, json=json, headers=headers, timeout=timeout))
+
+    async def post_stream(self, url: str, json: Dict[str, Any], headers: Optional[Dict[str, str]],
+                          timeout: Optional[float], on_line: Callable[[str], bool]) -> httpx.Response:
+        """POST json and hand the response body to on_line line by line, until it returns True
+
+        Stopping early drops the connection, so the server stops generating. Error responses
+        are read whole instead and returned like post() would.
+        """
+        async def request() -> httpx.Response:
+            async with self._client.stream("POST", url, json=json, headers=headers, timeout=timeout) as response:
+                if response.status_code != 200:
+                    await response.aread()
+                    return response
+                async for line in response.aiter_lines():
+                    if on_line(line):
+                        break
+                return response
+        return await self._on_loop(request())
+
+    async def _on_loop(self, coro: Awaitable[T]) -> T:
+        if asyncio.get_running_loop() is self._loop:
+            return await coro
+        # the pool belongs to our loop, so hand the request over (e.g. from a web server's loop)
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self._loop))
+
+    def run(self, coro: Awaitable[T]) -> T:
+        """Run a coroutine on the client's loop and wait for it (sync wrapper for threads)"""
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("HTTPClient.run called from its own event loop, await instead")
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        group = CancelGroup.current()
+        if group is None:
+            return future.result()
+        group.add(future) # cancelling this future cancels the coroutine's task on the loop
+        try:
+            return future.result()
+        finally:
+            group.discard(future)
+
+    def post_sync(self, url: str, json: Dict[str, Any], headers: Optional[Dict[str, str]] = None,
+                  timeout: Optional[float] = None) -> httpx.Response:
+        return self.run(self.post(url, json, headers, timeout))
+
+    def close(self):
+        self.run(self._client.aclose())
+        self._loop.call_soon_threadsafe(self._loop.stop)
@@ -0,0 +1,34 @@
+import math
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Sequence
+
+
+@dataclass
+class CallRecord:
+    """One generator call: an API request as the search sees it (rate limiting, retries and hedging included)"""
+    provider: str
+    model: str
+    latency: float = 0.0 # seconds
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    retries: int = 0
+    error: Optional[str] = None # exception name or "HTTP <status>" if the call failed
+
+
+def percentiles(values: Iterable[float], qs: Sequence[float] = (0.5, 0.9, 0.99)) -> Dict[str, float]:
+    """Nearest-rank percentiles as {"p50": ..., "p90": ..., ...}, zeros when there are no values"""
+    ordered = sorted(values)
+    result = {}
+    for q in qs:
+        rank = max(0, math.ceil(q * len(ordered)) - 1)
+        result[f"p{round(q * 100)}"] = ordered[rank] if ordered else 0.0
+    return result
+
+
+def merge_counts(counts: Iterable[Optional[Dict[str, int]]]) -> Dict[str, int]:
+    """Sum {key: count} dicts (None counts as empty)"""
+    total: Dict[str, int] = {}
+    for count in counts:
+        for key, value in (count or {}).items():
+            total[key] = total.get(key, 0) + value
+    return total
@@ -0,0 +1,207 @@
+import asyncio
+import contextlib
+import json
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from dataclasses import asdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from benchmarking.api_clients import APIClient
+from benchmarking.http_client import CancelGroup
+from benchmarking.instrumentation import CallRecord
+
+
+class LLMGateway:
+    """One process that owns the real generator client and serves every Lean worker over a unix socket
+
+    Workers send one JSON line per request ({"op": "generate_tactics", "state": ...} or
+    {"op": "sample", "prompt": ...}) and get one JSON line back with the answer and what it
+    cost. Requests run concurrently up to max_concurrency on forks of the client, so they
+    share its connection pool, rate limiter, hedger, router and (for local models) batch
+    queue while usage is still counted per request. The HTTP calls themselves run on the
+    shared HTTPClient loop; the threads only carry generate_tactics' sampling logic. A worker
+    that gives up on a request closes its connection, which cancels the request here too.
+    """
+
+    def __init__(self, client: APIClient, path: Union[str, Path], max_concurrency: int = 64):
+        self.client = client
+        self.path = str(path)
+        self.max_concurrency = max_concurrency # requests in flight to the provider(s), across all workers
+        self.served = 0
+
+    def answer(self, request: Dict[str, Any], cancel: Optional[CancelGroup] = None) -> Dict[str, Any]:
+        view = self.client.fork()
+        try:
+            with (cancel or CancelGroup()).active():
+                if request["op"] == "generate_tactics":
+                    output: Any = view.generate_tactics(request["state"])
+                elif request["op"] == "sample":
+                    output = view.sample(request["prompt"])
+                else:
+                    raise ValueError(f"Unknown op: {request['op']}")
+            reply = {"output": output}
+        except Exception as e:
+            reply = {"error": f"{type(e).__name__}: {e}"}
+        finally:
+            self.client.join(view)
+        reply.update(
+            samples=view.sample_log,
+            calls=[asdict(record) for record in view.call_log],
+            usage=view.usage_totals(),
+            hedge=view.hedge_stats(),
+        )
+        return reply
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """One connection per worker thread, so one request at a time each"""
+        loop = asyncio.get_running_loop()
+        try:
+            while line := await reader.readline():
+                cancel = CancelGroup()
+                answer = loop.run_in_executor(self._executor, self.answer, json.loads(line), cancel)
+                # Nothing else arrives mid-request, so a read returning means the worker hung up
+                hangup = asyncio.ensure_future(reader.read(1))
+                await asyncio.wait({answer, hangup}, return_when=asyncio.FIRST_COMPLETED)
+                if not answer.done():
+                    cancel.cancel() # stops its provider requests, so they don't run on for nobody
+                    await answer
+                    break
+                hangup.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await hangup # so the next readline doesn't find it still waiting
+                reply = answer.result()
+                self.served += 1
+                writer.write((json.dumps(reply) + "\n").encode("utf-8"))
+                await writer.drain()
+        except (ConnectionResetError, BrokenPipeError): # worker went away mid-request
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self):
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="llm-gateway")
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        server = await asyncio.start_unix_server(self._handle, self.path, limit=1 << 24)
+        async with server:
+            await server.serve_forever()
+
+
+def run_gateway(client: APIClient, path: str, max_concurrency: int):
+    asyncio.run(LLMGateway(client, path, max_concurrency).serve())
+
+
+def start_gateway(client: APIClient, path: Union[str, Path], max_concurrency: int = 64,
+                  startup_timeout: float = 60.0) -> multiprocessing.Process:
+    """Run an LLMGateway in its own process, returning once it accepts connections"""
+    process = multiprocessing.Process(target=run_gateway, args=(client, str(path), max_concurrency),
+                                      name="llm-gateway", daemon=True)
+    process.start()
+    deadline = time.monotonic() + startup_timeout
+    while True:
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                probe.connect(str(path))
+            return process
+        except (FileNotFoundError, ConnectionRefusedError):
+            if not process.is_alive() or time.monotonic() > deadline:
+                process.terminate()
+                raise RuntimeError(f"LLM gateway failed to start at {path}")
+            time.sleep(0.05)
+
+
+def _shutdown(sock: socket.socket):
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError: # already closed
+        pass
+
+
+class GatewayClient(APIClient):
+    """Worker-side stand-in for the gateway's client: same interface, requests go over the socket
+
+    Each search thread gets its own connection. Usage, call records and hedge counts come back
+    with every answer and are recorded here, so budgets and per-theorem stats work unchanged.
+    Cancelling a search hangs up its in-flight request, which the gateway then cancels.
+    """
+
+    def __init__(self, path: Union[str, Path], client: APIClient):
+        super().__init__(client.num_samples)
+        self.path = str(path)
+        self.provider = client.provider # labels only
+        self.model = client.model
+        self.temperature = client.temperature
+        self.hedge_counts: Tuple[int, int, int, float] = (0, 0, 0, 0.0)
+        self._local = threading.local()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_local"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    def _request(self, request: Dict[str, Any]) -> Any:
+        files = getattr(self._local, "files", None)
+        if files is None or self._local.pid != os.getpid():
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self.path)
+            files = self._local.files = sock.makefile("rwb")
+            self._local.sock = sock
+            self._local.pid = os.getpid()
+
+        # If the search cancels, hang up: that unblocks readline() and the gateway cancels the request
+        group = CancelGroup.current()
+        hangup: Future = Future()
+        if group is not None:
+            sock = self._local.sock
+            hangup.add_done_callback(lambda _: _shutdown(sock))
+            group.add(hangup)
+        try:
+            if hangup.cancelled():
+                raise CancelledError()
+            files.write((json.dumps(request) + "\n").encode("utf-8"))
+            files.flush()
+            line = files.readline()
+            if hangup.cancelled(): # whatever came back is for a search that is over
+                raise CancelledError()
+        except (OSError, CancelledError):
+            self._local.files = None
+            files.close()
+            self._local.sock.close()
+            raise
+        finally:
+            if group is not None:
+                group.discard(hangup)
+        if not line:
+            self._local.files = None
+            self._local.sock.close()
+            raise ConnectionError("LLM gateway closed the connection")
+        reply = json.loads(line)
+
+        for requests_made, samples, unique in reply["samples"]:
+            self.record_samples(requests_made, samples, unique)
+        for call in reply["calls"]:
+            self.record_call(CallRecord(**call))
+        self.record_usage(*reply["usage"])
+        with self._usage_lock:
+            self.hedge_counts = tuple(a + b for a, b in zip(self.hedge_counts, reply["hedge"]))
+        if "error" in reply:
+            raise RuntimeError(f"LLM gateway: {reply['error']}")
+        return reply["output"]
+
+    def generate_tactics(self, state: str) -> List[Tuple[str, float]]:
+        return [(tactic, score) for tactic, score in self._request({"op": "generate_tactics", "state": state})]
+
+    def sample(self, prompt: str) -> Optional[str]:
+        return self._request({"op": "sample", "prompt": prompt})
+
+    def hedge_stats(self) -> Tuple[int, int, int, float]:
+        return self.hedge_counts
@@ -0,0 +1,256 @@
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from benchmarking.response_cache import ResponseCache
+
+
+class LatencyModel:
+    """Response latency in seconds, parsed from "fixed:0.5", "uniform:0.2,1.0", "lognormal:0.8,0.5" (median, sigma)
+    or "exp:0.5" (mean)"""
+
+    def __init__(self, spec: str = "fixed:0"):
+        kind, _, args = spec.partition(":")
+        self.kind = kind
+        self.args = [float(x) for x in args.split(",") if x]
+        if kind not in ("fixed", "uniform", "lognormal", "exp"):
+            raise ValueError(f"Unknown latency distribution: {spec}")
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "fixed":
+            return self.args[0]
+        if self.kind == "uniform":
+            return rng.uniform(self.args[0], self.args[1])
+        if self.kind == "lognormal":
+            return rng.lognormvariate(math.log(self.args[0]), self.args[1])
+        return rng.expovariate(1 / self.args[0])
+
+
+class TacticCorpus:
+    """Answers to serve: ground-truth tactics by prompt (fine-tuning jsonl), optionally a replay cache first
+
+    Prompts not in the corpus get a random corpus answer, so any proof state gets a plausible reply.
+    """
+
+    def __init__(self, paths: List[str], cache: Optional[ResponseCache] = None, provider: str = "",
+                 noise: float = 0.3):
+        self.answers: Dict[str, str] = {}
+        for path in paths:
+            with open(path) as f:
+                for line in f:
+                    messages = json.loads(line)["messages"]
+                    prompt = next(m["content"] for m in messages if m["role"] == "user")
+                    answer = next(m["content"] for m in messages if m["role"] == "assistant")
+                    self.answers[prompt] = answer
+        self.pool = list(self.answers.values()) or ["```lean\nsimp\n```"]
+        self.cache = cache # replay samples recorded by benchmark runs
+        self.provider = provider # provider part of the cache key
+        self.noise = noise # chance a known prompt gets some other tactic, so samples aren't all identical
+        self.drawn: Dict[Tuple[str, str], int] = {} # sample index per (model, prompt), for cache keys
+        self._lock = threading.Lock()
+
+    def answer(self, model: str, temperature: float, prompt: str, rng: random.Random) -> str:
+        if self.cache is not None:
+            with self._lock:
+                index = self.drawn.get((model, prompt), 0)
+                self.drawn[(model, prompt)] = index + 1
+            hit = self.cache.get(self.cache.key(self.provider, model, temperature, prompt, index))
+            if hit is not None:
+                return f"```lean\n{hit[0]}\n```"
+        known = self.answers.get(prompt)
+        if known is not None and rng.random() >= self.noise:
+            return known
+        return rng.choice(self.pool)
+
+
+class TokenBucket:
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = max(1.0, rate)
+        self.refilled = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(max(1.0, self.rate), self.tokens + (now - self.refilled) * self.rate)
+            self.refilled = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class LocalLLMServer(ThreadingHTTPServer):
+    """OpenAI-compatible chat completions stand-in for offline, reproducible load tests
+
+    Serves POST <anything>/chat/completions with n, logprobs and stream, after a sampled
+    latency. Injects errors (5xx, 429 over the rate limit, 400 for n if told to) and counts
+    what it served in stats().
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], corpus: TacticCorpus, latency: LatencyModel,
+                 error_rate: float = 0.0, rate_limit: Optional[float] = None, reject_n: bool = False,
+                 seed: Optional[int] = None):
+        super().__init__(address, _Handler)
+        self.corpus = corpus
+        self.latency = latency
+        self.error_rate = error_rate # chance of a 500/503
+        self.bucket = TokenBucket(rate_limit) if rate_limit else None # requests per second, 429s beyond
+        self.reject_n = reject_n # answer n > 1 with a 400, like providers without multi-sample support
+        self.rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self.counts = {"requests": 0, "ok": 0, "errors": 0, "throttled": 0, "rejected": 0}
+
+    def count(self, key: str):
+        with self._rng_lock:
+            self.counts[key] += 1
+
+    def draw(self, fn):
+        """Use the shared RNG under its lock, so a seeded run stays reproducible per request order"""
+        with self._rng_lock:
+            return fn(self.rng)
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self.counts)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # keep-alive, like the real providers
+    server: LocalLLMServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        server = self.server
+        server.count("requests")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            return self._send_json(404, {"error": {"message": f"no route {self.path}"}})
+        n = int(body.get("n", 1))
+        if server.bucket is not None and not server.bucket.take():
+            server.count("throttled")
+            return self._send_json(429, {"error": {"message": "rate limited"}}, {"Retry-After": "1"})
+        if server.reject_n and n > 1:
+            server.count("rejected")
+            return self._send_json(400, {"error": {"message": "n > 1 not supported"}})
+        if server.draw(lambda rng: rng.random()) < server.error_rate:
+            server.count("errors")
+            time.sleep(server.draw(server.latency.sample) / 2)
+            return self._send_json(server.draw(lambda rng: rng.choice([500, 503])), {"error": {"message": "injected"}})
+
+        model = body.get("model", "")
+        temperature = float(body.get("temperature", 1.0))
+        prompt = next((m["content"] for m in body.get("messages", []) if m.get("role") == "user"), "")
+        contents = [server.draw(lambda rng: server.corpus.answer(model, temperature, prompt, rng)) for _ in range(n)]
+        max_tokens = body.get("max_tokens") or body.get("max_completion_tokens")
+        choices = [_tokens(content, max_tokens) for content in contents]
+        usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": sum(len(tokens) for tokens in choices)}
+        delay = server.draw(server.latency.sample)
+        server.count("ok")
+        if body.get("stream"):
+            return self._stream(choices, usage, delay, bool(body.get("logprobs")))
+
+        time.sleep(delay)
+        self._send_json(200, {
+            "model": model,
+            "choices": [
+                {
+                    "index": i,
+                    "message": {"role": "assistant", "content": "".join(tokens)},
+                    "logprobs": {"content": [{"logprob": -0.1} for _ in tokens]} if body.get("logprobs") else None,
+                    "finish_reason": "stop",
+                }
+                for i, tokens in enumerate(choices)
+            ],
+            "usage": usage,
+        })
+
+    def _stream(self, choices: List[List[str]], usage: Dict[str, int], delay: float, logprobs: bool):
+        """SSE: the latency is spread over the tokens (first one after half of it)"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        steps = max(len(tokens) for tokens in choices)
+        try:
+            time.sleep(delay / 2)
+            for step in range(steps):
+                for i, tokens in enumerate(choices):
+                    if step >= len(tokens):
+                        continue
+                    choice = {"index": i, "delta": {"content": tokens[step]},
+                              "finish_reason": "stop" if step == len(tokens) - 1 else None}
+                    if logprobs:
+                        choice["logprobs"] = {"content": [{"logprob": -0.1}]}
+                    self._chunk({"choices": [choice]})
+                time.sleep(delay / 2 / steps)
+            self._chunk({"choices": [], "usage": usage})
+            self._write_chunk(b"data: [DONE]\n\n")
+            self._write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError): # client hung up early, which streaming clients do
+            self.close_connection = True
+
+    def _chunk(self, data: Dict[str, Any]):
+        self._write_chunk(f"data: {json.dumps(data)}\n\n".encode("utf-8"))
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _send_json(self, status: int, data: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+        out = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(out)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(out)
+
+
+def _tokens(content: str, max_tokens: Optional[int] = None) -> List[str]:
+    """Rough tokens (~4 chars each), cut at max_tokens"""
+    tokens = [content[i:i + 4] for i in range(0, len(content), 4)]
+    return tokens[:max_tokens] if max_tokens else tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stand-in for the LLM providers")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--corpus", nargs="*", default=sorted(str(p) for p in Path("finetuning/data").glob("*.jsonl")),
+                        help="fine-tuning jsonl files with (prompt, tactic) pairs")
+    parser.add_argument("--replay-cache", help="response cache (sqlite) to serve recorded samples from first")
+    parser.add_argument("--provider", default="fireworks", help="provider the replay cache was recorded with")
+    parser.add_argument("--noise", type=float, default=0.3, help="chance of a random tactic for a known prompt")
+    parser.add_argument("--latency", default="lognormal:0.8,0.5",
+                        help="fixed:S, uniform:LO,HI, lognormal:MEDIAN,SIGMA or exp:MEAN (seconds)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="chance of a 500/503")
+    parser.add_argument("--rate-limit", type=float, help="requests per second before 429s")
+    parser.add_argument("--reject-n", action="store_true", help="400 on n > 1")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    cache = ResponseCache(args.replay_cache, mode="replay") if args.replay_cache else None
+    corpus = TacticCorpus(args.corpus, cache, args.provider, args.noise)
+    server = LocalLLMServer((args.host, args.port), corpus, LatencyModel(args.latency), args.error_rate,
+                            args.rate_limit, args.reject_n, args.seed)
+    print(f"Serving {len(corpus.answers)} prompts at http://{args.host}:{server.server_port}/v1/chat/completions")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"Stats: {server.stats()}")
+
+
+if __name__ == "__main__":
+    main()
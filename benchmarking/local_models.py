@@ -0,0 +1,163 @@
+import importlib.util
+import math
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+from types import ModuleType
+from typing import Any, Callable, List, Optional, Tuple
+
+from benchmarking.api_clients import APIClient
+from benchmarking.http_client import CancelGroup
+from benchmarking.instrumentation import CallRecord
+
+
+LEANCOPILOT_MODELS = Path(__file__).resolve().parents[1] / "LeanCopilot" / "python" / "models.py"
+
+
+def leancopilot_models() -> ModuleType:
+    """LeanCopilot/python/models.py, loaded from its path as leancopilot_models (no sys.path
+    entry, so no other top-level `models` module can stand in for it)"""
+    module = sys.modules.get("leancopilot_models")
+    if module is None:
+        spec = importlib.util.spec_from_file_location("leancopilot_models", LEANCOPILOT_MODELS)
+        module = importlib.util.module_from_spec(spec)
+        try:
+            spec.loader.exec_module(module)
+        except ImportError as e:
+            raise ImportError(
+                "Local models need LeanCopilot/python's requirements (torch, transformers, loguru), "
+                "see LeanCopilot/python/README.md"
+            ) from e
+        sys.modules["leancopilot_models"] = module
+    return module
+
+
+def load_generator(name: str, kind: str = "encoder_decoder", num_samples: int = 32, max_length: int = 1024,
+                   device: str = "cpu") -> Any:
+    """A LeanCopilot tactic generator (LeanCopilot/python/models.py), imported lazily since it needs torch"""
+    models = leancopilot_models()
+
+    if kind == "encoder_decoder":
+        return models.EncoderDecoderTransformer(name, num_return_sequences=num_samples, max_length=max_length, device=device)
+    if kind == "pythia":
+        return models.PythiaTacticGenerator(num_return_sequences=num_samples, max_length=max_length, device=device)
+    if kind == "decoder_only":
+        return models.DecoderOnlyTransformer(name, num_return_sequences=num_samples, max_length=max_length, device=device)
+    raise ValueError(f"Unknown local model type: {kind}")
+
+
+class LocalModelClient(APIClient):
+    """Runs a LeanCopilot Generator in-process, batching states from all search threads into one generate call
+
+    States queue up for at most max_wait seconds (or until max_batch are waiting), then go
+    through generate_batch in one forward pass (one generate call each if the model has no
+    generate_batch). Scores are the model's sequence log-probabilities. The model is made by
+    factory on first use in each process, so the client pickles without it.
+    """
+
+    provider = "local"
+
+    def __init__(self, factory: Callable[[], Any], model: str = "", num_samples: int = 32, max_batch: int = 16,
+                 max_wait: float = 0.01):
+        super().__init__(num_samples)
+        self.factory = factory # e.g. functools.partial(load_generator, "kaiyuy/leandojo-lean4-tacgen-byt5-small")
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait # seconds the first state in a batch waits for company
+        self._init_runtime()
+
+    def _init_runtime(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._generator = None
+        self._queue: "queue.Queue[Tuple[str, Future]]" = queue.Queue()
+        self.batch_sizes: List[int] = []
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in ("_lock", "_pid", "_generator", "_queue", "batch_sizes"):
+            del state[key]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_runtime()
+
+    def _start(self):
+        """Load the model and start the batching thread, once per process"""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._generator = self.factory()
+            self._queue = queue.Queue()
+            self._pid = os.getpid()
+            threading.Thread(target=self._run_batches, name="local-model", daemon=True).start()
+
+    def fork(self) -> "LocalModelClient":
+        self._start() # forks share the loaded model and its batch queue
+        return super().fork()
+
+    def _run_batches(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            batch = [(state, future) for state, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            states = [state for state, _ in batch]
+            self.batch_sizes.append(len(batch))
+            try:
+                if hasattr(self._generator, "generate_batch"):
+                    outputs = self._generator.generate_batch(states)
+                else:
+                    outputs = [self._generator.generate(state) for state in states]
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), output in zip(batch, outputs):
+                future.set_result(output)
+
+    def generate_tactics(self, state: str) -> List[Tuple[str, float]]:
+        """(tactic, sequence log-prob) pairs for state, best first"""
+        self._start()
+        record = CallRecord(self.provider, self.model)
+        start = time.monotonic()
+        future: Future = Future()
+        group = CancelGroup.current()
+        if group is not None:
+            group.add(future) # a cancelled search's states leave the queue unbatched
+        self._queue.put((state, future))
+        try:
+            outputs = future.result()
+        except Exception as e:
+            record.error = type(e).__name__
+            raise
+        finally:
+            record.latency = time.monotonic() - start
+            self.record_call(record)
+            if group is not None:
+                group.discard(future)
+
+        best = {}
+        for tactic, prob in outputs:
+            tactic = tactic.strip()
+            score = math.log(max(prob, 1e-12))
+            if tactic and score > best.get(tactic, -math.inf):
+                best[tactic] = score
+        unique = sorted(best.items(), key=lambda x: x[1], reverse=True)
+        self.record_samples(1, len(outputs), len(unique))
+        return unique
+
+    def sample(self, prompt: str) -> Optional[str]:
+        suggestions = self.generate_tactics(prompt)
+        return suggestions[0][0] if suggestions else None
@@ -0,0 +1,235 @@
+import math
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple, Union
+from lean_dojo import Dojo, DojoPool, Theorem, TacticState, ProofFinished
+
+from benchmarking.api_clients import APIClient
+from benchmarking.proof_search import ProofSearch, ProofSearchResult, SearchNode, SearchTree
+from benchmarking.scheduler import TheoremBudget
+from benchmarking.tactic_cache import TacticCache, cache_scope
+from benchmarking.transposition import TranspositionTable, state_key
+
+
+def goal_count_value(state: TacticState) -> float:
+    """Fewer open goals is better"""
+    return -float(state.num_goals)
+
+
+def goal_length_value(state: TacticState) -> float:
+    """Less goal text is better (finer-grained than the goal count)"""
+    return -float(sum(len(goal) for goal in state.pp.split("\n\n") if "⊢" in goal))
+
+
+VALUE_FUNCTIONS: Dict[str, Callable[[TacticState], float]] = {
+    "goal_count": goal_count_value,
+    "goal_length": goal_length_value,
+}
+
+
+class MCTSNode(SearchNode):
+    """SearchNode plus visit statistics"""
+    __slots__ = ("prior", "visits", "value_sum", "pending", "children", "expanded", "dead")
+
+    def __init__(self, index: int, depth: int, state: TacticState, score: float = 0.0, key=None,
+                 prior: float = 1.0, value: float = 0.0):
+        super().__init__(index, depth, state, score, key)
+        self.prior = prior # share of the samples that suggested this tactic
+        self.visits = 1 # the value estimate counts as the first visit
+        self.value_sum = value
+        self.pending = 0 # virtual visits from leaves in the current batch
+        self.children: List["MCTSNode"] = []
+        self.expanded = False
+        self.dead = False # no proof below it (failed expansion or depth limit)
+
+    @property
+    def q(self) -> float:
+        return self.value_sum / self.visits
+
+
+class MCTSProofSearch(ProofSearch):
+    """PUCT tree search: priors from suggestion frequencies, values from a cheap state estimator
+
+    Each iteration selects up to batch_size distinct leaves, counting in-flight leaves as
+    virtual visits so later descents spread out. Their tactics are generated concurrently and
+    checked per leaf, then each leaf backs up the value of its best child. Values are
+    min-max normalized over the tree, so any estimator scale works with the same exploration
+    constant. One leaf expansion counts as one expansion, as in the queue-based search.
+    """
+
+    def __init__(self, api_client: APIClient, value_fn: Optional[Callable[[TacticState], float]] = None,
+                 value: str = "goal_count", batch_size: int = 4, exploration: float = 1.0,
+                 prune_subsumed: bool = False, tactic_cache: Optional[TacticCache] = None,
+                 budget: Optional[TheoremBudget] = None):
+        super().__init__(api_client, prune_subsumed=prune_subsumed, tactic_cache=tactic_cache, budget=budget)
+        if value_fn is not None:
+            self.value_fn = value_fn
+        elif value in VALUE_FUNCTIONS:
+            self.value_fn = VALUE_FUNCTIONS[value]
+        else:
+            raise ValueError(f"Unknown value function: {value}")
+        self.batch_size = batch_size # leaves expanded per iteration
+        self.exploration = exploration # PUCT constant
+        self.generation_workers = max(1, batch_size)
+        self.value_min = math.inf
+        self.value_max = -math.inf
+
+    def _normalized(self, q: float) -> float:
+        if self.value_max <= self.value_min:
+            return 0.5
+        return (q - self.value_min) / (self.value_max - self.value_min)
+
+    def _observe(self, value: float):
+        self.value_min = min(self.value_min, value)
+        self.value_max = max(self.value_max, value)
+
+    def _puct(self, parent: MCTSNode, child: MCTSNode) -> float:
+        explore = math.sqrt(parent.visits + parent.pending) / (1 + child.visits + child.pending)
+        return self._normalized(child.q) + self.exploration * child.prior * explore
+
+    def _select(self, root: MCTSNode) -> Optional[List[MCTSNode]]:
+        """Path from the root to the most promising unexpanded leaf (None if the tree is dead)"""
+        path = [root]
+        node = root
+        while node.expanded:
+            live = [child for child in node.children if not child.dead]
+            if not live:
+                return None
+            node = max(live, key=lambda child: self._puct(path[-1], child))
+            path.append(node)
+        return path
+
+    def _mark_dead(self, path: List[MCTSNode]):
+        """Kill the leaf and any ancestor left with no live children"""
+        path[-1].dead = True
+        for node in reversed(path[:-1]):
+            if any(not child.dead for child in node.children):
+                break
+            node.dead = True
+
+    def _backup(self, path: List[MCTSNode], value: float):
+        for node in path:
+            node.visits += 1
+            node.value_sum += value
+
+    def _search(self, theorem: Theorem, dojo: Union[Dojo, DojoPool], initial_state: TacticState,
+                executor: ThreadPoolExecutor, budget: TheoremBudget) -> ProofSearchResult:
+        start_time = time.time()
+        theorem_name = theorem.full_name
+        print(f"{theorem_name}: starting MCTS search")
+
+        # Initialize
+        table = TranspositionTable()
+        tree = SearchTree()
+        num_expansions = 0
+        self.value_min, self.value_max = math.inf, -math.inf
+        value = self.value_fn(initial_state)
+        self._observe(value)
+        root = MCTSNode(
+            index = tree.add(-1, None),
+            depth = 0,
+            state = initial_state,
+            key = state_key(initial_state),
+            value = value,
+        )
+        table.record(root.key, 0)
+        frontier: Dict[int, MCTSNode] = {root.index: root} # unexpanded live nodes, for budget extensions
+
+        # Search
+        while not root.dead and num_expansions < self.max_expansions:
+            # Check time/token budgets, promising searches may get a top-up
+            stop = budget.exceeded()
+            if stop is not None and not (self._promising(frontier.values(), initial_state) and budget.extend()):
+                print(f"{theorem_name}: proof search stopped ({stop})")
+                return self._make_result(theorem_name, start_time, num_expansions, budget, table, error=stop)
+
+            # Select a batch of distinct leaves
+            batch: List[Tuple[List[MCTSNode], Future]] = []
+            while len(batch) < min(self.batch_size, self.max_expansions - num_expansions):
+                path = self._select(root)
+                if path is None or path[-1].pending: # dead tree, or best leaf already in this batch
+                    break
+                leaf = path[-1]
+                if leaf.depth >= self.max_depth: # depth limit
+                    frontier.pop(leaf.index, None)
+                    self._mark_dead(path)
+                    continue
+                for node in path:
+                    node.pending += 1
+                batch.append((path, executor.submit(self._generate, leaf.pp)))
+            if not batch:
+                continue
+
+            # Expand: generation ran concurrently, Lean checks each leaf's suggestions
+            for path, future in batch:
+                for node in path:
+                    node.pending -= 1
+                leaf = path[-1]
+                num_expansions += 1
+                try:
+                    suggestions = self._wait(future, budget,
+                                             lambda: self._promising(frontier.values(), initial_state))
+                except Exception as e:
+                    print(f"{theorem_name}: generation failed: {e}")
+                    continue
+                if suggestions is None:
+                    print(f"{theorem_name}: proof search stopped (timeout)")
+                    return self._make_result(theorem_name, start_time, num_expansions, budget, table,
+                                             error="timeout")
+
+                tactics = [suggestion for suggestion, _ in suggestions]
+                results = self._run_tactics(dojo, leaf.state, tactics, cache_scope(theorem))
+                children: List[MCTSNode] = []
+                productive = False
+                for (suggestion, score), result in zip(suggestions, results):
+                    if isinstance(result, Exception):
+                        print(f"{theorem_name}: run_tac failed: {result}")
+                        print(f"^Suggestion: {suggestion}")
+                        continue
+
+                    if isinstance(result, ProofFinished):
+                        proof_steps = tree.path(leaf.index) + [suggestion]
+                        print(f"{theorem_name}: PROVED")
+                        return self._make_result(theorem_name, start_time, num_expansions, budget, table,
+                                                 proof_steps=proof_steps)
+
+                    if not isinstance(result, TacticState):
+                        continue
+                    productive = True
+                    key = state_key(result)
+                    if table.seen(key, leaf.depth+1): # reached elsewhere at the same or a shallower depth
+                        continue
+                    if self.prune_subsumed and table.is_subsumed(key):
+                        continue
+                    table.record(key, leaf.depth+1)
+                    value = self.value_fn(result)
+                    self._observe(value)
+                    children.append(MCTSNode(
+                        index = tree.add(leaf.index, suggestion),
+                        depth = leaf.depth+1,
+                        state = result,
+                        score = leaf.score + score,
+                        key = key,
+                        prior = math.exp(score),
+                        value = value,
+                    ))
+
+                frontier.pop(leaf.index, None)
+                leaf.expanded = True
+                if not productive: # every suggestion failed
+                    table.mark_failed(leaf.key)
+                if not children:
+                    self._mark_dead(path)
+                    continue
+
+                # Priors over the tactics that worked; back up the best child's value
+                total = sum(child.prior for child in children)
+                for child in children:
+                    child.prior /= total
+                    frontier[child.index] = child
+                leaf.children = children
+                self._backup(path, max(child.q for child in children))
+
+        # Search exhausted
+        print(f"{theorem_name}: search exhausted")
+        return self._make_result(theorem_name, start_time, num_expansions, budget, table)
@@ -1,18 +1,83 @@
+import heapq
+import itertools
 import time
-from collections import deque
-from dataclasses import dataclass, field
-from typing import Deque, List, Optional, Set
-from lean_dojo import Dojo, Theorem, TacticState, ProofFinished, LeanError, ProofGivenUp
+from array import array
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from lean_dojo import (Dojo, DojoPool, Theorem, TacticState, TacticResult, ProofFinished, LeanError, ProofGivenUp,
+                       DojoCrashError)
 
 from benchmarking.api_clients import APIClient
+from benchmarking.http_client import CancelGroup
+from benchmarking.instrumentation import merge_counts
+from benchmarking.scheduler import TheoremBudget, oom_killed
+from benchmarking.tactic_cache import TacticCache, cache_scope
+from benchmarking.transposition import StateKey, TranspositionTable, state_key
+
+
+class SearchTree:
+    """Append-only search tree stored as columns: parent index + interned tactic per node"""
+
+    def __init__(self):
+        self.parents = array("i") # -1 for a root
+        self.tactic_ids = array("i") # -1 for a root
+        self.tactics: List[str] = [] # string table
+        self.tactic_index: Dict[str, int] = {}
+
+    def add(self, parent: int, tactic: Optional[str]) -> int:
+        """Add a node and return its index (a root has parent -1 and no tactic)"""
+        tactic_id = -1
+        if tactic is not None:
+            tactic_id = self.tactic_index.setdefault(tactic, len(self.tactics))
+            if tactic_id == len(self.tactics):
+                self.tactics.append(tactic)
+        self.parents.append(parent)
+        self.tactic_ids.append(tactic_id)
+        return len(self.parents) - 1
+
+    def path(self, index: int) -> List[str]:
+        """Tactics from the root to a node, only rebuilt when needed"""
+        steps = []
+        while index >= 0 and self.tactic_ids[index] >= 0:
+            steps.append(self.tactics[self.tactic_ids[index]])
+            index = self.parents[index]
+        return steps[::-1]
 
 
-@dataclass
 class SearchNode:
-    """Node in the proof search tree."""
-    state: TacticState
-    depth: int
-    tactic_sequence: List[str] = field(default_factory=list) # ensure new empty list
+    """Frontier entry: its place in the SearchTree plus what's needed to resume from its state"""
+    __slots__ = ("index", "depth", "score", "pp", "state_id", "key")
+
+    def __init__(self, index: int, depth: int, state: TacticState, score: float = 0.0,
+                 key: Optional[StateKey] = None):
+        self.index = index
+        self.depth = depth
+        self.score = score # cumulative log-prob of the tactic path
+        self.pp = state.pp # keep the text and id, not the parsed goals
+        self.state_id = state.id
+        self.key = key # canonical state, for deduplication
+
+    @property
+    def state(self) -> TacticState:
+        """Rebuild the tactic state (goals get parsed again)"""
+        return TacticState(self.pp, self.state_id)
+
+
+def bfs_priority(node: SearchNode) -> float:
+    """Shallowest first, FIFO within a depth"""
+    return node.depth
+
+
+def best_first_priority(node: SearchNode) -> float:
+    """Most likely tactic path first"""
+    return -node.score
+
+
+PRIORITY_FUNCTIONS: Dict[str, Callable[[SearchNode], float]] = {
+    "bfs": bfs_priority,
+    "best_first": best_first_priority,
+}
 
 
 @dataclass
@@ -23,107 +88,297 @@ class ProofSearchResult:
     proof_steps: Optional[List[str]] = None
     proof_length: Optional[int] = None
     search_time: float = 0.0
+    num_expansions: int = 0
+    transposition_hits: int = 0
+    subsumption_prunes: int = 0
+    tactic_cache_hits: int = 0
+    api_tokens: int = 0
+    api_cost: float = 0.0
+    api_calls: int = 0 # HTTP requests
+    api_calls_saved: int = 0 # samples not drawn vs. num_samples per state (negative if hard states drew more)
+    unique_yields: Optional[List[float]] = None # unique tactics / samples, per generate_tactics
+    hedged_requests: int = 0 # duplicates sent for slow requests
+    hedge_wins: int = 0 # duplicates that answered first
+    hedge_seconds_saved: float = 0.0 # estimate
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    api_latencies: Optional[List[float]] = None # seconds per API request
+    api_retries: int = 0
+    api_errors: Optional[Dict[str, int]] = None # failed API requests by error
+    calls_by_provider: Optional[Dict[str, int]] = None
+    llm_wait_time: float = 0.0 # seconds the search sat waiting for suggestions
+    lean_time: float = 0.0 # seconds spent running tactics in Lean
+    repl_memory: float = 0.0 # peak RSS of the theorem's REPL processes, GB
+    error: Optional[str] = None # why the search stopped early (timeout, budgets, crashes)
 
 
 class ProofSearch:
     """Proof search using generated tactics"""
 
-    def __init__(self, api_client: APIClient):
+    def __init__(self, api_client: APIClient, strategy: str = "bfs",
+                 priority_fn: Optional[Callable[[SearchNode], float]] = None, lookahead: int = 0,
+                 prune_subsumed: bool = False, tactic_cache: Optional[TacticCache] = None,
+                 budget: Optional[TheoremBudget] = None):
         self.api_client = api_client
         self.max_expansions = 500
         self.max_depth = 50
         self.timeout = 300
+        self.lookahead = lookahead # generation requests kept in flight for upcoming nodes (0 = serial)
+        self.generation_workers = max(1, lookahead) # concurrent generation requests
+        self.prune_subsumed = prune_subsumed # skip states containing all goals of a failed state
+        self.tactic_cache = tactic_cache # known tactic results shared across theorems
+        self.tactic_cache_hits = 0
+        self._cancel = CancelGroup() # this search's generation requests
+        self._client = api_client # this search's fork of api_client, with its own logs and token counts
+        self._hedge_start = (0, 0, 0, 0.0) # its hedge_stats() when this search started
+        self.llm_wait_time = 0.0
+        self.lean_time = 0.0
+        self.budget = budget # hard time/token/dollar limits (default: self.timeout seconds)
+        self._budget: Optional[TheoremBudget] = None # the running search's, so a watchdog kill isn't read as OOM
+
+        # Queue discipline: lower priority gets expanded first
+        if priority_fn is not None:
+            self.priority_fn = priority_fn
+        elif strategy in PRIORITY_FUNCTIONS:
+            self.priority_fn = PRIORITY_FUNCTIONS[strategy]
+        else:
+            raise ValueError(f"Unknown search strategy: {strategy}")
 
-    def search(self, theorem: Theorem, dojo: Dojo, initial_state: TacticState) -> ProofSearchResult:
+    def search(self, theorem: Theorem, dojo: Union[Dojo, DojoPool], initial_state: TacticState) -> ProofSearchResult:
         """Do the search"""
+        self._reset_stats()
+        budget = self._budget = self.budget if self.budget is not None else TheoremBudget(self.timeout)
+        budget.start(self._client.usage_totals)
+        # generation always runs off-thread so the deadline can cut it short
+        executor = ThreadPoolExecutor(max_workers=self.generation_workers)
+        try:
+            with budget.watch(dojo):
+                return self._search(theorem, dojo, initial_state, executor, budget)
+        finally:
+            # stop abandoned generation requests, so they don't bill the next theorem
+            self._cancel.cancel()
+            executor.shutdown(wait=False, cancel_futures=True)
+            budget.release()
+            self.api_client.join(self._client)
+
+    def _reset_stats(self):
+        """Zero the per-search counters and fork the client, so calls still landing from the
+        last search's leftover threads go to that search's logs (dropped with it), not this one's"""
+        self.tactic_cache_hits = 0
+        self._cancel = CancelGroup()
+        self._client = self.api_client.fork()
+        self._hedge_start = self._client.hedge_stats()
+        self.llm_wait_time = 0.0
+        self.lean_time = 0.0
+
+    def _make_result(self, theorem_name: str, start_time: float, num_expansions: int, budget: TheoremBudget,
+                     table: Optional[TranspositionTable] = None, proof_steps: Optional[List[str]] = None,
+                     error: Optional[str] = None) -> ProofSearchResult:
+        samples = list(self._client.sample_log)
+        calls = list(self._client.call_log)
+        _, hedges, hedge_wins, saved = (now - then for now, then in zip(self._client.hedge_stats(), self._hedge_start))
+        return ProofSearchResult(
+            success = proof_steps is not None,
+            theorem_name = theorem_name,
+            proof_steps = proof_steps,
+            proof_length = len(proof_steps) if proof_steps is not None else None,
+            search_time = time.time() - start_time,
+            num_expansions = num_expansions,
+            transposition_hits = table.hits if table is not None else 0,
+            subsumption_prunes = table.pruned if table is not None else 0,
+            tactic_cache_hits = self.tactic_cache_hits,
+            api_tokens = budget.tokens_used,
+            api_cost = budget.dollars_used,
+            api_calls = sum(calls for calls, _, _ in samples),
+            api_calls_saved = sum(self.api_client.num_samples - drawn for _, drawn, _ in samples),
+            unique_yields = [round(unique / drawn, 3) if drawn else 0.0 for _, drawn, unique in samples],
+            hedged_requests = hedges,
+            hedge_wins = hedge_wins,
+            hedge_seconds_saved = saved,
+            prompt_tokens = sum(call.prompt_tokens for call in calls),
+            completion_tokens = sum(call.completion_tokens for call in calls),
+            api_latencies = [round(call.latency, 3) for call in calls],
+            api_retries = sum(call.retries for call in calls),
+            api_errors = merge_counts({call.error: 1} for call in calls if call.error),
+            calls_by_provider = merge_counts({call.provider: 1} for call in calls),
+            llm_wait_time = self.llm_wait_time,
+            lean_time = self.lean_time,
+            error = error,
+        )
+
+    def _generate(self, state_pp: str) -> List[Tuple[str, float]]:
+        """generate_tactics on an executor thread, its requests cancelled when the search ends"""
+        with self._cancel.active():
+            return self._client.generate_tactics(state_pp)
+
+    def _wait(self, future: Future, budget: TheoremBudget, promising: Callable[[], bool]):
+        """Suggestions from future, or None if the deadline (plus any extension) passes first"""
+        start = time.time()
+        try:
+            while True:
+                try:
+                    return future.result(timeout=max(budget.remaining(), 0))
+                except FutureTimeoutError:
+                    if not (promising() and budget.extend()):
+                        future.cancel()
+                        self._cancel.cancel() # the running request too, not just queued ones
+                        return None
+        finally:
+            self.llm_wait_time += time.time() - start
+
+    def _promising(self, frontier: Iterable[SearchNode], initial_state: TacticState) -> bool:
+        """Cheap progress signal for budget extensions: a frontier state clearly smaller than the root"""
+        root_goals, root_size = initial_state.num_goals, len(initial_state.pp)
+        return any(node.pp.count("⊢") < root_goals or len(node.pp) < 0.75 * root_size for node in frontier)
+
+    def _prefetch(self, queue: List[Tuple[float, int, SearchNode]], table: TranspositionTable,
+                  pending: Dict[str, Future], executor: ThreadPoolExecutor):
+        """Keep generation requests in flight for the next frontier nodes, in expansion order"""
+        in_flight = sum(1 for future in pending.values() if not future.done())
+        for _, _, node in heapq.nsmallest(2 * self.lookahead, queue):
+            if in_flight >= self.lookahead:
+                break
+            state_pp = node.pp
+            if state_pp in pending or node.depth >= self.max_depth or node.key.digest in table.best_depth:
+                continue
+            pending[state_pp] = executor.submit(self._generate, state_pp)
+            in_flight += 1
+
+    def _run_tactics(self, dojo: Union[Dojo, DojoPool], state: TacticState, tactics: List[str],
+                     scope: str = "") -> Iterator[Union[TacticResult, Exception]]:
+        """Results of each tactic on state, in order (checked in parallel on a DojoPool)
+
+        Tactics with a known error/close in the tactic cache skip Lean entirely. A REPL lost to
+        an OOM kill raises DojoCrashError("OOM"), since nothing after it can run.
+        """
+        cached: List[Optional[TacticResult]] = [None] * len(tactics)
+        if self.tactic_cache is not None:
+            cached = [self.tactic_cache.lookup(scope, state.pp, tactic) for tactic in tactics]
+            self.tactic_cache_hits += sum(1 for hit in cached if hit is not None)
+
+        if isinstance(dojo, DojoPool):
+            misses = [tactic for tactic, hit in zip(tactics, cached) if hit is None]
+            start = time.time()
+            fresh = iter(dojo.run_tacs(state, misses, return_exceptions=True))
+            self.lean_time += time.time() - start
+        for tactic, hit in zip(tactics, cached):
+            if hit is not None:
+                yield hit
+                continue
+            if isinstance(dojo, DojoPool):
+                result = next(fresh)
+            else:
+                start = time.time()
+                try:
+                    result = dojo.run_tac(state, tactic)
+                except Exception as e:
+                    result = e
+                self.lean_time += time.time() - start
+            if isinstance(result, DojoCrashError) and oom_killed(dojo, self._budget):
+                raise DojoCrashError("OOM") from result
+            if self.tactic_cache is not None and not isinstance(result, Exception):
+                self.tactic_cache.put(scope, state.pp, tactic, result)
+            yield result
+
+    def _search(self, theorem: Theorem, dojo: Union[Dojo, DojoPool], initial_state: TacticState,
+                executor: ThreadPoolExecutor, budget: TheoremBudget) -> ProofSearchResult:
         start_time = time.time()
         theorem_name = theorem.full_name
         print(f"{theorem_name}: starting search")
 
         # Initialize
-        queue: Deque[SearchNode] = deque()
-        visited: Set[str] = set()
+        queue: List[Tuple[float, int, SearchNode]] = []
+        counter = itertools.count() # tie-break on insertion order
+        table = TranspositionTable() # canonical states already expanded
+        pending: Dict[str, Future] = {} # state pp -> prefetched suggestions
         num_expansions = 0
-        queue.append(SearchNode(
-            state=initial_state,
+        tree = SearchTree()
+        root = SearchNode(
+            index=tree.add(-1, None),
             depth=0,
-            tactic_sequence=[]
-        ))
+            state=initial_state,
+            key=state_key(initial_state)
+        )
+        heapq.heappush(queue, (self.priority_fn(root), next(counter), root))
 
         # Search
         while queue and num_expansions < self.max_expansions:
-            # Check for timeout
-            elapsed_time = time.time() - start_time
-            if elapsed_time > self.timeout:
-                print(f"{theorem_name}: proof search timed out")
-                return ProofSearchResult(
-                    success = False,
-                    theorem_name = theorem_name,
-                    search_time = elapsed_time,
-                )
-
-            node = queue.popleft()
-            state_pp = node.state.pp
-
-            if state_pp in visited: # already visited
-                continue
-            visited.add(state_pp)
+            # Check time/token budgets, promising searches may get a top-up
+            stop = budget.exceeded()
+            if stop is not None and not (self._promising((n for _, _, n in queue), initial_state) and budget.extend()):
+                print(f"{theorem_name}: proof search stopped ({stop})")
+                return self._make_result(theorem_name, start_time, num_expansions, budget, table, error=stop)
+
+            if self.lookahead > 0:
+                self._prefetch(queue, table, pending, executor)
+            _, _, node = heapq.heappop(queue)
+            state_pp = node.pp
+
             if node.depth >= self.max_depth: # depth limit
                 continue
+            if table.seen(node.key, node.depth): # equivalent state already expanded
+                continue
+            if self.prune_subsumed and table.is_subsumed(node.key):
+                continue
+            table.record(node.key, node.depth)
 
             num_expansions += 1
 
-            # Generate tactics
+            # Generate tactics (Lean keeps working while prefetched requests finish)
             try:
-                suggestions = self.api_client.generate_tactics(state_pp)
+                future = pending.pop(state_pp, None) or executor.submit(self._generate, state_pp)
+                suggestions = self._wait(future, budget,
+                                         lambda: self._promising((n for _, _, n in queue), initial_state))
             except Exception as e:
                 print(f"{theorem_name}: generation failed: {e}")
                 continue
+            if suggestions is None:
+                print(f"{theorem_name}: proof search stopped (timeout)")
+                return self._make_result(theorem_name, start_time, num_expansions, budget, table, error="timeout")
 
             # Try each suggested tactic
-            for suggestion in suggestions:
-                try:
-                    result = dojo.run_tac(node.state, suggestion)
-
-                    if isinstance(result, ProofFinished):
-                        proof_steps = node.tactic_sequence + [suggestion]
-                        elapsed_time = time.time() - start_time
-                        print(f"{theorem_name}: PROVED")
-                        return ProofSearchResult(
-                            success = True,
-                            theorem_name = theorem_name,
-                            proof_steps = proof_steps,
-                            proof_length = len(proof_steps),
-                            search_time = elapsed_time
-                        )
-
-                    elif isinstance(result, TacticState):
-                        if result.pp in visited: # already visisted
-                            continue
-                        queue.append(SearchNode(
-                            state = result,
-                            depth = node.depth+1,
-                            tactic_sequence = node.tactic_sequence + [suggestion]
-                        ))
-
-                    elif isinstance(result, LeanError):
-                        # print("LeanError")
-                        continue
+            tactics = [suggestion for suggestion, _ in suggestions]
+            results = self._run_tactics(dojo, node.state, tactics, cache_scope(theorem))
+            productive = False
+            for (suggestion, score), result in zip(suggestions, results):
+                if isinstance(result, Exception):
+                    print(f"{theorem_name}: run_tac failed: {result}")
+                    print(f"^Suggestion: {suggestion}")
+                    continue
 
-                    elif isinstance(result, ProofGivenUp):
-                        # print("ProofGivenUp")
+                if isinstance(result, (ProofFinished, TacticState)):
+                    productive = True
+
+                if isinstance(result, ProofFinished):
+                    proof_steps = tree.path(node.index) + [suggestion]
+                    print(f"{theorem_name}: PROVED")
+                    return self._make_result(theorem_name, start_time, num_expansions, budget, table,
+                                             proof_steps=proof_steps)
+
+                elif isinstance(result, TacticState):
+                    key = state_key(result)
+                    if table.seen(key, node.depth+1): # already visited
                         continue
+                    child = SearchNode(
+                        index = tree.add(node.index, suggestion),
+                        depth = node.depth+1,
+                        state = result,
+                        score = node.score + score,
+                        key = key
+                    )
+                    heapq.heappush(queue, (self.priority_fn(child), next(counter), child))
 
-                except Exception as e:
-                    print(f"{theorem_name}: run_tac failed: {e}")
-                    print(f"^Suggestion: {suggestion}")
+                elif isinstance(result, LeanError):
+                    # print("LeanError")
+                    continue
+
+                elif isinstance(result, ProofGivenUp):
+                    # print("ProofGivenUp")
                     continue
 
+            if not productive: # every suggestion failed
+                table.mark_failed(node.key)
+
         # Search exhausted
-        elapsed_time = time.time() - start_time
         print(f"{theorem_name}: search exhausted")
-        return ProofSearchResult(
-            success = False,
-            theorem_name = theorem_name,
-            search_time = elapsed_time,
-        )
\ No newline at end of file
+        return self._make_result(theorem_name, start_time, num_expansions, budget, table)
\ No newline at end of file
@@ -0,0 +1,206 @@
+import asyncio
+import fcntl
+import hashlib
+import json
+import os
+import random
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+import httpx
+
+from benchmarking.http_client import HTTPClient
+from benchmarking.instrumentation import CallRecord
+
+
+RETRY_STATUSES = {429, 500, 502, 503, 504} # everything else (incl. 400) goes straight back to the caller
+
+
+class CircuitOpenError(Exception):
+    """The provider/model kept failing, so requests are refused until its cooldown is over"""
+
+
+class RateLimiter:
+    """Request limits for one provider/model, shared by every process on the host
+
+    State lives in a small JSON file under an exclusive flock, so the worker processes
+    (and the LeanCopilot server) draw from the same token bucket. Two limits adapt with
+    AIMD: the bucket's refill rate and the window of requests in flight. Both grow a little
+    on each success and halve on a 429/5xx (at most once per second). After
+    failure_threshold consecutive 5xx/connection errors the circuit opens: requests fail
+    fast for cooldown seconds, then a single probe decides whether it closes again.
+    """
+
+    def __init__(self, name: str, max_rate: float = 10.0, initial_rate: float = 2.0, min_rate: float = 0.5,
+                 max_concurrency: int = 32, failure_threshold: int = 5, cooldown: float = 30.0,
+                 state_dir: Optional[Union[str, Path]] = None):
+        self.name = name # e.g. "openrouter:anthropic/claude-haiku-4.5"
+        self.max_rate = max_rate # requests per second, the provider's known limit
+        self.initial_rate = min(initial_rate, max_rate)
+        self.min_rate = min_rate
+        self.max_concurrency = max_concurrency
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown # seconds
+        state_dir = Path(state_dir) if state_dir is not None else Path(tempfile.gettempdir()) / "leanassist-limits"
+        digest = hashlib.blake2b(name.encode("utf-8"), digest_size=8).hexdigest()
+        self.path = state_dir / f"{digest}.json"
+
+    def _initial(self) -> Dict[str, Any]:
+        return {
+            "rate": self.initial_rate, "tokens": 1.0, "refilled": time.time(),
+            "window": 2.0, "in_flight": {}, "decreased": 0.0,
+            "failures": 0, "open_until": 0.0, "probing": 0.0, # when the half-open probe was sent
+        }
+
+    def _update(self, fn):
+        """Apply fn to the shared state under the file lock"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            raw = os.read(fd, 1 << 16)
+            state = json.loads(raw) if raw else self._initial()
+            result = fn(state)
+            data = json.dumps(state).encode("utf-8")
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.ftruncate(fd, 0)
+            os.write(fd, data)
+            return result
+        finally:
+            os.close(fd) # also drops the lock
+
+    def _try_acquire(self, state: Dict[str, Any]) -> Optional[float]:
+        """0 if a request slot was taken, else seconds until a token is due (-1: circuit open,
+        None: the window is full, which frees up whenever some request returns)"""
+        now = time.time()
+        half_open = bool(state["open_until"])
+        if half_open:
+            if now < state["open_until"]:
+                return -1
+            if now - state["probing"] < self.cooldown: # someone else's probe is still out
+                return 0.5
+
+        # Drop slots held by processes that died mid-request
+        in_flight = {pid: n for pid, n in state["in_flight"].items() if n > 0 and _alive(int(pid))}
+        state["in_flight"] = in_flight
+        if sum(in_flight.values()) >= int(state["window"]):
+            return None
+
+        burst = max(1.0, state["rate"])
+        state["tokens"] = min(burst, state["tokens"] + (now - state["refilled"]) * state["rate"])
+        state["refilled"] = now
+        if state["tokens"] < 1:
+            return (1 - state["tokens"]) / state["rate"]
+        state["tokens"] -= 1
+        if half_open:
+            state["probing"] = now
+        pid = str(os.getpid())
+        in_flight[pid] = in_flight.get(pid, 0) + 1
+        return 0
+
+    async def acquire(self):
+        """Wait for a request slot; raises CircuitOpenError while the circuit is open
+
+        The locked state update runs on a thread, so a contended flock never blocks the event loop.
+        """
+        poll = 0.05 # while the window is full, backing off up to 1s
+        while True:
+            wait = await asyncio.to_thread(self._update, self._try_acquire)
+            if wait == 0:
+                return
+            if wait is None:
+                await asyncio.sleep(poll)
+                poll = min(2 * poll, 1.0)
+                continue
+            if wait < 0:
+                raise CircuitOpenError(f"{self.name}: circuit open after repeated failures")
+            await asyncio.sleep(wait)
+
+    def release(self, status: Optional[int], adapt: bool = True):
+        """Give the slot back and adapt to how the request went (status None: connection error)"""
+        def update(state: Dict[str, Any]):
+            now = time.time()
+            pid = str(os.getpid())
+            state["in_flight"][pid] = max(0, state["in_flight"].get(pid, 0) - 1)
+            if not adapt:
+                return
+
+            if status is not None and status not in RETRY_STATUSES: # provider is keeping up
+                # ~max_rate/50 more per second of successes, like the window's +1 per round trip
+                state["rate"] = min(self.max_rate, state["rate"] + self.max_rate / (50 * max(1.0, state["rate"])))
+                state["window"] = min(self.max_concurrency, state["window"] + 1 / state["window"])
+                state["failures"] = 0
+                state["open_until"] = 0.0
+                state["probing"] = 0.0
+                return
+
+            # Overloaded: back off multiplicatively, once per second so a burst of errors counts once
+            if now - state["decreased"] >= 1.0:
+                state["rate"] = max(self.min_rate, state["rate"] / 2)
+                state["window"] = max(1.0, state["window"] / 2)
+                state["decreased"] = now
+            if status == 429: # throttling is handled by the rate, only errors may mean an outage
+                state["probing"] = 0.0
+                return
+            state["failures"] += 1
+            if state["probing"] or state["failures"] >= self.failure_threshold:
+                state["open_until"] = now + self.cooldown
+                state["probing"] = 0.0
+
+        self._update(update)
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def backoff(attempt: int, base: float = 1.0, cap: float = 30.0) -> float:
+    """Exponential backoff with full jitter"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+async def limited_post(limiter: RateLimiter, url: str, json: Dict[str, Any], headers: Optional[Dict[str, str]] = None,
+                       timeout: Optional[float] = None, max_retries: int = 4, stream=None,
+                       record: Optional[CallRecord] = None) -> httpx.Response:
+    """POST through the limiter, retrying 429/5xx/connection errors with backoff
+
+    Returns the last response once retries run out; the caller decides what a failed status means.
+    With a stream (a CompletionStream, or anything with reset() and feed(line) -> stop), a
+    successful body is fed to it line by line instead of being read into the response.
+    Retries are counted on record, if given.
+    """
+    for attempt in range(max_retries + 1):
+        if attempt > 0 and record is not None:
+            record.retries += 1
+        await limiter.acquire()
+        try:
+            if stream is None:
+                response = await HTTPClient.shared().post(url, json=json, headers=headers, timeout=timeout)
+            else:
+                stream.reset()
+                response = await HTTPClient.shared().post_stream(url, json, headers, timeout, stream.feed)
+        except httpx.TransportError:
+            await asyncio.to_thread(limiter.release, None)
+            if attempt == max_retries:
+                raise
+            await asyncio.sleep(backoff(attempt))
+            continue
+        except BaseException: # cancelled or a bug on our side, says nothing about the provider
+            limiter.release(None, adapt=False) # inline: a cancelled task can't be relied on to await
+            raise
+
+        await asyncio.to_thread(limiter.release, response.status_code)
+        if response.status_code not in RETRY_STATUSES or attempt == max_retries:
+            return response
+        delay = backoff(attempt)
+        retry_after = response.headers.get("retry-after", "")
+        if retry_after.replace(".", "", 1).isdigit():
+            delay = max(delay, float(retry_after))
+        await asyncio.sleep(delay)
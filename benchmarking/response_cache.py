@@ -0,0 +1,104 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Tuple, Union
+
+
+CachedSample = Tuple[str, Optional[float]] # tactic, mean token logprob
+
+MODES = ("read_through", "record", "replay")
+
+
+class ResponseCache:
+    """Content-addressed cache of sampled tactics, keyed by (provider, model, temperature, prompt, sample index)
+
+    Stored in SQLite (WAL) so worker processes can share it. Size is checked whenever this
+    process has written as much as was left under max_bytes at the last check, evicting least
+    recently used entries down to 90% of max_bytes. Modes:
+      read_through: answer from the cache, call the API for misses and store them
+      record: always call the API, overwriting what's stored
+      replay: never call the API, misses just come back empty (offline, deterministic reruns)
+    """
+
+    def __init__(self, path: Union[str, Path], mode: str = "read_through", max_bytes: int = 1 << 30):
+        if mode not in MODES:
+            raise ValueError(f"Unknown response cache mode: {mode}")
+        self.path = str(path)
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self._init_runtime()
+
+    def _init_runtime(self):
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid = None
+        self._room = 0 # bytes left under max_bytes at the last check, so the first put checks
+
+    def __getstate__(self):
+        return {"path": self.path, "mode": self.mode, "max_bytes": self.max_bytes}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_runtime()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses "
+                "(key BLOB PRIMARY KEY, tactic TEXT NOT NULL, logprob REAL, size INTEGER NOT NULL, "
+                "last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def key(self, provider: str, model: str, temperature: float, prompt: str, index: int) -> bytes:
+        text = "\x00".join([provider, model, repr(float(temperature)), prompt, str(index)])
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=20).digest()
+
+    def get(self, key: bytes) -> Optional[CachedSample]:
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT tactic, logprob FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            return row[0], row[1]
+
+    def put(self, key: bytes, sample: CachedSample):
+        tactic, logprob = sample
+        size = len(key) + len(tactic.encode("utf-8")) + 8
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, tactic, logprob, size, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, tactic, logprob, size, time.time()),
+            )
+            self._room -= size
+            if self._room < 0:
+                self._room = self.max_bytes - self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection) -> int:
+        """Drop least recently used entries until under max_bytes, returning the size left"""
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return total
+        excess = total - int(0.9 * self.max_bytes) # leave some headroom so this doesn't run every check
+        freed = 0
+        doomed = []
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_used"):
+            doomed.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+        return total - freed
@@ -0,0 +1,91 @@
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Union
+
+
+class ResultLog:
+    """Append-only results.jsonl, one JSON line per theorem, fsynced in batches
+
+    Each result goes out as one write() of a whole line on an O_APPEND descriptor, so a
+    crash can at most leave a torn last line. open() cuts such a line off before appending,
+    and load() skips anything unparseable. The data reaches disk every fsync_every results
+    or fsync_interval seconds, and on close().
+    """
+
+    def __init__(self, path: Union[str, Path], fsync_every: int = 20, fsync_interval: float = 30.0):
+        self.path = Path(path)
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval # seconds
+        self._fd: Optional[int] = None
+        self._unsynced = 0
+        self._synced_at = 0.0
+
+    def load(self) -> Dict[str, dict]:
+        """Recorded results by theorem name, the latest one winning if a theorem appears twice"""
+        results: Dict[str, dict] = {}
+        if not self.path.exists():
+            return results
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except json.JSONDecodeError: # torn write from a crash
+                    continue
+                results[result["theorem_name"]] = result
+        return results
+
+    def open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        # Drop a torn last line so the next result starts on a line of its own
+        size = os.lseek(self._fd, 0, os.SEEK_END)
+        if size:
+            with open(self.path, "rb") as f:
+                f.seek(max(0, size - (1 << 20)))
+                tail = f.read()
+            cut = tail.rfind(b"\n")
+            if not tail.endswith(b"\n") and (cut != -1 or len(tail) == size):
+                os.ftruncate(self._fd, size - len(tail) + cut + 1)
+        self._synced_at = time.monotonic()
+
+    def append(self, result: dict):
+        os.write(self._fd, (json.dumps(result) + "\n").encode("utf-8"))
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_every or time.monotonic() - self._synced_at >= self.fsync_interval:
+            self.sync()
+
+    def sync(self):
+        if self._fd is not None and self._unsynced:
+            os.fsync(self._fd)
+        self._unsynced = 0
+        self._synced_at = time.monotonic()
+
+    def close(self):
+        if self._fd is None:
+            return
+        self.sync()
+        os.close(self._fd)
+        self._fd = None
+
+    def __enter__(self) -> "ResultLog":
+        self.open()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def merge_results(paths: Iterable[Union[str, Path]]) -> Dict[str, dict]:
+    """Results from several nodes' results files by theorem name
+
+    A theorem appears twice only when its lease expired while its first node was still on it.
+    A success beats a failure; otherwise the first file (in sorted order) wins.
+    """
+    merged: Dict[str, dict] = {}
+    for path in sorted(Path(p) for p in paths):
+        for name, result in ResultLog(path).load().items():
+            if name not in merged or (result["success"] and not merged[name]["success"]):
+                merged[name] = result
+    return merged
@@ -0,0 +1,102 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+
+T = TypeVar("T")
+
+
+class BackendHealth:
+    """EWMA latency and error rate of one backend, taken out of rotation after repeated failures"""
+
+    def __init__(self, alpha: float = 0.2, failure_threshold: int = 3, cooldown: float = 30.0):
+        self.alpha = alpha # weight of the newest observation
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown # seconds a failing backend sits out
+        self.latency: Optional[float] = None # seconds, None until the first success
+        self.error_rate = 0.0
+        self.failures = 0 # consecutive
+        self.down_until = 0.0
+
+    def observe(self, latency: float, ok: bool):
+        self.error_rate += self.alpha * ((0.0 if ok else 1.0) - self.error_rate)
+        if ok:
+            self.latency = latency if self.latency is None else self.latency + self.alpha * (latency - self.latency)
+            self.failures = 0
+            self.down_until = 0.0
+            return
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            self.down_until = time.monotonic() + self.cooldown
+
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.down_until
+
+    def cost(self) -> float:
+        """Expected seconds per successful request (0 while untried, so every backend gets measured)"""
+        if self.latency is None:
+            return 0.0
+        return self.latency / max(1.0 - self.error_rate, 0.05)
+
+
+class Router:
+    """Sends samples to the currently fastest healthy backend of one logical model, failing over to the rest
+
+    Backends are indices into the caller's own list (API clients or runners). With spread on,
+    samples are split across healthy backends in proportion to their speed instead, which
+    keeps every backend's estimate fresh.
+    """
+
+    def __init__(self, names: List[str], spread: bool = False, alpha: float = 0.2, failure_threshold: int = 3,
+                 cooldown: float = 30.0):
+        self.names = names # e.g. "openrouter:deepseek/deepseek-v3.2", for stats
+        self.spread = spread
+        self.health = [BackendHealth(alpha, failure_threshold, cooldown) for _ in names]
+
+    def ranked(self) -> List[int]:
+        """Healthy backends fastest first, then the ones sitting out (soonest back first)"""
+        healthy = sorted((i for i, h in enumerate(self.health) if h.healthy()), key=lambda i: self.health[i].cost())
+        down = sorted((i for i, h in enumerate(self.health) if not h.healthy()), key=lambda i: self.health[i].down_until)
+        return healthy + down
+
+    def split(self, n: int) -> List[Tuple[int, int]]:
+        """(backend, samples) for n samples"""
+        order = self.ranked()
+        healthy = [i for i in order if self.health[i].healthy()] or order[:1]
+        if not self.spread or n == 1 or len(healthy) == 1:
+            return [(healthy[0], n)]
+        speeds = [1.0 / max(self.health[i].cost(), 1e-3) for i in healthy]
+        shares = [int(n * speed / sum(speeds)) for speed in speeds]
+        shares[0] += n - sum(shares) # rounding leftovers go to the fastest
+        return [(i, k) for i, k in zip(healthy, shares) if k > 0]
+
+    async def route(self, n: int, sample: Callable[[int, int], Awaitable[List[T]]]) -> List[T]:
+        """Up to n samples, sample(backend, k) drawing k from one backend; shortfalls fail over"""
+        plan = self.split(n)
+        tried = {i for i, _ in plan}
+        results = await asyncio.gather(*(self._attempt(i, k, sample) for i, k in plan))
+        samples = [s for result in results for s in result]
+        for i in self.ranked():
+            if len(samples) >= n:
+                break
+            if i in tried:
+                continue
+            tried.add(i)
+            samples += await self._attempt(i, n - len(samples), sample)
+        return samples
+
+    async def _attempt(self, i: int, k: int, sample: Callable[[int, int], Awaitable[List[T]]]) -> List[T]:
+        start = time.monotonic()
+        try:
+            result = await sample(i, k)
+        except Exception as e:
+            print(f"{self.names[i]} failed: {e}")
+            result = []
+        self.health[i].observe(time.monotonic() - start, bool(result))
+        return result
+
+    def stats(self) -> Dict[str, Dict[str, Optional[float]]]:
+        return {
+            name: {"latency": h.latency, "error_rate": h.error_rate, "healthy": h.healthy()}
+            for name, h in zip(self.names, self.health)
+        }
@@ -23,6 +23,43 @@ def main():
     data_type = "test"                       # options: "train", "val", "test"
     num_samples = 10                        # n tactics to generate at each proof state (breadth of search)
     num_workers = 4                         # concurrency
+    group_by_file = True                    # keep workers on one source file at a time (parsed once per worker)
+    llm_gateway = False                     # one async process makes all LLM calls, so workers don't each hold a connection
+    llm_concurrency = 64                    # LLM requests in flight across all workers (with llm_gateway)
+    adaptive_sampling = False               # stop early when samples repeat, sample more on hard states
+    max_requests_per_second = 10.0          # provider's rate limit for this model, shared across workers
+    hedge_percentile = None                 # e.g. 0.95 to re-send requests slower than 95% of recent ones
+    hedge_provider = None                   # e.g. "openrouter" to send those duplicates elsewhere (same model)
+    hedge_model = None                      # model id on hedge_provider, if it differs
+    stream = False                          # stop reading each response once its tactic is complete
+    routes = []                             # other hosts of the same model, e.g. [("openrouter", "qwen/qwen3-8b")]
+    route_split = False                     # with routes: split samples by speed instead of all to the fastest
+    base_url = None                         # e.g. "http://127.0.0.1:8000/v1" for the offline stand-in (benchmarking/local_llm_server.py)
+    local_model = None                      # e.g. "kaiyuy/leandojo-lean4-tacgen-byt5-small" to run a LeanCopilot model in-process (no API)
+    local_model_type = "encoder_decoder"    # options: "encoder_decoder", "decoder_only", "pythia"
+    local_batch_size = 16                   # n proof states per batched generate call (use lookahead/mcts_batch_size to fill it)
+    max_tokens = None                       # e.g. 256, output token cap per sample
+    search_strategy = "bfs"                 # options: "bfs", "best_first", "mcts"
+    lookahead = 0                           # n generation requests in flight ahead of Lean (0 = serial)
+    dojo_procs = 1                          # n Lean REPLs per theorem checking suggestions in parallel
+    memory_budget_gb = None                 # RAM all Lean REPLs may use together, e.g. 48 on a 64 GB box (None = no limit)
+    repl_memory_gb = 8.0                    # first guess at one REPL's peak memory (Mathlib imports take several GB)
+    max_oom_retries = 2                     # times an OOM-killed theorem gets requeued with fewer running at once
+    prune_subsumed = False                  # prune states containing every goal of an already-failed state
+    and_or = False                          # solve independent goals as separate cached subproblems
+    value_fn = "goal_count"                 # mcts only, options: "goal_count", "goal_length"
+    mcts_batch_size = 4                     # mcts only, n leaves expanded together per iteration
+    tactic_cache = None                     # e.g. "benchmarking/cache/tactics.db" to skip known-failing tactics across runs
+    response_cache = None                   # e.g. "benchmarking/cache/responses.db" to reuse LLM samples across runs
+    response_cache_mode = "read_through"    # options: "read_through", "record", "replay" (offline, no API calls)
+    timeout = 300                           # hard seconds per theorem (REPL gets killed past it)
+    max_tokens_per_theorem = None           # e.g. 200_000
+    max_dollars_per_run = None              # e.g. 20.0, stops starting new theorems once spent
+    prices = (0.0, 0.0)                     # $ per 1M (prompt, completion) tokens, for dollar budgets
+    redistribute_budget = True              # give time/tokens left by easy theorems to promising hard ones
+    resume = False                          # skip theorems already in this output's results.jsonl (after a crash/Ctrl-C)
+    work_queue = None                       # e.g. "/mnt/shared/queue.db": run this same config on several boxes to split the work
+    lease_seconds = 120.0                   # a box silent this long has its theorems picked up by the others
     example_limit = 100                       # n examples to evaluate on from dataset
     # -------------------
 
@@ -36,6 +73,44 @@ def main():
         output_path = output_path,
         num_samples = num_samples,
         num_workers = num_workers,
+        group_by_file = group_by_file,
+        llm_gateway = llm_gateway,
+        llm_concurrency = llm_concurrency,
+        adaptive_sampling = adaptive_sampling,
+        max_requests_per_second = max_requests_per_second,
+        hedge_percentile = hedge_percentile,
+        hedge_provider = hedge_provider,
+        hedge_model = hedge_model,
+        hedge_api_key = API_KEYS.get(hedge_provider),
+        stream = stream,
+        routes = [(p, m, API_KEYS[p]) for p, m in routes],
+        route_split = route_split,
+        base_url = base_url,
+        local_model = local_model,
+        local_model_type = local_model_type,
+        local_batch_size = local_batch_size,
+        resume = resume,
+        work_queue = work_queue,
+        lease_seconds = lease_seconds,
+        max_tokens = max_tokens,
+        search_strategy = search_strategy,
+        lookahead = lookahead,
+        dojo_procs = dojo_procs,
+        memory_budget_gb = memory_budget_gb,
+        repl_memory_gb = repl_memory_gb,
+        max_oom_retries = max_oom_retries,
+        prune_subsumed = prune_subsumed,
+        and_or = and_or,
+        value_fn = value_fn,
+        mcts_batch_size = mcts_batch_size,
+        tactic_cache = tactic_cache,
+        response_cache = response_cache,
+        response_cache_mode = response_cache_mode,
+        timeout = timeout,
+        max_tokens_per_theorem = max_tokens_per_theorem,
+        max_dollars_per_run = max_dollars_per_run,
+        prices = prices,
+        redistribute_budget = redistribute_budget,
     )
 
     evaluator = Evaluator(config)
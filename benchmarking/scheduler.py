@@ -0,0 +1,351 @@
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from multiprocessing.managers import SyncManager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+import psutil
+from lean_dojo import Dojo, DojoPool
+from lean_dojo.interaction.dojo import kill_descendants
+
+
+class BudgetPool:
+    """Run-wide spend plus the spare time/tokens left behind by theorems that finished early
+
+    Backed by manager proxies, so it can be pickled into worker processes and shared live.
+    """
+
+    def __init__(self, manager: SyncManager, max_tokens: Optional[int] = None, max_dollars: Optional[float] = None):
+        self.max_tokens = max_tokens # per run
+        self.max_dollars = max_dollars # per run
+        self._lock = manager.Lock()
+        self._state = manager.dict(spare_seconds=0.0, spare_tokens=0, run_tokens=0, run_dollars=0.0)
+
+    def deposit(self, seconds: float, tokens: int):
+        """Give back what a theorem didn't use"""
+        with self._lock:
+            self._state["spare_seconds"] += max(seconds, 0.0)
+            self._state["spare_tokens"] += max(tokens, 0)
+
+    def withdraw(self, seconds: float, tokens: int) -> Tuple[float, int]:
+        """Take up to this much spare budget, returning what was granted"""
+        with self._lock:
+            granted_seconds = min(seconds, self._state["spare_seconds"])
+            granted_tokens = min(tokens, self._state["spare_tokens"])
+            self._state["spare_seconds"] -= granted_seconds
+            self._state["spare_tokens"] -= granted_tokens
+        return granted_seconds, granted_tokens
+
+    def charge(self, tokens: int, dollars: float):
+        """Add a finished theorem's spend to the run totals"""
+        with self._lock:
+            self._state["run_tokens"] += tokens
+            self._state["run_dollars"] += dollars
+
+    def exhausted(self) -> Optional[str]:
+        """Which run-wide limit has been hit, if any"""
+        if self.max_tokens is not None and self._state["run_tokens"] >= self.max_tokens:
+            return "run_token_budget"
+        if self.max_dollars is not None and self._state["run_dollars"] >= self.max_dollars:
+            return "run_dollar_budget"
+        return None
+
+
+class TheoremBudget:
+    """Hard per-theorem limits on wall clock, API tokens and dollars
+
+    The clock starts with start(), not at construction, so Dojo setup isn't charged. Token
+    use is read from the API client's running totals. When a limit is hit on a search that
+    still looks promising, extend() tops it up from the run's BudgetPool; release() hands
+    whatever is left back to the pool. watch() kills the REPL once the deadline has passed,
+    so a hanging tactic can't run into the much longer Dojo timeout.
+    """
+
+    def __init__(self, seconds: float, max_tokens: Optional[int] = None, max_dollars: Optional[float] = None,
+                 prices: Tuple[float, float] = (0.0, 0.0), pool: Optional[BudgetPool] = None,
+                 max_extensions: int = 2, grace: float = 2.0):
+        self.seconds = seconds
+        self.max_tokens = max_tokens
+        self.max_dollars = max_dollars
+        self.prices = prices # $ per 1M (prompt, completion) tokens
+        self.pool = pool
+        self.max_extensions = max_extensions
+        self.grace = grace # seconds past the deadline before the REPL gets killed
+        self.extensions = 0
+        self.killed = False
+        self.deadline = time.monotonic() + seconds
+        self._usage_fn: Callable[[], Tuple[int, int]] = lambda: (0, 0)
+        self._baseline = (0, 0)
+
+    def start(self, usage_fn: Callable[[], Tuple[int, int]]):
+        """Start the clock and take a token baseline from usage_fn (prompt, completion totals)"""
+        self.deadline = time.monotonic() + self.seconds
+        self._usage_fn = usage_fn
+        self._baseline = usage_fn()
+
+    def remaining(self) -> float:
+        return self.deadline - time.monotonic()
+
+    def usage(self) -> Tuple[int, int]:
+        """(prompt, completion) tokens used since start()"""
+        prompt, completion = self._usage_fn()
+        return prompt - self._baseline[0], completion - self._baseline[1]
+
+    @property
+    def tokens_used(self) -> int:
+        return sum(self.usage())
+
+    @property
+    def dollars_used(self) -> float:
+        prompt, completion = self.usage()
+        return (prompt * self.prices[0] + completion * self.prices[1]) / 1e6
+
+    def exceeded(self) -> Optional[str]:
+        """Which limit has been hit, if any"""
+        if self.remaining() <= 0:
+            return "timeout"
+        if self.max_tokens is not None and self.tokens_used >= self.max_tokens:
+            return "token_budget"
+        if self.max_dollars is not None and self.dollars_used >= self.max_dollars:
+            return "dollar_budget"
+        if self.pool is not None:
+            return self.pool.exhausted()
+        return None
+
+    def extend(self) -> bool:
+        """Top up the exceeded limit from the pool; False if nothing could be granted"""
+        if self.pool is None or self.killed or self.extensions >= self.max_extensions:
+            return False
+        reason = self.exceeded()
+        if reason == "timeout":
+            seconds, _ = self.pool.withdraw(self.seconds, 0)
+            self.deadline = max(self.deadline, time.monotonic()) + seconds
+        elif reason == "token_budget":
+            _, tokens = self.pool.withdraw(0, self.max_tokens)
+            self.max_tokens += tokens
+        else: # dollar and run limits are hard
+            return False
+        self.extensions += 1
+        return self.exceeded() is None
+
+    def release(self):
+        """Return unused time/tokens to the pool and charge the run"""
+        if self.pool is None:
+            return
+        spare_tokens = self.max_tokens - self.tokens_used if self.max_tokens is not None else 0
+        self.pool.deposit(self.remaining(), spare_tokens)
+        self.pool.charge(self.tokens_used, self.dollars_used)
+
+    @contextmanager
+    def watch(self, dojo: Union[Dojo, DojoPool]) -> Iterator[None]:
+        """Kill the REPL process(es) if the search is still in Lean after the deadline"""
+        done = threading.Event()
+
+        def watchdog():
+            while not done.wait(0.5):
+                if self.remaining() < -self.grace:
+                    self.killed = True
+                    for d in (dojo.dojos if isinstance(dojo, DojoPool) else [dojo]):
+                        if hasattr(d, "proc"):
+                            kill_descendants(d.proc.pid)
+                    return
+
+        thread = threading.Thread(target=watchdog, daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            done.set()
+
+
+class FileScheduler:
+    """Hands out theorems grouped by source file, so each worker stays on one file while it can
+
+    Theorems from the same (repo, file) reuse the repo handle and parsed TracedFile kept warm
+    in the worker process that proves them. A worker drains the group it owns, then claims the
+    largest unclaimed group, then steals the back half of the largest group another worker is
+    still on. Backed by manager proxies like BudgetPool, so workers share it live.
+    """
+
+    def __init__(self, manager: SyncManager, examples: List[Dict[str, str]], by_file: bool = True):
+        groups: Dict[Tuple[str, ...], List[Dict[str, str]]] = {}
+        for ex in examples:
+            key = (ex['url'], ex['commit'], ex['file_path']) if by_file else (ex['full_name'],)
+            groups.setdefault(key, []).append(ex)
+        ordered = sorted(groups.values(), key=len, reverse=True) # stable, so dataset order without by_file
+        self.num_groups = len(ordered)
+        # Theorems sit in one slot each so a worker fetches only the one it takes; a group is
+        # the [start, end) range of slots it has left
+        ranges, flat = {}, []
+        for gid, group in enumerate(ordered):
+            ranges[gid] = (len(flat), len(flat) + len(group))
+            flat += group
+        self._lock = manager.Lock()
+        self._theorems = manager.dict(enumerate(flat)) # slot -> theorem
+        self._ranges = manager.dict(ranges) # group id -> slots left
+        self._owners = manager.dict() # worker id -> group id
+        self._state = manager.dict(next_id=len(ordered), next_slot=len(flat), steals=0)
+
+    def next(self, worker: int) -> Optional[Dict[str, str]]:
+        """The worker's next theorem, or None once there is nothing left to take"""
+        with self._lock:
+            gid = self._owners.get(worker)
+            start, end = self._ranges.get(gid, (0, 0))
+            if start == end:
+                gid = self._claim(worker, gid)
+                if gid is None:
+                    return None
+                start, end = self._ranges[gid]
+            self._ranges[gid] = (start + 1, end)
+            return self._theorems.pop(start)
+
+    def _claim(self, worker: int, finished: Optional[int]) -> Optional[int]:
+        """A new group for the worker (under the lock): the largest unclaimed one, else half of the largest"""
+        if finished is not None:
+            self._ranges.pop(finished, None)
+        ranges = self._ranges.copy() # ids and bounds only, and only when a group runs out
+        owned = set(self._owners.values())
+        unclaimed = [g for g in ranges if g not in owned and ranges[g][0] < ranges[g][1]]
+        size = lambda g: ranges[g][1] - ranges[g][0]
+        if unclaimed:
+            gid = max(unclaimed, key=lambda g: (size(g), -g))
+        else:
+            victim = max(ranges, key=size, default=None)
+            if victim is None or size(victim) < 2:
+                self._owners.pop(worker, None)
+                return None
+            start, end = ranges[victim]
+            split = start + (end - start + 1) // 2 # the victim keeps the front half
+            self._ranges[victim] = (start, split)
+            gid = self._state["next_id"]
+            self._ranges[gid] = (split, end)
+            self._state["next_id"] = gid + 1
+            self._state["steals"] += 1
+        self._owners[worker] = gid
+        return gid
+
+    def requeue(self, example: Dict[str, str]):
+        """Put a theorem back as a group of its own, for whichever worker is free next"""
+        with self._lock:
+            gid, slot = self._state["next_id"], self._state["next_slot"]
+            self._theorems[slot] = example
+            self._ranges[gid] = (slot, slot + 1)
+            self._state.update(next_id=gid + 1, next_slot=slot + 1)
+
+    def stop(self):
+        """Hand out nothing more (workers finish the theorem they are on)"""
+        with self._lock:
+            self._ranges.clear()
+            self._theorems.clear()
+
+    def steals(self) -> int:
+        return self._state["steals"]
+
+
+def repls(dojo: Union[Dojo, DojoPool]) -> List[Dojo]:
+    """The Dojo(s) with a running REPL process behind dojo"""
+    return [d for d in (dojo.dojos if isinstance(dojo, DojoPool) else [dojo]) if hasattr(d, "proc")]
+
+
+def oom_killed(dojo: Union[Dojo, DojoPool], budget: Optional[TheoremBudget] = None) -> bool:
+    """Whether a REPL behind dojo died of an OOM kill (exit 137, as LeanDojo reads it)
+
+    Not if budget's watchdog killed it: that kills lean before lake, and lake then exits 137 too.
+    """
+    if budget is not None and budget.killed:
+        return False
+    return any(not d.proc.isalive() and d.proc.exitstatus == 137 for d in repls(dojo))
+
+
+def repl_rss(dojo: Union[Dojo, DojoPool]) -> int:
+    """Resident bytes of the REPL process trees (lake, lean and their children)"""
+    total = 0
+    for d in repls(dojo):
+        try:
+            root = psutil.Process(d.proc.pid)
+            procs = [root] + root.children(recursive=True)
+        except psutil.NoSuchProcess:
+            continue
+        for proc in procs:
+            try:
+                total += proc.memory_info().rss
+            except psutil.NoSuchProcess:
+                pass
+    return total
+
+
+class MemoryGovernor:
+    """Admits a theorem's REPLs only once the Lean memory budget has room for them
+
+    A running theorem holds the larger of its estimate and its REPLs' sampled RSS. A new one
+    is admitted when what the others hold plus its estimate fits budget_bytes (and fewer than
+    max_sessions are running), or when nothing else is running. The per-REPL estimate starts
+    at repl_bytes and grows to the largest peak measured. After an OOM kill, max_sessions
+    drops below what was running. Manager-backed like BudgetPool; workers key in by pid.
+    """
+
+    def __init__(self, manager: SyncManager, budget_bytes: Optional[float], repl_bytes: float, max_sessions: int):
+        self.budget_bytes = budget_bytes if budget_bytes is not None else math.inf
+        self._lock = manager.Lock()
+        self._held = manager.dict() # worker pid -> bytes held
+        self._state = manager.dict(repl_bytes=repl_bytes, max_sessions=max_sessions, ooms=0)
+
+    def admit(self, procs: int = 1, poll: float = 0.5) -> float:
+        """Block until procs more REPLs fit, returning the seconds waited"""
+        pid = os.getpid()
+        start = time.monotonic()
+        while True:
+            with self._lock:
+                need = procs * self._state["repl_bytes"]
+                held = self._held.copy()
+                held.pop(pid, None)
+                if not held or (len(held) < self._state["max_sessions"]
+                                and sum(held.values()) + need <= self.budget_bytes):
+                    self._held[pid] = need
+                    return time.monotonic() - start
+            time.sleep(poll)
+
+    def release(self):
+        with self._lock:
+            self._held.pop(os.getpid(), None)
+
+    def oom(self) -> int:
+        """Record an OOM kill and lower the concurrency cap, returning the new cap"""
+        with self._lock:
+            running = len(self._held) + (os.getpid() not in self._held) # the killed theorem may be released already
+            self._state["max_sessions"] = max(1, min(self._state["max_sessions"], running) - 1)
+            self._state["ooms"] += 1
+            return self._state["max_sessions"]
+
+    def stats(self) -> Tuple[int, int, float]:
+        """(OOM kills, current concurrency cap, per-REPL estimate in bytes)"""
+        return self._state["ooms"], self._state["max_sessions"], self._state["repl_bytes"]
+
+    @contextmanager
+    def watch(self, dojo: Union[Dojo, DojoPool], interval: float = 1.0) -> Iterator[Dict[str, int]]:
+        """Sample the REPLs' RSS while the theorem runs; yields {"peak": bytes} for the caller to read after"""
+        pid = os.getpid()
+        procs = max(1, len(repls(dojo)))
+        usage = {"peak": 0}
+        done = threading.Event()
+
+        def sample():
+            while True:
+                rss = repl_rss(dojo)
+                usage["peak"] = max(usage["peak"], rss)
+                with self._lock:
+                    if pid in self._held:
+                        self._held[pid] = max(procs * self._state["repl_bytes"], rss)
+                if done.wait(interval):
+                    return
+
+        thread = threading.Thread(target=sample, daemon=True)
+        thread.start()
+        try:
+            yield usage
+        finally:
+            done.set()
+            thread.join()
+            with self._lock:
+                self._state["repl_bytes"] = max(self._state["repl_bytes"], usage["peak"] / procs)
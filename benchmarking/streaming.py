@@ -0,0 +1,106 @@
+import json
+from typing import Any, Dict, List, Optional
+import httpx
+
+from benchmarking.instrumentation import CallRecord
+from benchmarking.rate_limiter import RateLimiter, limited_post
+
+
+def complete_tactic(text: str) -> Optional[str]:
+    """The tactic in a partial response once it can't change anymore, else None
+
+    Mirrors extract_tactic, where the first ```lean block wins over an `inline span` even
+    if the span comes first. A block can always still follow, so only a closed ```lean
+    block settles the tactic early; anything else needs the full text.
+    """
+    start = text.find("```lean")
+    if start == -1:
+        return None
+    end = text.find("```", start + len("```lean"))
+    return text[start + len("```lean"):end].strip() if end != -1 else None
+
+
+class CompletionStream:
+    """Assembles a streamed (SSE) chat completion, one or n choices
+
+    feed() takes the body line by line and says when to stop reading: once every choice
+    has a complete tactic or hit max_tokens. Cut-off choices cost no further output tokens,
+    but the provider then never sends its usage chunk, so completion tokens are counted
+    from the stream instead.
+    """
+
+    def __init__(self, n: int = 1, max_tokens: Optional[int] = None, prompt_tokens: Optional[int] = None):
+        self.n = n
+        self.max_tokens = max_tokens # per choice
+        self.prompt_tokens = prompt_tokens # estimate, for when the usage chunk never comes
+        self.reset()
+
+    def reset(self):
+        """Forget a partial stream (before a retry)"""
+        self.content: Dict[int, List[str]] = {}
+        self.logprobs: Dict[int, List[float]] = {}
+        self.tokens: Dict[int, int] = {}
+        self.done = set() # choices that finished or got cut off
+        self.cut = set() # choices cut off by us
+        self.usage: Optional[Dict[str, Any]] = None
+
+    def feed(self, line: str) -> bool:
+        """Process one line of the body, True once the rest isn't needed"""
+        if not line.startswith("data:"):
+            return False
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            return True
+        chunk = json.loads(data)
+        if chunk.get("usage"):
+            self.usage = chunk["usage"]
+        for choice in chunk.get("choices") or []:
+            index = choice.get("index", 0)
+            if index in self.done:
+                continue
+            delta = (choice.get("delta") or {}).get("content") or ""
+            token_logprobs = [t["logprob"] for t in ((choice.get("logprobs") or {}).get("content") or [])]
+            self.content.setdefault(index, []).append(delta)
+            self.logprobs.setdefault(index, []).extend(token_logprobs)
+            self.tokens[index] = self.tokens.get(index, 0) + (len(token_logprobs) or (1 if delta else 0))
+            if choice.get("finish_reason"):
+                self.done.add(index)
+            elif ("`" in delta and complete_tactic("".join(self.content[index])) is not None) or \
+                    (self.max_tokens is not None and self.tokens[index] >= self.max_tokens):
+                self.done.add(index)
+                self.cut.add(index)
+        # Stop early only if something was cut, otherwise read on for the usage chunk
+        return len(self.done) >= self.n and bool(self.cut)
+
+    def body(self) -> Dict[str, Any]:
+        """The equivalent non-streamed response body"""
+        choices = []
+        for index in sorted(self.content):
+            choice = {"index": index, "message": {"content": "".join(self.content[index])}}
+            if self.logprobs[index]:
+                choice["logprobs"] = {"content": [{"logprob": logprob} for logprob in self.logprobs[index]]}
+            choices.append(choice)
+        usage = self.usage
+        if usage is None or self.cut:
+            usage = {
+                "prompt_tokens": (usage or {}).get("prompt_tokens", self.prompt_tokens),
+                "completion_tokens": sum(self.tokens.values()),
+            }
+        return {"choices": choices, "usage": usage}
+
+
+async def streamed_post(limiter: RateLimiter, url: str, json: Dict[str, Any], headers: Optional[Dict[str, str]] = None,
+                        timeout: Optional[float] = None, max_retries: int = 4,
+                        max_tokens: Optional[int] = None, record: Optional[CallRecord] = None) -> httpx.Response:
+    """limited_post for a chat completion, streamed and closed as soon as its tactics are complete
+
+    Returns a response with the assembled, non-streamed body, so callers handle both alike.
+    """
+    payload = dict(json, stream=True, stream_options={"include_usage": True})
+    prompt_chars = sum(len(message["content"]) for message in json["messages"])
+    stream = CompletionStream(json.get("n", 1), max_tokens, prompt_tokens=prompt_chars // 4) # ~4 chars per token
+    response = await limited_post(limiter, url, json=payload, headers=headers, timeout=timeout,
+                                  max_retries=max_retries, stream=stream, record=record)
+    if response.status_code != 200:
+        return response
+    return httpx.Response(200, json=stream.body(), request=response.request)
@@ -0,0 +1,134 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Union
+from lean_dojo import Theorem, TacticState, TacticResult, ProofFinished, LeanError, ProofGivenUp
+
+
+_SPACE_REGEX = re.compile(r"[ \t]+")
+
+CachedEntry = Tuple[str, str] # (kind, error message or resulting state text)
+
+
+def _state_text(pp: str) -> str:
+    """State text used in the key: exact goals, order and hypothesis names (tactics mention them), spacing normalized"""
+    return "\n".join(_SPACE_REGEX.sub(" ", line).strip() for line in pp.strip().split("\n"))
+
+
+def cache_scope(theorem: Theorem) -> str:
+    """What a cached result is valid for: the file's environment at this commit"""
+    return f"{theorem.repo.commit}:{theorem.file_path}"
+
+
+class TacticCache:
+    """Cross-theorem cache of tactic results: SQLite in WAL mode on disk, LRU in memory
+
+    Safe to share between worker processes. Each process opens its own connection lazily,
+    so an instance can be pickled into workers. Entries are scoped to one source file (see
+    cache_scope), since imports, opens and local notation change what a tactic does. Errors
+    and give-ups are answered from the cache without touching the REPL. Closes still go to
+    Lean, so no proof is reported that Lean didn't check, and new states need real ids.
+    """
+
+    _shared: Dict[str, "TacticCache"] = {}
+
+    def __init__(self, path: Union[str, Path], lru_size: int = 100_000):
+        self.path = str(path)
+        self.lru_size = lru_size
+        self._init_runtime()
+
+    @classmethod
+    def shared(cls, path: Union[str, Path]) -> "TacticCache":
+        """One instance per path per process, so the LRU stays warm across theorems"""
+        key = str(path)
+        if key not in cls._shared:
+            cls._shared[key] = cls(key)
+        return cls._shared[key]
+
+    def _init_runtime(self):
+        self._lru: "OrderedDict[bytes, CachedEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid = None
+
+    def __getstate__(self):
+        return {"path": self.path, "lru_size": self.lru_size}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_runtime()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tactic_results "
+                "(key BLOB PRIMARY KEY, kind TEXT NOT NULL, text TEXT NOT NULL)"
+            )
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def _key(self, scope: str, state_pp: str, tactic: str) -> bytes:
+        text = "\x00".join([scope, _state_text(state_pp), tactic.strip()])
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=20).digest()
+
+    def get(self, scope: str, state_pp: str, tactic: str) -> Optional[CachedEntry]:
+        """Cached (kind, text) for this tactic on this state, if any"""
+        key = self._key(scope, state_pp, tactic)
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is not None:
+                self._lru.move_to_end(key)
+                return entry
+            row = self._connection().execute(
+                "SELECT kind, text FROM tactic_results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                entry = (row[0], row[1])
+                self._remember(key, entry)
+            return entry
+
+    def put(self, scope: str, state_pp: str, tactic: str, result: TacticResult):
+        """Record the result of running tactic on state"""
+        if isinstance(result, LeanError):
+            entry = ("error", result.error)
+        elif isinstance(result, ProofFinished):
+            entry = ("finished", "")
+        elif isinstance(result, ProofGivenUp):
+            entry = ("given_up", "")
+        elif isinstance(result, TacticState):
+            entry = ("state", result.pp)
+        else:
+            return
+        key = self._key(scope, state_pp, tactic)
+        with self._lock:
+            self._remember(key, entry)
+            self._connection().execute(
+                "INSERT OR REPLACE INTO tactic_results (key, kind, text) VALUES (?, ?, ?)",
+                (key, entry[0], entry[1]),
+            )
+
+    def lookup(self, scope: str, state_pp: str, tactic: str) -> Optional[TacticResult]:
+        """Result to use instead of running the tactic, or None if it has to go to Lean"""
+        entry = self.get(scope, state_pp, tactic)
+        # new states need a real id from the REPL, and a proof only counts once Lean has checked it
+        if entry is None or entry[0] in ("state", "finished"):
+            return None
+        kind, text = entry
+        if kind == "error":
+            return LeanError(text)
+        return ProofGivenUp()
+
+    def _remember(self, key: bytes, entry: CachedEntry):
+        self._lru[key] = entry
+        self._lru.move_to_end(key)
+        if len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
@@ -0,0 +1,102 @@
+import hashlib
+import re
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, List, Tuple
+from lean_dojo import Goal, TacticState
+
+
+# Characters that can continue a Lean identifier, incl. inaccessible-name marks (x✝¹)
+_IDENT_CHARS = r"\w'!?✝⁰¹²³⁴⁵⁶⁷⁸⁹₀₁₂₃₄₅₆₇₈₉"
+_SPACE_REGEX = re.compile(r"\s+")
+
+
+@dataclass(frozen=True)
+class StateKey:
+    """Canonical identity of a tactic state"""
+    digest: bytes # hash of the sorted canonical goals
+    goals: FrozenSet[bytes] # hash of each canonical goal, for subsumption
+
+
+def _rename(text: str, names: Dict[str, str]) -> str:
+    """Rename whole-identifier occurrences (a trailing `.field` projection still matches)"""
+    if not names:
+        return text
+    alternatives = "|".join(re.escape(name) for name in sorted(names, key=len, reverse=True))
+    pattern = re.compile(rf"(?<![{_IDENT_CHARS}.])({alternatives})(?![{_IDENT_CHARS}])")
+    return pattern.sub(lambda m: names[m.group(1)], text)
+
+
+def canonical_goal(goal: Goal) -> str:
+    """Goal text with hypotheses renamed by position and whitespace normalized (case tag is already dropped by parse_goals)
+
+    Positions become ⟪i⟫, which no Lean identifier (or inner product ⟪x, y⟫) can spell, so a
+    bound variable or lemma that happens to be called h0 can't collide with a renamed hypothesis.
+    """
+    names: Dict[str, str] = {}
+    lines = []
+    for i, decl in enumerate(goal.assumptions):
+        # a hypothesis type can only mention earlier hypotheses, shadowing included
+        lean_type = _SPACE_REGEX.sub(" ", _rename(decl.lean_type, names))
+        names[decl.ident] = f"⟪{i}⟫"
+        lines.append(f"⟪{i}⟫ : {lean_type}")
+    conclusion = _SPACE_REGEX.sub(" ", _rename(goal.conclusion, names))
+    lines.append(f"⊢ {conclusion}")
+    return "\n".join(lines)
+
+
+def _digest(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+def state_key(state: TacticState) -> StateKey:
+    """Key that is equal for states differing only in goal order, hypothesis names or case tags"""
+    goals = sorted(canonical_goal(goal) for goal in state.goals)
+    return StateKey(
+        digest = _digest("\n\n".join(goals)),
+        goals = frozenset(_digest(goal) for goal in goals),
+    )
+
+
+class TranspositionTable:
+    """Canonical states seen during one search, with their shallowest depth and known failures"""
+
+    def __init__(self):
+        self.best_depth: Dict[bytes, int] = {}
+        self.failed: List[FrozenSet[bytes]] = []
+        self.failed_by_goal: Dict[bytes, List[int]] = {} # goal -> failed sets containing it
+        self.hits = 0
+        self.pruned = 0
+
+    def seen(self, key: StateKey, depth: int) -> bool:
+        """Whether this state was already reached at the same or a shallower depth"""
+        best = self.best_depth.get(key.digest)
+        if best is not None and best <= depth:
+            self.hits += 1
+            return True
+        return False
+
+    def record(self, key: StateKey, depth: int):
+        """Remember this state at depth, keeping the shallowest"""
+        best = self.best_depth.get(key.digest)
+        if best is None or depth < best:
+            self.best_depth[key.digest] = depth
+
+    def mark_failed(self, key: StateKey):
+        """Record a state whose expansion led nowhere"""
+        index = len(self.failed)
+        self.failed.append(key.goals)
+        for goal in key.goals:
+            self.failed_by_goal.setdefault(goal, []).append(index)
+
+    def is_subsumed(self, key: StateKey) -> bool:
+        """Whether this state's goals include every goal of some failed state"""
+        for goal in key.goals:
+            for index in self.failed_by_goal.get(goal, ()):
+                if self.failed[index] <= key.goals:
+                    self.pruned += 1
+                    return True
+        return False
+
+    def stats(self) -> Tuple[int, int, int]:
+        """(distinct states, transposition hits, subsumption prunes)"""
+        return len(self.best_depth), self.hits, self.pruned
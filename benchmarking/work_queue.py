@@ -0,0 +1,221 @@
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+
+def default_node_name() -> str:
+    """hostname-pid, so a restarted node doesn't renew leases on theorems it no longer runs"""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class WorkQueue:
+    """Theorems shared by several evaluation nodes through a SQLite lease table, with no broker
+
+    Any node can populate() the table (existing theorems are left alone, so restarts resume).
+    A worker leases one theorem at a time, preferring the file it was last on. Each node's
+    heartbeat renews the leases it holds; leases of a node that stops heartbeating expire
+    after lease_seconds and go to whoever asks next. complete() only counts for the node that
+    still holds the lease.
+
+    The database has to sit on a filesystem every node mounts with working file locks
+    (e.g. NFSv4). It uses the rollback journal, not WAL, since WAL needs memory shared
+    between processes on one host. Like TacticCache, each process opens its own connection,
+    so the queue pickles into workers; threads share it under a lock (one transaction at a
+    time per connection). It has FileScheduler's interface for Evaluator.work().
+    """
+
+    def __init__(self, path: Union[str, Path], node: Optional[str] = None, lease_seconds: float = 120.0,
+                 poll: float = 5.0):
+        self.path = str(path)
+        self.node = node or default_node_name()
+        self.lease_seconds = lease_seconds # renewed every lease_seconds / 3 while the node is alive
+        self.poll = poll # seconds between looks while only other nodes' leases are left
+        self.num_groups = 0
+        self._init_runtime()
+
+    def _init_runtime(self):
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid = None
+        self._lock = threading.Lock() # the heartbeat thread shares the connection
+        self._last_file: Dict[int, str] = {} # worker -> file of its last theorem
+
+    def __getstate__(self):
+        return {key: value for key, value in self.__dict__.items() if key not in ("_conn", "_pid", "_lock", "_last_file")}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_runtime()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=60, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=DELETE")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS theorems (name TEXT PRIMARY KEY, example TEXT NOT NULL, "
+                "file TEXT NOT NULL, state TEXT NOT NULL DEFAULT 'pending', node TEXT, "
+                "lease_until REAL NOT NULL DEFAULT 0, attempts INTEGER NOT NULL DEFAULT 0)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS theorems_state ON theorems (state)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS nodes (node TEXT PRIMARY KEY, heartbeat REAL NOT NULL, "
+                "done INTEGER NOT NULL DEFAULT 0, reclaimed INTEGER NOT NULL DEFAULT 0, "
+                "stopped INTEGER NOT NULL DEFAULT 0)"
+            )
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def _transaction(self, fn):
+        """Run fn(conn) holding the database write lock"""
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(conn)
+                conn.execute("COMMIT")
+                return result
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _query(self, sql: str, params: Tuple = ()) -> List[Tuple]:
+        with self._lock:
+            return self._connection().execute(sql, params).fetchall()
+
+    def populate(self, examples: List[Dict[str, str]]):
+        """Add theorems not in the table yet, grouped by file (largest files first) like FileScheduler"""
+        files: Dict[str, List[Dict[str, str]]] = {}
+        for ex in examples:
+            files.setdefault(f"{ex['url']}@{ex['commit']}:{ex['file_path']}", []).append(ex)
+        self.num_groups = len(files)
+        rows = [
+            (ex['full_name'], json.dumps(ex), file)
+            for file, group in sorted(files.items(), key=lambda item: len(item[1]), reverse=True)
+            for ex in group
+        ]
+        self._transaction(lambda conn: conn.executemany(
+            "INSERT OR IGNORE INTO theorems (name, example, file) VALUES (?, ?, ?)", rows))
+        self.heartbeat(rejoin=True)
+
+    def heartbeat(self, rejoin: bool = False):
+        """Renew this node's leases and mark it alive (rejoin: also undo an earlier stop())"""
+        now = time.time()
+
+        def renew(conn):
+            conn.execute("UPDATE theorems SET lease_until = ? WHERE node = ? AND state = 'leased'",
+                         (now + self.lease_seconds, self.node))
+            conn.execute("INSERT INTO nodes (node, heartbeat) VALUES (?, ?) "
+                         "ON CONFLICT (node) DO UPDATE SET heartbeat = excluded.heartbeat"
+                         + (", stopped = 0" if rejoin else ""), (self.node, now))
+        self._transaction(renew)
+
+    def start_heartbeat(self) -> threading.Event:
+        """Heartbeat from a background thread until the returned event is set"""
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(self.lease_seconds / 3):
+                try:
+                    self.heartbeat()
+                except sqlite3.Error as e: # keep trying, the lease outlives a few missed beats
+                    print(f"Work queue heartbeat failed: {e}")
+
+        threading.Thread(target=beat, name="work-queue-heartbeat", daemon=True).start()
+        return stop
+
+    def _claim(self, worker: int) -> Tuple[Optional[Dict[str, str]], bool]:
+        """(a newly leased theorem or None, whether it is worth waiting for live leases to expire)"""
+        now = time.time()
+
+        def claim(conn):
+            stopped = conn.execute("SELECT stopped FROM nodes WHERE node = ?", (self.node,)).fetchone()
+            if stopped and stopped[0]:
+                return None, False
+            row = conn.execute(
+                "SELECT name, example, file, state FROM theorems "
+                "WHERE state = 'pending' OR (state = 'leased' AND lease_until < ?) "
+                "ORDER BY file = ? DESC, rowid LIMIT 1",
+                (now, self._last_file.get(worker)),
+            ).fetchone()
+            if row is None:
+                out = conn.execute("SELECT COUNT(*) FROM theorems WHERE state = 'leased'").fetchone()[0]
+                return None, out > 0
+            name, example, file, state = row
+            conn.execute("UPDATE theorems SET state = 'leased', node = ?, lease_until = ?, attempts = attempts + 1 "
+                         "WHERE name = ?", (self.node, now + self.lease_seconds, name))
+            if state == "leased": # its node stopped heartbeating
+                conn.execute("UPDATE nodes SET reclaimed = reclaimed + 1 WHERE node = ?", (self.node,))
+            self._last_file[worker] = file
+            return json.loads(example), True
+        return self._transaction(claim)
+
+    def next(self, worker: int) -> Optional[Dict[str, str]]:
+        """The worker's next theorem, waiting while other nodes still hold leases that may expire"""
+        while True:
+            example, waiting = self._claim(worker)
+            if example is not None:
+                return example
+            if not waiting:
+                return None
+            time.sleep(self.poll)
+
+    def complete(self, name: str) -> bool:
+        """Mark a theorem done, if this node still holds its lease"""
+        def finish(conn):
+            done = conn.execute("UPDATE theorems SET state = 'done' WHERE name = ? AND node = ? AND state = 'leased'",
+                                (name, self.node)).rowcount
+            conn.execute("UPDATE nodes SET done = done + ? WHERE node = ?", (done, self.node))
+            return done > 0
+        return self._transaction(finish)
+
+    def requeue(self, example: Dict[str, str]):
+        """Hand a leased theorem back, with its updated example (e.g. a retry count)"""
+        self._transaction(lambda conn: conn.execute(
+            "UPDATE theorems SET state = 'pending', node = NULL, lease_until = 0, example = ? "
+            "WHERE name = ? AND node = ?", (json.dumps(example), example['full_name'], self.node)))
+
+    def stop(self):
+        """Lease nothing more on this node (its current leases expire if not completed)"""
+        self._transaction(lambda conn: conn.execute("UPDATE nodes SET stopped = 1 WHERE node = ?", (self.node,)))
+
+    def _stopped(self) -> bool:
+        rows = self._query("SELECT stopped FROM nodes WHERE node = ?", (self.node,))
+        return bool(rows and rows[0][0])
+
+    def steals(self) -> int:
+        """Expired leases this node took over from dead nodes"""
+        rows = self._query("SELECT reclaimed FROM nodes WHERE node = ?", (self.node,))
+        return rows[0][0] if rows else 0
+
+    def remaining(self) -> int:
+        return self._query("SELECT COUNT(*) FROM theorems WHERE state != 'done'")[0][0]
+
+    def status(self) -> Tuple[Dict[str, int], List[Tuple[str, float, int, int]]]:
+        """Theorem counts by state, and (node, seconds since heartbeat, done, reclaimed) per node"""
+        counts = dict(self._query("SELECT state, COUNT(*) FROM theorems GROUP BY state"))
+        now = time.time()
+        nodes = [(node, now - heartbeat, done, reclaimed) for node, heartbeat, done, reclaimed in
+                 self._query("SELECT node, heartbeat, done, reclaimed FROM nodes ORDER BY node")]
+        return counts, nodes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Progress of a distributed evaluation's work queue")
+    parser.add_argument("path", help="work queue database (EvaluationConfig.work_queue)")
+    args = parser.parse_args()
+
+    counts, nodes = WorkQueue(args.path, node="status").status()
+    print(", ".join(f"{state}: {n}" for state, n in sorted(counts.items())) or "empty")
+    for node, age, done, reclaimed in nodes:
+        print(f"{node}: {done} done, {reclaimed} reclaimed, last heartbeat {age:.0f}s ago")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+from types import SimpleNamespace
+
+from lean_dojo import LeanError, ProofGivenUp, TacticState
+
+from benchmarking.response_cache import ResponseCache
+from benchmarking.tactic_cache import TacticCache, cache_scope
+
+
+STATE = "n : Nat\n⊢ n + 0 = n"
+
+
+def theorem(commit="c1", file_path="A.lean"):
+    return SimpleNamespace(repo=SimpleNamespace(commit=commit), file_path=file_path)
+
+
+def test_tactic_cache_hit_after_reopen(tmp_path):
+    scope = cache_scope(theorem())
+    cache = TacticCache(tmp_path / "tactics.db")
+    cache.put(scope, STATE, "ring", LeanError("ring failed"))
+    cache.put(scope, STATE, "sorry", ProofGivenUp())
+
+    reopened = TacticCache(tmp_path / "tactics.db")
+    assert reopened.lookup(scope, STATE, "ring") == LeanError("ring failed")
+    assert isinstance(reopened.lookup(scope, "n  :  Nat\n⊢ n + 0 = n", " sorry "), ProofGivenUp)
+    assert reopened.lookup(scope, STATE, "simp") is None
+
+
+def test_tactic_cache_scoped_to_commit_and_file(tmp_path):
+    cache = TacticCache(tmp_path / "tactics.db")
+    cache.put(cache_scope(theorem()), STATE, "ring", LeanError("ring failed"))
+    assert cache.lookup(cache_scope(theorem(file_path="B.lean")), STATE, "ring") is None
+    assert cache.lookup(cache_scope(theorem(commit="c2")), STATE, "ring") is None
+    assert cache.lookup(cache_scope(theorem()), STATE, "ring") is not None
+
+
+def test_tactic_cache_new_states_go_to_lean(tmp_path):
+    scope = cache_scope(theorem())
+    cache = TacticCache(tmp_path / "tactics.db")
+    cache.put(scope, STATE, "induction n", TacticState("case zero\n⊢ 0 + 0 = 0", 1))
+    assert cache.get(scope, STATE, "induction n") == ("state", "case zero\n⊢ 0 + 0 = 0")
+    assert cache.lookup(scope, STATE, "induction n") is None
+
+
+def test_tactic_cache_lru_evicts_least_recent(tmp_path):
+    scope = cache_scope(theorem())
+    cache = TacticCache(tmp_path / "tactics.db", lru_size=2)
+    for tactic in ["a", "b"]:
+        cache.put(scope, STATE, tactic, LeanError(tactic))
+    assert cache.get(scope, STATE, "a") is not None # a is now more recent than b
+    cache.put(scope, STATE, "c", LeanError("c"))
+    assert len(cache._lru) == 2
+    assert cache._lru.keys() == {cache._key(scope, STATE, "a"), cache._key(scope, STATE, "c")}
+    assert cache.lookup(scope, STATE, "b") == LeanError("b") # evicted from memory, still on disk
+
+
+def test_response_cache_hit_after_reopen(tmp_path):
+    cache = ResponseCache(tmp_path / "responses.db")
+    key = cache.key("fireworks", "m", 0.7, "prompt", 0)
+    cache.put(key, ("simp", -0.25))
+
+    reopened = ResponseCache(tmp_path / "responses.db", mode="replay")
+    assert reopened.get(key) == ("simp", -0.25)
+    assert reopened.get(cache.key("fireworks", "m", 0.7, "prompt", 1)) is None
+    assert reopened.get(cache.key("fireworks", "m", 1.0, "prompt", 0)) is None
+
+
+def test_response_cache_respects_size_cap(tmp_path):
+    max_bytes = 2000
+    cache = ResponseCache(tmp_path / "responses.db", max_bytes=max_bytes)
+    keys = [cache.key("p", "m", 0.0, f"prompt {i}", 0) for i in range(300)]
+    for i, key in enumerate(keys):
+        cache.put(key, (f"tactic {i}", None))
+        if i >= 1:
+            assert cache.get(keys[0]) is not None # keep the first entry recently used
+        total = cache._connection().execute("SELECT SUM(size) FROM responses").fetchone()[0]
+        assert total <= max_bytes
+    assert cache.get(keys[1]) is None # least recently used went first
+    assert cache.get(keys[-1]) is not None
@@ -0,0 +1,53 @@
+import json
+
+import pytest
+
+from benchmarking.api_clients import FireworksClient
+from benchmarking.streaming import CompletionStream, complete_tactic
+
+
+RESPONSES = [
+    "Use the `rw` tactic:\n```lean\nrw [Nat.add_comm]\n```",
+    "```lean\nsimp\n```\nor maybe `omega`",
+    "`omega`",
+    "Try `simp` first, then `ring`.",
+    "```lean\nnorm_num\n```",
+    "The `linarith` tactic closes it:\n```lean\nlinarith [h]\n```\nAlternatively `nlinarith`.",
+    "```lean\nexact h\n",
+    "```python\nnot lean\n```\n`decide`",
+    "intro x",
+]
+
+
+def chunks(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def stream(text, size):
+    """Feed text to a CompletionStream in chunks of size characters, as SSE lines"""
+    completion = CompletionStream()
+    for delta in chunks(text, size):
+        line = "data: " + json.dumps({"choices": [{"index": 0, "delta": {"content": delta}}]})
+        if completion.feed(line):
+            break
+    else:
+        completion.feed("data: " + json.dumps({"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}))
+    return completion.body()["choices"][0]["message"]["content"]
+
+
+@pytest.mark.parametrize("response", RESPONSES)
+@pytest.mark.parametrize("size", [1, 3, 8, 1000])
+def test_streamed_extraction_matches_full(response, size):
+    client = FireworksClient("model", "key")
+    assert client.extract_tactic(stream(response, size)) == client.extract_tactic(response)
+
+
+def test_fence_beats_earlier_inline_span():
+    text = "Use the `rw` tactic:\n```lean\nrw [Nat.add_comm]\n```"
+    assert complete_tactic("Use the `rw` tactic:\n") is None
+    assert complete_tactic(text) == "rw [Nat.add_comm]"
+
+
+def test_cut_after_closed_fence():
+    text = "```lean\nsimp\n```" + " and some more explanation" * 20
+    assert len(stream(text, 4)) < len(text)
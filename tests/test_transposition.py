@@ -0,0 +1,29 @@
+from lean_dojo import TacticState
+
+from benchmarking.transposition import TranspositionTable, state_key
+
+
+def test_renamed_hypotheses_match():
+    a = TacticState("x y : Nat\nh : x = y\n⊢ y = x", 0)
+    b = TacticState("a b : Nat\nhab : a = b\n⊢ b = a", 1)
+    assert state_key(a) == state_key(b)
+
+
+def test_goal_order_ignored():
+    a = TacticState("case left\nn : Nat\n⊢ n = n\n\ncase right\n⊢ True", 0)
+    b = TacticState("⊢ True\n\nn : Nat\n⊢ n = n", 1)
+    assert state_key(a) == state_key(b)
+
+
+def test_binder_named_like_placeholder_does_not_collide():
+    # ∀ y, y = a  vs  ∀ y, y = y: with hypotheses renamed to h0, both read ∀ h0, h0 = h0
+    a = TacticState("a : Nat\n⊢ ∀ (h0 : Nat), h0 = a", 0)
+    b = TacticState("b : Nat\n⊢ ∀ (h0 : Nat), h0 = h0", 1)
+    assert state_key(a) != state_key(b)
+
+
+def test_failed_state_subsumes_superset():
+    table = TranspositionTable()
+    table.mark_failed(state_key(TacticState("n : Nat\n⊢ n = n + 0", 0)))
+    assert table.is_subsumed(state_key(TacticState("m : Nat\n⊢ m = m + 0\n\n⊢ True", 1)))
+    assert not table.is_subsumed(state_key(TacticState("⊢ True", 2)))
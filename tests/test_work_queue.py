@@ -0,0 +1,78 @@
+import threading
+
+from benchmarking.work_queue import WorkQueue
+
+
+def examples(files=4, per_file=25):
+    return [
+        {"url": "u", "commit": "c", "file_path": f"F{f}.lean", "full_name": f"t{f}_{i}"}
+        for f in range(files) for i in range(per_file)
+    ]
+
+
+def test_heartbeat_concurrent_with_claims(tmp_path):
+    queue = WorkQueue(tmp_path / "queue.db", node="a", poll=0.01)
+    queue.populate(examples())
+    stop = threading.Event()
+    errors = []
+
+    def beat():
+        while not stop.is_set():
+            try:
+                queue.heartbeat()
+            except Exception as e:
+                errors.append(e)
+
+    def work(worker):
+        try:
+            while (example := queue.next(worker)) is not None:
+                assert queue.complete(example["full_name"])
+        except Exception as e:
+            errors.append(e)
+
+    beater = threading.Thread(target=beat)
+    beater.start()
+    workers = [threading.Thread(target=work, args=(w,)) for w in range(4)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    stop.set()
+    beater.join()
+
+    assert errors == []
+    assert queue.remaining() == 0
+    counts, nodes = queue.status()
+    assert counts == {"done": 100}
+    assert nodes[0][2] == 100 # done by node a
+
+
+def test_populate_undoes_stop(tmp_path):
+    queue = WorkQueue(tmp_path / "queue.db", node="a", poll=0.01)
+    queue.populate(examples(1, 2))
+    queue.stop()
+    assert queue._stopped()
+    assert queue.next(0) is None # pending theorems stay pending
+    assert queue.remaining() == 2
+    queue.heartbeat()
+    assert queue._stopped() # only a restart rejoins
+
+    restarted = WorkQueue(tmp_path / "queue.db", node="a", poll=0.01)
+    restarted.populate(examples(1, 2))
+    assert not restarted._stopped()
+    assert restarted.next(0) is not None
+    assert restarted.next(1) is not None
+
+
+def test_expired_lease_is_reclaimed(tmp_path):
+    dead = WorkQueue(tmp_path / "queue.db", node="dead", lease_seconds=0.0)
+    dead.populate(examples(1, 1))
+    assert dead.next(0) is not None
+
+    alive = WorkQueue(tmp_path / "queue.db", node="alive")
+    alive.populate(examples(1, 1))
+    example = alive.next(0)
+    assert example is not None
+    assert not dead.complete(example["full_name"])
+    assert alive.complete(example["full_name"])
+    assert alive.steals() == 1